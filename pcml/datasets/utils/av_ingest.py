@@ -0,0 +1,325 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sharded, parallel ingestion of a manifest of MP4's into a raw video table.
+
+The manifest, e.g. as written by `manifest.run`, is split into
+`num_shards` contiguous shards which are ingested by a pool of workers.
+Each worker writes the frames and audio of one video while decoding the
+next and marks its shard "finished" once all of the shard's videos have
+been written. Re-running with the same manifest and `num_shards` skips
+shards already marked finished.
+
+"""
+
+import functools
+import multiprocessing
+import multiprocessing.pool
+
+from concurrent import futures
+
+import tensorflow as tf
+
+from pcml.utils import audio_utils
+from pcml.utils import cbt_utils
+from pcml.utils import video_utils
+
+
+def read_manifest(manifest_path):
+  """Read the non-empty lines of a manifest."""
+  with tf.gfile.Open(manifest_path, "r") as f:
+    return [line.strip() for line in f if line.strip()]
+
+
+def shard_paths(paths, num_shards):
+  """Split `paths` into `num_shards` contiguous, near equal shards.
+
+  The split only depends on `len(paths)` and `num_shards` so that the
+  (shard_id, video_id) of each path is stable across resumed runs.
+
+  """
+
+  if num_shards <= 0:
+    raise ValueError("Expected num_shards > 0, saw {}.".format(num_shards))
+
+  num_paths = len(paths)
+
+  return [
+      paths[i * num_paths // num_shards:(i + 1) * num_paths // num_shards]
+      for i in range(num_shards)
+  ]
+
+
+def decode_mp4(path,
+               downsample_size=(96, 96),
+               greyscale=False,
+               num_decode_workers=1,
+               single_pass=False):
+  """Decode the frames and audio of the MP4 at `path`.
+
+  Audio is streamed from ffmpeg by `audio_utils.read_mp4_audio`. When
+  `single_pass` frames and audio are instead demuxed from one read of the
+  file by `video_utils.demux_mp4`, and when `num_decode_workers` > 1
+  segments of the video are decoded in parallel by
+  `video_utils.decode_mp4_parallel`. Both resize frames other than with
+  PIL, so frames differ slightly from those of the default path.
+
+  """
+
+  if single_pass:
+    return video_utils.demux_mp4(path,
+                                 downsample_size=downsample_size,
+                                 greyscale=greyscale)
+
+  if num_decode_workers > 1:
+    video = video_utils.ArrayVideo.from_file(path,
+                                             num_workers=num_decode_workers,
+                                             downsample_size=downsample_size,
+                                             greyscale=greyscale)
+  else:
+    video = video_utils.ArrayVideo()
+    video.load_from_file(path,
+                         downsample_size=downsample_size,
+                         greyscale=greyscale)
+
+  audio = audio_utils.read_mp4_audio(path)
+
+  return video, audio
+
+
+def ingest_shard(selection_fn,
+                 shard_id,
+                 num_shards,
+                 paths,
+                 decode_fn=decode_mp4,
+                 write_kwargs=None):
+  """Ingest the videos at `paths` as shard `shard_id`.
+
+  The shard is marked "started" then, once every video has been written,
+  "finished". Decoding of each video overlaps with writing the previous.
+
+  Args:
+    selection_fn(callable): Returns the `cbt_utils.RawVideoSelection` to
+      which to write.
+    shard_id(int): The id of the shard.
+    num_shards(int): The total number of shards.
+    paths(list): The paths of the shard's videos, in video id order.
+    decode_fn(callable): Returns (frames, audio) given a path, where
+      frames is a `video_utils.ArrayVideo` or `video_utils.Video`.
+    write_kwargs(dict): Additional kwargs for `write_av`.
+
+  Returns:
+    int: The number of videos written.
+
+  """
+
+  write_kwargs = write_kwargs or {}
+
+  selection = selection_fn()
+
+  def _set_status(status):
+    selection.set_shard_meta(
+        cbt_utils.VideoShardMeta(num_videos=len(paths),
+                                 status=status,
+                                 shard_id=shard_id,
+                                 num_shards=num_shards))
+
+  _set_status("started")
+
+  with futures.ThreadPoolExecutor(max_workers=1) as decoder:
+
+    decoded = decoder.submit(decode_fn, paths[0]) if paths else None
+
+    for video_id, path in enumerate(paths):
+
+      frames, audio = decoded.result()
+
+      if video_id + 1 < len(paths):
+        decoded = decoder.submit(decode_fn, paths[video_id + 1])
+
+      selection.write_av(frames=frames,
+                         audio=audio,
+                         shard_id=shard_id,
+                         video_id=video_id,
+                         **write_kwargs)
+
+      tf.logging.info("Wrote video {} of shard {}: {}".format(
+          video_id, shard_id, path))
+
+  # Written after all videos' data and metadata so that a shard marked
+  # finished is complete.
+  _set_status("finished")
+
+  return len(paths)
+
+
+def _ingest_shard_task(task):
+  """Pool entry point, returning (shard_id, num_videos, error message)."""
+
+  shard_id = task["shard_id"]
+
+  try:
+    num_videos = ingest_shard(**task)
+  except Exception as e:  # pylint: disable=broad-except
+    tf.logging.error("Failed to ingest shard {}: {}".format(shard_id, e))
+    return shard_id, 0, "{}: {}".format(type(e).__name__, e)
+
+  return shard_id, num_videos, None
+
+
+def finished_shard_ids(selection, num_shards):
+  """The ids of the shards of `selection` whose status is "finished"."""
+
+  shard_meta = selection.lookup_shard_metadata(num_shards=num_shards,
+                                               ignore_unfinished=True)
+
+  return set(meta.shard_id for meta in shard_meta.values())
+
+
+def run(manifest_path,
+        selection_fn,
+        num_shards,
+        num_workers=None,
+        decode_fn=decode_mp4,
+        write_kwargs=None,
+        use_processes=True):
+  """Ingest the videos of a manifest, skipping already finished shards.
+
+  Args:
+    manifest_path(str): Path to a manifest of MP4 paths.
+    selection_fn(callable): Returns the `cbt_utils.RawVideoSelection` to
+      which to write; must be picklable when `use_processes`.
+    num_shards(int): The number of shards into which to split the manifest.
+    num_workers(int): The number of shards ingested concurrently, by
+      default one per CPU.
+    decode_fn(callable): See `ingest_shard`.
+    write_kwargs(dict): See `ingest_shard`.
+    use_processes(bool): Whether to ingest shards in processes rather
+      than threads. Pool processes cannot themselves start processes, so
+      this should be False when `decode_fn` decodes in parallel.
+
+  Returns:
+    dict: The ids of "finished", "skipped" and "failed" shards, the
+      latter mapped to their errors, and the number of videos written.
+
+  """
+
+  paths = read_manifest(manifest_path)
+  shards = shard_paths(paths, num_shards)
+
+  skipped = finished_shard_ids(selection_fn(), num_shards)
+  if skipped:
+    tf.logging.info("Skipping finished shards: {}".format(sorted(skipped)))
+
+  tasks = [{
+      "selection_fn": selection_fn,
+      "shard_id": shard_id,
+      "num_shards": num_shards,
+      "paths": shard,
+      "decode_fn": decode_fn,
+      "write_kwargs": write_kwargs
+  } for shard_id, shard in enumerate(shards) if shard_id not in skipped]
+
+  summary = {
+      "finished": [],
+      "skipped": sorted(skipped),
+      "failed": {},
+      "num_videos": 0
+  }
+
+  if not tasks:
+    return summary
+
+  num_workers = min(num_workers or multiprocessing.cpu_count(), len(tasks))
+  pool_cls = (multiprocessing.Pool
+              if use_processes else multiprocessing.pool.ThreadPool)
+
+  with pool_cls(num_workers) as pool:
+    for shard_id, num_videos, error in pool.imap_unordered(
+        _ingest_shard_task, tasks):
+      if error is not None:
+        summary["failed"][shard_id] = error
+        continue
+      summary["finished"].append(shard_id)
+      summary["num_videos"] += num_videos
+      tf.logging.info("Finished shard {} ({} of {} remaining shards).".format(
+          shard_id, len(summary["finished"]), len(tasks)))
+
+  summary["finished"].sort()
+
+  return summary
+
+
+def main(_):
+
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  for flag in ["manifest_path", "project", "instance", "table"]:
+    if getattr(FLAGS, flag) is None:
+      raise ValueError("Please provide --{}.".format(flag))
+
+  selection_fn = functools.partial(cbt_utils.RawVideoSelection,
+                                   project=FLAGS.project,
+                                   instance=FLAGS.instance,
+                                   table=FLAGS.table,
+                                   prefix=FLAGS.prefix)
+
+  decode_fn = functools.partial(decode_mp4,
+                                downsample_size=(FLAGS.downsample_size,
+                                                 FLAGS.downsample_size),
+                                num_decode_workers=FLAGS.decode_workers,
+                                single_pass=FLAGS.single_pass_decode)
+
+  summary = run(manifest_path=FLAGS.manifest_path,
+                selection_fn=selection_fn,
+                num_shards=FLAGS.num_shards,
+                num_workers=FLAGS.num_workers,
+                decode_fn=decode_fn,
+                use_processes=FLAGS.decode_workers <= 1,
+                write_kwargs={
+                    "frame_codec": FLAGS.frame_codec,
+                    "audio_codec": FLAGS.audio_codec
+                })
+
+  tf.logging.info("Ingestion summary: {}".format(summary))
+
+  if summary["failed"]:
+    raise ValueError("Failed to ingest shards: {}".format(summary["failed"]))
+
+
+if __name__ == "__main__":
+
+  flags = tf.flags
+  FLAGS = flags.FLAGS
+
+  flags.DEFINE_string('manifest_path', None,
+                      'Path to a manifest of MP4 paths, one per line.')
+  flags.DEFINE_string('project', None, 'The GCP project of the table.')
+  flags.DEFINE_string('instance', None, 'The Bigtable instance of the table.')
+  flags.DEFINE_string('table', None, 'The raw video table to write to.')
+  flags.DEFINE_string('prefix', 'train', 'The table prefix, e.g. train.')
+  flags.DEFINE_integer('num_shards', 10, 'The number of shards.')
+  flags.DEFINE_integer('num_workers', None,
+                       'The number of worker processes, one per CPU if unset.')
+  flags.DEFINE_integer('downsample_size', 96, 'The size of ingested frames.')
+  flags.DEFINE_string('audio_codec', 'raw', 'The codec of audio cells.')
+  flags.DEFINE_string('frame_codec', 'raw', 'The codec of frame cells.')
+  flags.DEFINE_integer(
+      'decode_workers', 1,
+      'The number of processes decoding each video; when > 1 shards are '
+      'ingested by threads rather than processes.')
+  flags.DEFINE_bool(
+      'single_pass_decode', False,
+      'Whether to demux frames and audio with one ffmpeg read of each video.')
+
+  tf.logging.set_verbosity(tf.logging.INFO)
+  tf.app.run()
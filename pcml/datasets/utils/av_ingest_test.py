@@ -0,0 +1,111 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of sharded AV ingestion."""
+
+import functools
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from pcml.datasets.utils import av_ingest
+from pcml.utils import cbt_test_utils
+from pcml.utils import cbt_utils
+from pcml.utils import video_utils
+
+_SHARED_TABLE = cbt_test_utils.FakeTable()
+
+
+class _SharedTableSelection(cbt_utils.RawVideoSelection):
+
+  def materialize(self, sa_key_path=None):
+    self.table = _SHARED_TABLE
+
+
+def _fake_decode(path, num_frames=5):
+  if "corrupt" in path:
+    raise ValueError("Can't decode {}.".format(path))
+  video = video_utils.Video()
+  for _ in range(num_frames):
+    video.insert(np.zeros((4, 4, 3), dtype=np.uint8))
+  return video, np.zeros((2500,), dtype=np.uint8)
+
+
+class TestAVIngest(tf.test.TestCase):
+
+  def test_shard_paths(self):
+
+    shards = av_ingest.shard_paths(list(range(7)), num_shards=3)
+    self.assertEqual(shards, [[0, 1], [2, 3], [4, 5, 6]])
+
+    shards = av_ingest.shard_paths(list(range(2)), num_shards=3)
+    self.assertEqual([len(shard) for shard in shards], [0, 1, 1])
+
+  def test_import_defines_no_flags(self):
+    # Flags such as --project are defined by the processes importing this.
+    for flag in ["manifest_path", "project", "num_workers"]:
+      self.assertFalse(flag in tf.flags.FLAGS)
+
+  def test_run_and_resume(self):
+
+    _SHARED_TABLE.rows.clear()
+
+    manifest_path = os.path.join(tempfile.mkdtemp(), "manifest.txt")
+    paths = ["gs://bucket/{}.mp4".format(i) for i in range(6)]
+    paths.append("gs://bucket/corrupt.mp4")
+    with open(manifest_path, "w") as f:
+      f.write("\n".join(paths) + "\n")
+
+    selection_fn = functools.partial(_SharedTableSelection,
+                                     project="fake",
+                                     instance="fake",
+                                     table="fake",
+                                     prefix="train")
+
+    run = functools.partial(av_ingest.run,
+                            manifest_path=manifest_path,
+                            selection_fn=selection_fn,
+                            num_shards=3,
+                            num_workers=2,
+                            use_processes=False)
+
+    summary = run(decode_fn=_fake_decode)
+    self.assertEqual(summary["finished"], [0, 1])
+    self.assertEqual(list(summary["failed"].keys()), [2])
+    self.assertEqual(summary["num_videos"], 4)
+
+    selection = selection_fn()
+    self.assertEqual(av_ingest.finished_shard_ids(selection, 3), set([0, 1]))
+
+    # Resuming only re-ingests the unfinished shard.
+    with open(manifest_path, "w") as f:
+      f.write("\n".join(paths[:-1] + ["gs://bucket/6.mp4"]) + "\n")
+    summary = run(decode_fn=_fake_decode)
+    self.assertEqual(summary["skipped"], [0, 1])
+    self.assertEqual(summary["finished"], [2])
+    self.assertEqual(summary["num_videos"], 3)
+
+    index = selection.build_video_meta_index(num_shards=3)
+    self.assertEqual(len(index), 7)
+    self.assertEqual(sorted(index.records["shard_id"].tolist()),
+                     [0, 0, 1, 1, 2, 2, 2])
+    self.assertEqual(set(index.records["video_length"].tolist()), set([5]))
+
+    summary = run(decode_fn=_fake_decode)
+    self.assertEqual(summary["skipped"], [0, 1, 2])
+    self.assertEqual(summary["num_videos"], 0)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -30,6 +30,14 @@ tfe.enable_eager_execution()
 Modes = tf.estimator.ModeKeys  # pylint: disable=invalid-name
 
 from pcml.utils.cmd_utils import run_and_output
+from pcml.utils import read_policy_utils
+
+# Transient CBT errors, surfaced either directly or by the dataset
+# iterator, after which an eval step is skipped rather than failing eval.
+_TRANSIENT_EVAL_ERRORS = (tf.errors.DeadlineExceededError,
+                          tf.errors.UnavailableError,
+                          tf.errors.AbortedError) + \
+    read_policy_utils.RETRYABLE_ERRORS
 
 # ==============
 # HACK: In order to be able to access CBT.
@@ -229,15 +237,11 @@ def compute_metrics(problem_name,
           msg = "Finished collecting predictions for eval step {}.".format(i)
           tf.logging.info(msg)
 
-      except Exception as e:
-        # Seeing rare CBT deadline exceeded errors and don't know how to modfiy
-        # the deadline... More likely to run into error with more iterations,
-        # wasn't seeing it with 10 and almost always seeing it with 100.
-        # Could conceivably have to do with running out of examples in the eval
-        # set... but there should be over 20k and this would only go through
-        # 3200.
-        msg = "HACK: Squashing inference error."
-        tf.logging.info(msg)
+      except _TRANSIENT_EVAL_ERRORS as e:
+        # Seeing rare CBT deadline exceeded errors; skip the step rather
+        # than failing eval but let any other error propagate.
+        msg = "Skipping eval step {} after transient error: {}".format(i, e)
+        tf.logging.warning(msg)
 
   metrics_set = []
 
@@ -316,15 +320,11 @@ def compute_metrics_v2(problem_name,
           msg = "Finished collecting predictions for eval step {}.".format(i)
           tf.logging.info(msg)
 
-      except:
-        # Seeing rare CBT deadline exceeded errors and don't know how to modfiy
-        # the deadline... More likely to run into error with more iterations,
-        # wasn't seeing it with 10 and almost always seeing it with 100.
-        # Could conceivably have to do with running out of examples in the eval
-        # set... but there should be over 20k and this would only go through
-        # 3200.
-        msg = "HACK: Squashing inference error."
-        tf.logging.info(msg)
+      except _TRANSIENT_EVAL_ERRORS as e:
+        # Seeing rare CBT deadline exceeded errors; skip the step rather
+        # than failing eval but let any other error propagate.
+        msg = "Skipping eval step {} after transient error: {}".format(i, e)
+        tf.logging.warning(msg)
 
   for key, value in metrics.items():
     metrics[key] = value / eval_steps
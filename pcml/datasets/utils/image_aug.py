@@ -11,6 +11,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
+
 import tensorflow as tf
 
 
@@ -74,6 +76,146 @@ def preprocess_image(image,
   return image
 
 
+def preprocess_images(images,
+                      mode,
+                      resize_size=None,
+                      normalize=True,
+                      image_statistics=None,
+                      crop_area_min=0.50,
+                      contrast_lower=0.2,
+                      contrast_upper=0.6,
+                      brightness_delta_min=-0.2,
+                      brightness_delta_max=0.2):
+  """A batched `preprocess_image` of [batch, height, width, 3] `images`.
+
+  Intended to be mapped over a dataset after it is batched. Each example
+  is cropped and resized by one `tf.image.crop_and_resize` of per-example
+  boxes, which in training are random crops of area fraction in
+  [`crop_area_min`, 1] and aspect ratio in [3/4, 4/3], mirrored to flip
+  half of the examples. Normalization and the per-example brightness and
+  contrast adjustments are then applied as one multiply-add.
+
+  Unlike `preprocess_image`, crops are resized bilinearly rather than
+  bicubically, and random crops always satisfy their constraints rather
+  than falling back to a center crop after one failed attempt.
+
+  """
+
+  if normalize and not image_statistics:
+    raise ValueError("If `normalize`, then `image_statistics` is required.")
+
+  resize_size = resize_size or [299, 299]
+  assert resize_size[0] == resize_size[1]
+  image_size = resize_size[0]
+
+  shape = tf.shape(images)
+  batch_size = shape[0]
+  height = tf.cast(shape[1], tf.float32)
+  width = tf.cast(shape[2], tf.float32)
+
+  if mode == tf.estimator.ModeKeys.TRAIN:
+    boxes = _random_crop_boxes(batch_size, height, width, crop_area_min)
+    flips = tf.less(tf.random.uniform([batch_size]), 0.5)
+    boxes = _flip_boxes(boxes, flips)
+  else:
+    boxes = _center_crop_boxes(batch_size, height, width, image_size,
+                               image_size + 32)
+
+  # Crops are float32 whatever the dtype of `images`, so only crops are cast.
+  images = tf.image.crop_and_resize(images, boxes, tf.range(batch_size),
+                                    [image_size, image_size])
+
+  if normalize:
+    # As `_normalize` after division by 255.
+    scale = [1.0 / (255.0 * sd) for sd in image_statistics["sd"]]
+    offset = [
+        -mean / sd
+        for mean, sd in zip(image_statistics["mean"], image_statistics["sd"])
+    ]
+  else:
+    scale, offset = 1.0, 0.0
+
+  if mode == tf.estimator.ModeKeys.TRAIN:
+    brightness_deltas = tf.random.uniform([batch_size],
+                                          minval=brightness_delta_min,
+                                          maxval=brightness_delta_max)
+    contrast_factors = tf.random.uniform([batch_size],
+                                         minval=contrast_lower,
+                                         maxval=contrast_upper)
+    images = _adjust_batch(images, scale, offset, brightness_deltas,
+                           contrast_factors)
+  elif normalize:
+    images = (images * tf.constant(scale, shape=[1, 1, 1, 3]) +
+              tf.constant(offset, shape=[1, 1, 1, 3]))
+
+  images.set_shape([None, image_size, image_size, 3])
+  return images
+
+
+def _random_crop_boxes(batch_size,
+                       height,
+                       width,
+                       area_min,
+                       aspect_ratio_range=(3. / 4, 4. / 3.)):
+  """Random [ymin, xmin, ymax, xmax] crop boxes, one per example."""
+
+  area = tf.random.uniform([batch_size], minval=area_min,
+                           maxval=1.0) * height * width
+  log_ratio = tf.random.uniform([batch_size],
+                                minval=math.log(aspect_ratio_range[0]),
+                                maxval=math.log(aspect_ratio_range[1]))
+  ratio = tf.exp(log_ratio)
+
+  crop_height = tf.minimum(tf.sqrt(area / ratio), height) / height
+  crop_width = tf.minimum(tf.sqrt(area * ratio), width) / width
+
+  ymin = tf.random.uniform([batch_size]) * (1.0 - crop_height)
+  xmin = tf.random.uniform([batch_size]) * (1.0 - crop_width)
+
+  return tf.stack([ymin, xmin, ymin + crop_height, xmin + crop_width], axis=1)
+
+
+def _flip_boxes(boxes, flips):
+  """Mirror `boxes` where `flips`, so that their crops are flipped."""
+  ymin, xmin, ymax, xmax = tf.unstack(boxes, axis=1)
+  return tf.stack(
+      [ymin,
+       tf.where(flips, xmax, xmin), ymax,
+       tf.where(flips, xmin, xmax)],
+      axis=1)
+
+
+def _center_crop_boxes(batch_size, height, width, size, scale_size):
+  """Boxes of `_center_crop` of `size` after `_do_scale` to `scale_size`."""
+  scale = scale_size / tf.minimum(height, width)
+  crop_height = size / (scale * height)
+  crop_width = size / (scale * width)
+  ymin = (1.0 - crop_height) / 2
+  xmin = (1.0 - crop_width) / 2
+  box = tf.stack([ymin, xmin, ymin + crop_height, xmin + crop_width])
+  return tf.tile(tf.expand_dims(box, 0), [batch_size, 1])
+
+
+def _adjust_batch(images, scale, offset, brightness_deltas, contrast_factors):
+  """Fused per-channel affine, `adjust_brightness` and `adjust_contrast`.
+
+  Equivalent to `images * scale + offset`, plus each example's brightness
+  delta, with each example's contrast then adjusted by its factor.
+
+  """
+
+  scale = tf.constant(scale, dtype=tf.float32, shape=[1, 1, 1, 3])
+  offset = tf.constant(offset, dtype=tf.float32, shape=[1, 1, 1, 3])
+  deltas = tf.reshape(brightness_deltas, [-1, 1, 1, 1])
+  factors = tf.reshape(contrast_factors, [-1, 1, 1, 1])
+
+  # The per-channel means of each adjusted image before contrast.
+  means = tf.reduce_mean(images, axis=[1, 2], keepdims=True) * scale
+
+  return images * (factors * scale) + (offset + deltas +
+                                       (1.0 - factors) * means)
+
+
 # The following preprocessing functions were taken from
 # cloud_tpu/models/resnet/resnet_preprocessing.py
 # ==============================================================================
@@ -0,0 +1,169 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of image preprocessing."""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from pcml.datasets.utils import image_aug
+
+_STATISTICS = {"mean": [0.485, 0.456, 0.406], "sd": [0.229, 0.224, 0.225]}
+
+
+def _gradient_images(batch_size=4, height=72, width=96):
+  """Smooth uint8 gradients, differing per example."""
+  y = np.arange(height)[None, :, None, None]
+  x = np.arange(width)[None, None, :, None]
+  c = np.arange(3)[None, None, None, :]
+  b = np.arange(batch_size)[:, None, None, None]
+  return (y + x + 20 * c + 10 * b).astype(np.uint8)
+
+
+class TestImageAug(tf.test.TestCase):
+
+  def test_adjust_batch(self):
+
+    images = tf.constant(np.random.uniform(0, 255, (3, 8, 8, 3)),
+                         dtype=tf.float32)
+    deltas = tf.constant([-0.1, 0.0, 0.2])
+    factors = tf.constant([0.2, 1.0, 0.6])
+
+    fused = image_aug._adjust_batch(images, [0.1, 0.2, 0.3], [-1.0, 0.0, 1.0],
+                                    deltas, factors)
+
+    expected = []
+    for i in range(3):
+      image = images[i] * tf.constant([0.1, 0.2, 0.3]) + tf.constant(
+          [-1.0, 0.0, 1.0])
+      image = tf.image.adjust_brightness(image, delta=deltas[i])
+      expected.append(tf.image.adjust_contrast(image, factors[i]))
+
+    with self.test_session() as sess:
+      fused, expected = sess.run([fused, tf.stack(expected)])
+
+    self.assertAllClose(fused, expected, atol=1e-4)
+
+  def test_flip_boxes(self):
+
+    images = tf.constant(_gradient_images(2), dtype=tf.float32)
+    boxes = tf.constant([[0.1, 0.2, 0.9, 0.7]] * 2)
+
+    crops = tf.image.crop_and_resize(images, boxes, tf.range(2), [16, 16])
+    flipped = tf.image.crop_and_resize(
+        images, image_aug._flip_boxes(boxes, tf.constant([True, False])),
+        tf.range(2), [16, 16])
+
+    with self.test_session() as sess:
+      crops, flipped = sess.run([crops, flipped])
+
+    self.assertAllClose(flipped[0], crops[0, :, ::-1])
+    self.assertAllClose(flipped[1], crops[1])
+
+  def test_train_crops_each_example(self):
+
+    # Each example is constant, so any crop of it is the same constant.
+    values = np.array([10, 50, 90, 200], dtype=np.uint8)
+    images = np.ones(
+        (4, 40, 60, 3), dtype=np.uint8) * values[:, None, None, None]
+
+    processed = image_aug.preprocess_images(images,
+                                            tf.estimator.ModeKeys.TRAIN,
+                                            resize_size=[32, 32],
+                                            normalize=False,
+                                            contrast_lower=0.2,
+                                            contrast_upper=0.6,
+                                            brightness_delta_min=0.0,
+                                            brightness_delta_max=1e-6)
+
+    self.assertEqual(processed.shape.as_list()[1:], [32, 32, 3])
+
+    with self.test_session() as sess:
+      processed = sess.run(processed)
+
+    self.assertEqual(processed.shape, (4, 32, 32, 3))
+    self.assertAllClose(processed,
+                        np.ones_like(processed) * values[:, None, None, None],
+                        atol=1e-3)
+
+  def test_eval_matches_preprocess_image(self):
+
+    images = _gradient_images()
+
+    batched = image_aug.preprocess_images(images,
+                                          tf.estimator.ModeKeys.EVAL,
+                                          resize_size=[32, 32],
+                                          image_statistics=_STATISTICS)
+    single = tf.stack([
+        image_aug.preprocess_image(tf.constant(image),
+                                   tf.estimator.ModeKeys.EVAL,
+                                   resize_size=[32, 32],
+                                   image_statistics=_STATISTICS)
+        for image in images
+    ])
+
+    with self.test_session() as sess:
+      batched, single = sess.run([batched, single])
+
+    # Crops differ only by the resampling, bilinear rather than bicubic.
+    self.assertEqual(batched.shape, single.shape)
+    self.assertTrue(np.mean(np.abs(batched - single)) < 0.05)
+
+
+class ImageAugBenchmark(tf.test.Benchmark):
+
+  def benchmark_preprocess_images(self,
+                                  batch_size=32,
+                                  num_batches=20,
+                                  image_shape=(256, 320, 3)):
+    """Compare images/sec of per-example and batched preprocessing."""
+
+    image = tf.constant(np.random.randint(0, 256, image_shape, dtype=np.uint8))
+    images = tf.data.Dataset.from_tensors(image).repeat()
+
+    datasets = {
+        "per_example":
+            images.map(lambda x: image_aug.preprocess_image(
+                x,
+                tf.estimator.ModeKeys.TRAIN,
+                resize_size=[224, 224],
+                image_statistics=_STATISTICS)).batch(batch_size),
+        "batched":
+            images.batch(batch_size).map(lambda x: image_aug.preprocess_images(
+                x,
+                tf.estimator.ModeKeys.TRAIN,
+                resize_size=[224, 224],
+                image_statistics=_STATISTICS))
+    }
+
+    for name, dataset in datasets.items():
+
+      next_batch = dataset.make_one_shot_iterator().get_next()
+
+      with tf.Session() as sess:
+        sess.run(next_batch)
+        start = time.time()
+        for _ in range(num_batches):
+          sess.run(next_batch)
+        secs = time.time() - start
+
+      self.report_benchmark(
+          name="preprocess_images_{}".format(name),
+          iters=num_batches,
+          wall_time=secs / num_batches,
+          extras={"images_per_sec": batch_size * num_batches / secs})
+
+
+if __name__ == "__main__":
+  tf.test.main()
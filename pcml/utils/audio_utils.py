@@ -49,3 +49,84 @@ def mp4_to_1d_array(mp4_path, audio_bitrate=44100):
   audio_data = audio_data / np.iinfo(np.int16).max
   audio_data = audio_data.astype(np.float32)
   return audio_data
+
+
+def read_pcm16(stream, num_channels=1, chunk_samples=65536):
+  """Read signed 16-bit PCM from `stream` until EOF as float32.
+
+  Samples are read directly into a growing int16 buffer, without
+  intermediate byte strings, then scaled as by `mp4_to_1d_array`.
+
+  Args:
+    stream: A binary file-like object supporting `readinto`, e.g. the
+      stdout of an ffmpeg process.
+    num_channels(int): The number of interleaved channels.
+    chunk_samples(int): The initial buffer size, in samples.
+
+  Returns:
+    np.ndarray: float32 samples, of shape (N,) if mono else (N,
+      num_channels).
+
+  """
+
+  buffer = np.empty((chunk_samples,), dtype=np.int16)
+  view = memoryview(buffer).cast("B")
+  num_bytes = 0
+
+  while True:
+    if num_bytes == len(view):
+      grown = np.empty((2 * len(buffer),), dtype=np.int16)
+      grown[:len(buffer)] = buffer
+      buffer = grown
+      view = memoryview(buffer).cast("B")
+    num_read = stream.readinto(view[num_bytes:])
+    if not num_read:
+      break
+    num_bytes += num_read
+
+  frame_bytes = 2 * num_channels
+  if num_bytes % frame_bytes:
+    tf.logging.warning("Dropping a partial PCM frame of {} bytes.".format(
+        num_bytes % frame_bytes))
+    num_bytes -= num_bytes % frame_bytes
+
+  audio = buffer[:num_bytes // 2].astype(np.float32)
+  audio /= np.iinfo(np.int16).max
+
+  if num_channels > 1:
+    audio = audio.reshape((-1, num_channels))
+
+  return audio
+
+
+def pcm16_output_args(audio_bitrate=44100, num_channels=1):
+  """ffmpeg output options for raw signed 16-bit PCM."""
+  return [
+      "-ac",
+      str(num_channels), "-ar",
+      str(audio_bitrate), "-acodec", "pcm_s16le", "-f", "s16le"
+  ]
+
+
+def read_mp4_audio(mp4_path, audio_bitrate=44100, num_channels=1):
+  """Extract audio from an MP4 over a pipe, without a temporary WAV.
+
+  Like `mp4_to_1d_array` but ffmpeg streams raw PCM to its stdout, which
+  is read directly into a NumPy buffer. Audio is mixed to `num_channels`.
+
+  """
+
+  command = ["ffmpeg", "-loglevel", "quiet", "-i", mp4_path, "-vn"]
+  command += pcm16_output_args(audio_bitrate, num_channels) + ["pipe:1"]
+
+  proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+  try:
+    audio = read_pcm16(proc.stdout, num_channels=num_channels)
+  finally:
+    proc.stdout.close()
+    returncode = proc.wait()
+
+  if returncode != 0:
+    raise subprocess.CalledProcessError(returncode, command)
+
+  return audio
@@ -11,11 +11,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
 import tensorflow as tf
 
 from clarify.utils import audio_utils
 
 
+def write_synthetic_av_mp4(path, duration_secs=1):
+  """Write an MP4 with a test pattern and a 440Hz tone using ffmpeg."""
+  subprocess.check_output([
+      "ffmpeg", "-loglevel", "quiet", "-f", "lavfi", "-i",
+      "sine=frequency=440:duration={}".format(duration_secs), "-f", "lavfi",
+      "-i", "testsrc=size=64x48:rate=25:duration={}".format(duration_secs),
+      "-shortest", path
+  ])
+  return path
+
+
 class TestAudioUtils(tf.test.TestCase):
 
   def test_standardize_audio_array(self):
@@ -24,6 +42,34 @@ class TestAudioUtils(tf.test.TestCase):
   def test_mp4_to_1d_array(self):
     pass
 
+  def test_read_pcm16(self):
+
+    samples = np.random.randint(-32767, 32767, (1001, 2)).astype(np.int16)
+
+    # A small initial buffer is grown as samples are read.
+    audio = audio_utils.read_pcm16(io.BytesIO(samples.tobytes()),
+                                   num_channels=2,
+                                   chunk_samples=16)
+
+    self.assertEqual(audio.dtype, np.float32)
+    self.assertEqual(audio.shape, (1001, 2))
+    self.assertAllClose(audio, samples / 32767.0)
+
+    # Partial frames are dropped.
+    audio = audio_utils.read_pcm16(io.BytesIO(samples.tobytes()[:-3]))
+    self.assertEqual(audio.shape, (2000,))
+
+  def test_read_mp4_audio(self):
+
+    if shutil.which("ffmpeg") is None:
+      self.skipTest("Requires ffmpeg.")
+
+    path = write_synthetic_av_mp4(os.path.join(tempfile.mkdtemp(), "v.mp4"))
+
+    audio = audio_utils.read_mp4_audio(path)
+    self.assertEqual(audio.dtype, np.float32)
+    self.assertAllClose(audio, audio_utils.mp4_to_1d_array(path))
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -0,0 +1,425 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Augmentation of AV clips by a pool of worker processes.
+
+Clips are passed to and from workers through slots of shared memory
+rather than by pickling arrays: the parent copies a clip into a free
+input slot, a worker augments it with `augmentation_utils.augment_video`
+and `augment_audio` directly into the matching output slot, and the
+parent copies the result out and frees the slot. Only slot indices,
+shapes and seeds are pickled.
+
+Each clip is augmented under `np.random.seed` of a seed derived from the
+pool's seed and the clip's index, so results do not depend on the number
+of workers or on which worker augments which clip, and are returned in
+the order clips were submitted.
+
+"""
+
+import collections
+import multiprocessing
+import time
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from antidote.utils import augmentation_utils
+
+
+class SharedClipRing(object):
+  """Fixed size slots of video and audio in one block of shared memory.
+
+  Each of `num_slots` slots holds a video of up to `max_video_shape` and
+  audio of up to `max_audio_length` samples. Given no `name` a new block
+  is created, which its creator should `unlink` once done with, otherwise
+  the existing block `name` is attached.
+
+  """
+
+  def __init__(self,
+               num_slots,
+               max_video_shape,
+               max_audio_length,
+               video_dtype=np.uint8,
+               audio_dtype=np.float32,
+               name=None):
+
+    if num_slots < 1:
+      raise ValueError("Expected num_slots >= 1, saw {}.".format(num_slots))
+
+    self.num_slots = num_slots
+    self.max_video_shape = tuple(max_video_shape)
+    self.max_audio_length = max_audio_length
+    self.video_dtype = np.dtype(video_dtype)
+    self.audio_dtype = np.dtype(audio_dtype)
+
+    self._video_size = int(np.prod(self.max_video_shape))
+    video_bytes = self._video_size * self.video_dtype.itemsize
+    audio_bytes = self.max_audio_length * self.audio_dtype.itemsize
+    # Audio follows video in each slot, aligned to the audio itemsize.
+    self._audio_offset = ((video_bytes + self.audio_dtype.itemsize - 1) //
+                          self.audio_dtype.itemsize * self.audio_dtype.itemsize)
+    self._slot_bytes = self._audio_offset + audio_bytes
+
+    size = max(1, num_slots * self._slot_bytes)
+    if name is None:
+      self._shm = shared_memory.SharedMemory(create=True, size=size)
+    else:
+      self._shm = shared_memory.SharedMemory(name=name)
+
+  @property
+  def name(self):
+    return self._shm.name
+
+  def spec(self):
+    """The kwargs with which to attach this ring in another process."""
+    return {
+        "num_slots": self.num_slots,
+        "max_video_shape": self.max_video_shape,
+        "max_audio_length": self.max_audio_length,
+        "video_dtype": self.video_dtype.str,
+        "audio_dtype": self.audio_dtype.str,
+        "name": self.name
+    }
+
+  def _check_slot(self, slot):
+    if not 0 <= slot < self.num_slots:
+      raise ValueError("Expected 0 <= slot < {}, saw {}.".format(
+          self.num_slots, slot))
+
+  def video(self, slot, shape):
+    """A view of the video of `shape` in `slot`."""
+
+    self._check_slot(slot)
+    shape = tuple(shape)
+    size = int(np.prod(shape))
+    if size > self._video_size:
+      raise ValueError("Video of shape {} exceeds slots of shape {}.".format(
+          shape, self.max_video_shape))
+
+    return np.ndarray(shape,
+                      dtype=self.video_dtype,
+                      buffer=self._shm.buf,
+                      offset=slot * self._slot_bytes)
+
+  def audio(self, slot, length):
+    """A view of the `length` samples of audio in `slot`."""
+
+    self._check_slot(slot)
+    if length > self.max_audio_length:
+      raise ValueError("Audio of length {} exceeds slots of length {}.".format(
+          length, self.max_audio_length))
+
+    return np.ndarray((length,),
+                      dtype=self.audio_dtype,
+                      buffer=self._shm.buf,
+                      offset=slot * self._slot_bytes + self._audio_offset)
+
+  def close(self):
+    self._shm.close()
+
+  def unlink(self):
+    self._shm.unlink()
+
+
+def task_seed(seed, index):
+  """The `np.random.seed` under which clip `index` is augmented."""
+  return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+
+
+def augmented_video_shape(video_shape, video_kwargs=None):
+  """The shape `augment_video` produces given a video of `video_shape`."""
+
+  video_kwargs = video_kwargs or {}
+  video_shape = tuple(video_shape)
+
+  if video_kwargs.get("do_random_subsampling", True):
+    return (video_kwargs.get("subsample_length", 15),) + video_shape[1:]
+
+  return video_shape
+
+
+def augmented_audio_length(audio_length, audio_kwargs=None):
+  """The length `augment_audio` produces given `audio_length` samples."""
+
+  audio_kwargs = audio_kwargs or {}
+
+  if audio_kwargs.get("do_random_shift", True):
+    return audio_length - int(
+        audio_length * audio_kwargs.get("shift_reduction", 0.05))
+
+  return audio_length
+
+
+# The rings and augmentation kwargs of a worker process.
+_WORKER_STATE = {}
+
+
+def _init_worker(input_spec, output_spec, video_kwargs, audio_kwargs):
+  _WORKER_STATE["inputs"] = SharedClipRing(**input_spec)
+  _WORKER_STATE["outputs"] = SharedClipRing(**output_spec)
+  _WORKER_STATE["video_kwargs"] = video_kwargs
+  _WORKER_STATE["audio_kwargs"] = audio_kwargs
+
+
+def _augment_slot(task):
+  """Augment the clip in an input slot into the matching output slot."""
+
+  seed, slot, video_shape, audio_length = task
+
+  inputs = _WORKER_STATE["inputs"]
+  outputs = _WORKER_STATE["outputs"]
+  video_kwargs = _WORKER_STATE["video_kwargs"]
+  audio_kwargs = _WORKER_STATE["audio_kwargs"]
+
+  out_video_shape = augmented_video_shape(video_shape, video_kwargs)
+  out_audio_length = augmented_audio_length(audio_length, audio_kwargs)
+
+  np.random.seed(seed)
+
+  augmentation_utils.augment_video(inputs.video(slot, video_shape),
+                                   out=outputs.video(slot, out_video_shape),
+                                   **video_kwargs)
+  augmentation_utils.augment_audio(inputs.audio(slot, audio_length),
+                                   out=outputs.audio(slot, out_audio_length),
+                                   **audio_kwargs)
+
+  return out_video_shape, out_audio_length
+
+
+class AugmentationPoolStats(object):
+  """Records how long consumers of an `AugmentationPool` waited."""
+
+  def __init__(self):
+    self.num_clips = 0
+    self.total_wait_secs = 0.0
+    self.max_wait_secs = 0.0
+
+  def record_wait(self, wait_secs):
+    self.num_clips += 1
+    self.total_wait_secs += wait_secs
+    self.max_wait_secs = max(self.max_wait_secs, wait_secs)
+
+  @property
+  def mean_wait_secs(self):
+    if self.num_clips == 0:
+      return 0.0
+    return self.total_wait_secs / self.num_clips
+
+  def as_dict(self):
+    return {
+        "num_clips": self.num_clips,
+        "total_wait_secs": self.total_wait_secs,
+        "mean_wait_secs": self.mean_wait_secs,
+        "max_wait_secs": self.max_wait_secs
+    }
+
+
+class AugmentationPool(object):
+  """Augments (video, audio) clips in `num_workers` processes.
+
+  Up to `num_slots` clips, by default two per worker, are in flight at
+  once; `imap` blocks on the oldest before submitting more. Videos are
+  (num_frames, height, width, channels) arrays no larger than
+  `max_video_shape`, and are augmented into uint8, and audio is no
+  longer than `max_audio_length` samples.
+
+  Args:
+    max_video_shape(tuple): The largest video shape to be augmented.
+    max_audio_length(int): The greatest audio length to be augmented.
+    num_workers(int): The number of worker processes, one per CPU if
+      unset.
+    num_slots(int): The number of clips in flight.
+    seed(int): The base seed from which each clip's seed is derived.
+    video_dtype: The dtype of videos to be augmented.
+    audio_dtype: The dtype of audio to be augmented and of augmented
+      audio.
+    video_kwargs(dict): Kwargs for `augmentation_utils.augment_video`.
+    audio_kwargs(dict): Kwargs for `augmentation_utils.augment_audio`.
+    stats(AugmentationPoolStats): Optional object in which to record how
+      long the consumer waited on each clip.
+
+  """
+
+  def __init__(self,
+               max_video_shape,
+               max_audio_length,
+               num_workers=None,
+               num_slots=None,
+               seed=0,
+               video_dtype=np.uint8,
+               audio_dtype=np.float32,
+               video_kwargs=None,
+               audio_kwargs=None,
+               stats=None):
+
+    self.num_workers = num_workers or multiprocessing.cpu_count()
+    self.num_slots = num_slots or 2 * self.num_workers
+    self.seed = seed
+    self.video_kwargs = dict(video_kwargs or {})
+    self.audio_kwargs = dict(audio_kwargs or {})
+    self.stats = stats
+
+    if "out" in self.video_kwargs or "out" in self.audio_kwargs:
+      raise ValueError("Augmentation kwargs may not include out.")
+
+    max_audio_length = int(max_audio_length)
+    self.max_video_shape = tuple(max_video_shape)
+    self.max_audio_length = max_audio_length
+
+    self._inputs = SharedClipRing(self.num_slots,
+                                  self.max_video_shape,
+                                  max_audio_length,
+                                  video_dtype=video_dtype,
+                                  audio_dtype=audio_dtype)
+    self._outputs = SharedClipRing(
+        self.num_slots,
+        augmented_video_shape(self.max_video_shape, self.video_kwargs),
+        augmented_audio_length(max_audio_length, self.audio_kwargs),
+        video_dtype=np.uint8,
+        audio_dtype=audio_dtype)
+
+    self._pool = multiprocessing.Pool(self.num_workers,
+                                      initializer=_init_worker,
+                                      initargs=(self._inputs.spec(),
+                                                self._outputs.spec(),
+                                                self.video_kwargs,
+                                                self.audio_kwargs))
+
+    self._num_submitted = 0
+
+  def _submit(self, slot, video, audio):
+
+    if video.shape[1:] != self.max_video_shape[1:]:
+      raise ValueError("Expected videos of shape (t,) + {}, saw {}.".format(
+          self.max_video_shape[1:], video.shape))
+
+    np.copyto(self._inputs.video(slot, video.shape), video, casting="unsafe")
+    np.copyto(self._inputs.audio(slot, len(audio)), audio, casting="unsafe")
+
+    seed = task_seed(self.seed, self._num_submitted)
+    self._num_submitted += 1
+
+    return self._pool.apply_async(_augment_slot,
+                                  ((seed, slot, video.shape, len(audio)),))
+
+  def _collect(self, slot, result):
+
+    start = time.time()
+    video_shape, audio_length = result.get()
+    if self.stats is not None:
+      self.stats.record_wait(time.time() - start)
+
+    # Copied out as the slot is re-used by the next submitted clip.
+    return (np.array(self._outputs.video(slot, video_shape)),
+            np.array(self._outputs.audio(slot, audio_length)))
+
+  def imap(self, clips):
+    """Augment (video, audio) `clips`, yielding results in order.
+
+    Clips are indexed, for seeding, consecutively across calls.
+
+    """
+
+    free_slots = collections.deque(range(self.num_slots))
+    pending = collections.deque()
+
+    for video, audio in clips:
+
+      if not free_slots:
+        slot, result = pending.popleft()
+        yield self._collect(slot, result)
+        free_slots.append(slot)
+
+      slot = free_slots.popleft()
+      pending.append(
+          (slot, self._submit(slot, np.asarray(video), np.asarray(audio))))
+
+    while pending:
+      slot, result = pending.popleft()
+      yield self._collect(slot, result)
+
+  def close(self):
+    """Stop the workers and free the shared memory."""
+
+    self._pool.terminate()
+    self._pool.join()
+
+    for ring in [self._inputs, self._outputs]:
+      ring.close()
+      ring.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+def augment_example_sets(example_sets, pool, frame_shape=None):
+  """Augment the samples of AV correspondence example sets in `pool`.
+
+  Plugs in between `cbt_utils.RawVideoSelection.
+  sample_av_correspondence_examples` and the training input: the video
+  and audio of each `AVCorrespondenceSample` of each set are replaced
+  with their augmentations, videos remaining flattened to (num_frames,
+  frame_size). Sets are yielded in the order they are given, those
+  without samples unchanged.
+
+  Args:
+    example_sets(iterable): Dicts of `AVCorrespondenceSample`'s keyed by
+      example type.
+    pool(AugmentationPool): The pool in which to augment.
+    frame_shape(tuple): The (height, width, channels) of frames, by
+      default that of each sample's video source.
+
+  """
+
+  # The example sets whose samples are in flight, with those samples.
+  pending = collections.deque()
+
+  def _clips():
+    for example_set in example_sets:
+      samples = [example_set[key] for key in sorted(example_set)]
+      pending.append((example_set, samples))
+      for sample in samples:
+        shape = frame_shape or sample.meta["video_source"].frame_shape
+        if not shape:
+          raise ValueError("The frame shape of {} is unknown.".format(
+              sample.meta["video_source"]))
+        yield (sample.video.reshape((len(sample.video),) + tuple(shape)),
+               sample.audio)
+
+  num_augmented = 0
+
+  for video, audio in pool.imap(_clips()):
+
+    # Sets without samples are done once those before them are.
+    while not pending[0][1]:
+      yield pending.popleft()[0]
+
+    example_set, samples = pending[0]
+    sample = samples[num_augmented]
+    sample.video = video.reshape((len(video), -1))
+    sample.audio = audio
+    num_augmented += 1
+
+    if num_augmented == len(samples):
+      pending.popleft()
+      num_augmented = 0
+      yield example_set
+
+  # Any sets remaining after the last sample have none.
+  while pending:
+    yield pending.popleft()[0]
@@ -0,0 +1,258 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the multiprocess augmentation pool."""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from clarify.utils import augmentation_pool_utils
+from clarify.utils import augmentation_utils
+from clarify.utils import cbt_utils
+
+
+def _synthetic_clips(num_clips, shape=(20, 32, 32, 3), audio_length=1000):
+  rng = np.random.RandomState(0)
+  return [(rng.randint(0, 256, shape).astype(np.uint8),
+           rng.uniform(-0.25, 0.25, audio_length).astype(np.float32))
+          for _ in range(num_clips)]
+
+
+def _synthetic_example_sets(num_sets):
+  """Sets of a positive and a negative sample of 20 8x8 frames."""
+
+  clips = _synthetic_clips(2 * num_sets, shape=(20, 8, 8, 3), audio_length=200)
+  video_meta = cbt_utils.VideoMeta(video_length=20,
+                                   audio_length=200,
+                                   shard_id=0,
+                                   video_id=0,
+                                   frame_shape=(8, 8, 3))
+
+  example_sets = []
+  for i in range(num_sets):
+    example_set = {}
+    for key, (video, audio) in zip(["positive", "negative"],
+                                   clips[2 * i:2 * i + 2]):
+      example_set[key] = cbt_utils.AVCorrespondenceSample(
+          video=video.reshape((20, -1)),
+          audio=audio,
+          labels={
+              "same_video": 1,
+              "overlap": 1
+          },
+          meta={
+              "video_source": video_meta,
+              "audio_source": video_meta,
+              "video_sample_meta": None,
+              "audio_sample_meta": None,
+              "audio_keys": [],
+              "frame_keys": [],
+              "audio_block_meta": None
+          })
+    example_sets.append(example_set)
+
+  return example_sets
+
+
+class TestAugmentationPoolUtils(tf.test.TestCase):
+
+  def test_shared_clip_ring(self):
+
+    ring = augmentation_pool_utils.SharedClipRing(3, (4, 2, 2, 3), 10)
+    try:
+      attached = augmentation_pool_utils.SharedClipRing(**ring.spec())
+
+      ring.video(1, (2, 2, 2, 3))[:] = 7
+      ring.audio(1, 10)[:] = 0.5
+      self.assertAllEqual(attached.video(1, (2, 2, 2, 3)),
+                          np.full((2, 2, 2, 3), 7))
+      self.assertAllEqual(attached.audio(1, 10), np.full((10,), 0.5))
+      # Neighbouring slots are untouched.
+      self.assertAllEqual(attached.video(0, (4, 2, 2, 3)), np.zeros(
+          (4, 2, 2, 3)))
+      self.assertAllEqual(attached.video(2, (4, 2, 2, 3)), np.zeros(
+          (4, 2, 2, 3)))
+
+      with self.assertRaises(ValueError):
+        ring.video(0, (5, 2, 2, 3))
+      with self.assertRaises(ValueError):
+        ring.audio(3, 10)
+
+      attached.close()
+    finally:
+      ring.close()
+      ring.unlink()
+
+  def test_matches_serial_augmentation(self):
+
+    clips = _synthetic_clips(6)
+    audio_kwargs = {"data_range": [-0.25, 0.25]}
+
+    with augmentation_pool_utils.AugmentationPool(
+        (20, 32, 32, 3),
+        1000,
+        num_workers=2,
+        num_slots=3,
+        seed=1,
+        audio_kwargs=audio_kwargs) as pool:
+      augmented = list(pool.imap(clips))
+
+    self.assertEqual(len(augmented), len(clips))
+
+    for index, ((video, audio),
+                (augmented_video,
+                 augmented_audio)) in enumerate(zip(clips, augmented)):
+      np.random.seed(augmentation_pool_utils.task_seed(1, index))
+      expected_video = augmentation_utils.augment_video(video)
+      expected_audio = augmentation_utils.augment_audio(audio, **audio_kwargs)
+      self.assertEqual(augmented_video.dtype, np.uint8)
+      self.assertAllEqual(augmented_video, expected_video)
+      self.assertAllClose(augmented_audio, expected_audio)
+
+  def test_deterministic_across_num_workers(self):
+
+    clips = _synthetic_clips(5)
+    kwargs = {"audio_kwargs": {"do_add_gaussian_noise": False}, "seed": 3}
+
+    results = []
+    for num_workers, num_slots in [(1, 1), (3, 2), (2, 5)]:
+      with augmentation_pool_utils.AugmentationPool((20, 32, 32, 3),
+                                                    1000,
+                                                    num_workers=num_workers,
+                                                    num_slots=num_slots,
+                                                    **kwargs) as pool:
+        results.append(list(pool.imap(clips)))
+
+    for result in results[1:]:
+      for (video, audio), (expected_video,
+                           expected_audio) in zip(result, results[0]):
+        self.assertAllEqual(video, expected_video)
+        self.assertAllEqual(audio, expected_audio)
+
+    # Clips are indexed consecutively across calls to imap.
+    with augmentation_pool_utils.AugmentationPool((20, 32, 32, 3),
+                                                  1000,
+                                                  num_workers=2,
+                                                  **kwargs) as pool:
+      first = list(pool.imap(clips[:2]))
+      rest = list(pool.imap(clips[2:]))
+    for (video, _), (expected_video, _) in zip(first + rest, results[0]):
+      self.assertAllEqual(video, expected_video)
+
+  def test_augment_example_sets(self):
+
+    example_sets = _synthetic_example_sets(2)
+
+    kwargs = {
+        "video_kwargs": {
+            "subsample_length": 10
+        },
+        "audio_kwargs": {
+            "do_add_gaussian_noise": False
+        },
+        "seed": 5
+    }
+
+    with augmentation_pool_utils.AugmentationPool((20, 8, 8, 3),
+                                                  200,
+                                                  num_workers=2,
+                                                  **kwargs) as pool:
+      expected = list(
+          pool.imap((example_set[key].video.reshape((20, 8, 8, 3)),
+                     example_set[key].audio)
+                    for example_set in example_sets
+                    for key in sorted(example_set)))
+
+    with augmentation_pool_utils.AugmentationPool((20, 8, 8, 3),
+                                                  200,
+                                                  num_workers=2,
+                                                  **kwargs) as pool:
+      augmented = list(
+          augmentation_pool_utils.augment_example_sets(example_sets, pool))
+
+    self.assertEqual(len(augmented), 2)
+    index = 0
+    for example_set in augmented:
+      for key in sorted(example_set):
+        sample = example_set[key]
+        self.assertEqual(sample.video.shape, (10, 8 * 8 * 3))
+        self.assertEqual(sample.audio.shape, (190,))
+        self.assertAllEqual(sample.video, expected[index][0].reshape((10, -1)))
+        self.assertAllEqual(sample.audio, expected[index][1])
+        index += 1
+
+  def test_augment_empty_example_sets(self):
+
+    example_sets = _synthetic_example_sets(2)
+
+    with augmentation_pool_utils.AugmentationPool((20, 8, 8, 3),
+                                                  200,
+                                                  num_workers=2,
+                                                  seed=5) as pool:
+      self.assertEqual(
+          list(augmentation_pool_utils.augment_example_sets([{}, {}], pool)),
+          [{}, {}])
+      augmented = list(
+          augmentation_pool_utils.augment_example_sets(
+              [{}, example_sets[0], {}, {}, example_sets[1], {}], pool))
+
+    # Sets without samples keep their place in the order.
+    self.assertEqual([len(example_set) for example_set in augmented],
+                     [0, 2, 0, 0, 2, 0])
+    self.assertTrue(augmented[1] is example_sets[0])
+    self.assertTrue(augmented[4] is example_sets[1])
+
+
+class AugmentationPoolBenchmark(tf.test.Benchmark):
+
+  def benchmark_augmentation_pool(self, num_clips=64):
+    """Compare augmenting clips serially and in pools of workers."""
+
+    clips = _synthetic_clips(num_clips,
+                             shape=(20, 64, 64, 3),
+                             audio_length=16000)
+    audio_kwargs = {"do_add_gaussian_noise": False}
+
+    start = time.time()
+    for video, audio in clips:
+      augmentation_utils.augment_video(video)
+      augmentation_utils.augment_audio(audio, **audio_kwargs)
+    serial_secs = time.time() - start
+
+    for num_workers in [1, 2, 4]:
+
+      stats = augmentation_pool_utils.AugmentationPoolStats()
+      with augmentation_pool_utils.AugmentationPool((20, 64, 64, 3),
+                                                    16000,
+                                                    num_workers=num_workers,
+                                                    audio_kwargs=audio_kwargs,
+                                                    stats=stats) as pool:
+        start = time.time()
+        for _ in pool.imap(clips):
+          pass
+        pool_secs = time.time() - start
+
+      self.report_benchmark(
+          name="augmentation_pool_{}_workers".format(num_workers),
+          iters=num_clips,
+          wall_time=pool_secs / num_clips,
+          extras={
+              "serial_secs_per_clip": serial_secs / num_clips,
+              "pool_secs_per_clip": pool_secs / num_clips,
+              "mean_wait_secs": stats.mean_wait_secs
+          })
+
+
+if __name__ == "__main__":
+  tf.test.main()
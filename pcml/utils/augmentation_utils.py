@@ -22,12 +22,7 @@ from PIL import ImageEnhance
 from PIL import Image
 
 
-def random_temporal_subsample(video,
-                              length=15,
-                              max_frame_skips=1,
-                              frame_skip_probability=1):
-
-  t, x, y, c = video.shape
+def _random_temporal_subsample_indices(t, length=15, max_frame_skips=1):
 
   if t <= length + max_frame_skips:
     msg = "Can't subsample target length %s > source %s" % (length +
@@ -44,34 +39,92 @@ def random_temporal_subsample(video,
     skip = np.random.randint(0, len(indices))
     indices = np.delete(indices, skip)
 
+  return indices
+
+
+def random_temporal_subsample(video,
+                              length=15,
+                              max_frame_skips=1,
+                              frame_skip_probability=1):
+
+  indices = _random_temporal_subsample_indices(len(video),
+                                               length=length,
+                                               max_frame_skips=max_frame_skips)
+
   return video[indices]
 
 
-def random_xy_shift(video, max_xy_shift=5):
-  t, x, y, c = video.shape
+def _random_xy_shifts(max_xy_shift=5):
+  """Signed (x, y) shifts, positive where `random_xy_shift` pads before."""
   x_shift = np.random.randint(0, max_xy_shift)
   y_shift = np.random.randint(0, max_xy_shift)
-  pad = [[0, 0], [0, 0], [0, 0], [0, 0]]
-  pad[1][np.random.randint(0, 2)] = x_shift
-  pad[2][np.random.randint(0, 2)] = y_shift
+  x_sign = 1 if np.random.randint(0, 2) == 0 else -1
+  y_sign = 1 if np.random.randint(0, 2) == 0 else -1
+  return x_sign * x_shift, y_sign * y_shift
 
-  padded = np.pad(video, pad_width=pad, mode='constant', constant_values=0)
 
-  return padded[:, pad[1][1]:(x + pad[1][1]), pad[2][1]:(y + pad[2][1]), :]
+def _shift_slices(size, shift):
+  """The (destination, source) slices of an axis shifted by `shift`."""
+  if shift >= 0:
+    return slice(shift, size), slice(0, size - shift)
+  return slice(0, size + shift), slice(-shift, size)
 
 
-def random_flips(video):
-  if np.random.randint(0, 2) > 0:
+def _shift_into(video, out, x_shift, y_shift):
+  """Write `video` shifted by (`x_shift`, `y_shift`) into `out`, zero filled.
+
+  `out` must not overlap `video`.
+
+  """
+
+  _, x, y, _ = video.shape
+
+  x_dst, x_src = _shift_slices(x, x_shift)
+  y_dst, y_src = _shift_slices(y, y_shift)
+
+  out[:, x_dst, y_dst] = video[:, x_src, y_src]
+
+  # Zero the uncovered borders.
+  out[:, :x_dst.start] = 0
+  out[:, x_dst.stop:] = 0
+  out[:, :, :y_dst.start] = 0
+  out[:, :, y_dst.stop:] = 0
+
+  return out
+
+
+def random_xy_shift(video, max_xy_shift=5, out=None):
+  """Shift `video` by up to `max_xy_shift` - 1 pixels in x and y.
+
+  Implemented as an offset copy with zero fill, into `out` if given.
+
+  """
+  x_shift, y_shift = _random_xy_shifts(max_xy_shift)
+  if out is None:
+    out = np.empty_like(video)
+  return _shift_into(video, out, x_shift, y_shift)
+
+
+def _random_flips():
+  return np.random.randint(0, 2) > 0, np.random.randint(0, 2) > 0
+
+
+def _flip(video, flip_x, flip_y):
+  if flip_x:
     video = np.flip(video, axis=1)
-  if np.random.randint(0, 2) > 0:
+  if flip_y:
     video = np.flip(video, axis=2)
   return video
 
 
-def random_mask(video, num_mask_patches=5, max_xy_mask_fraction=0.3):
-  t, x, y, c = video.shape
+def random_flips(video):
+  return _flip(video, *_random_flips())
 
-  modified = np.copy(video)
+
+def _random_mask_patches(x, y, num_mask_patches=5, max_xy_mask_fraction=0.3):
+  """The (x, y) slices of `random_mask` patches."""
+
+  patches = []
 
   for _ in range(num_mask_patches):
 
@@ -85,10 +138,33 @@ def random_mask(video, num_mask_patches=5, max_xy_mask_fraction=0.3):
     y_start = np.random.randint(y - y_width)
     y_end = y_start + y_width
 
-    for i in range(t):
-      modified[i][x_start:x_end, y_start:y_end, :] = 0
+    patches.append((slice(x_start, x_end), slice(y_start, y_end)))
+
+  return patches
+
 
-  return modified
+def random_mask(video, num_mask_patches=5, max_xy_mask_fraction=0.3, out=None):
+  """Zero random patches of all frames of `video`, into `out` if given.
+
+  `out` may be `video` to mask in place.
+
+  """
+
+  t, x, y, c = video.shape
+
+  if out is None:
+    out = np.copy(video)
+  elif out is not video:
+    np.copyto(out, video)
+
+  for x_slice, y_slice in _random_mask_patches(
+      x,
+      y,
+      num_mask_patches=num_mask_patches,
+      max_xy_mask_fraction=max_xy_mask_fraction):
+    out[:, x_slice, y_slice, :] = 0
+
+  return out
 
 
 def random_enhancements(video,
@@ -99,17 +175,22 @@ def random_enhancements(video,
                         min_brightness=0,
                         max_brightness=1.0,
                         min_sharpness=0,
-                        max_sharpness=2.0):
+                        max_sharpness=2.0,
+                        out=None):
   """
   Expects uint8 video in [0,255].
+
+  Enhanced frames are written into `out` if given, which may be `video`
+  to enhance in place.
   """
 
   if video.dtype != np.uint8:
     msg = "Random enhancer expects type uint8."
     raise ValueError(msg)
 
-  modified = np.copy(video)
-  t, x, y, c = modified.shape
+  if out is None:
+    out = np.empty_like(video)
+  t, x, y, c = video.shape
 
   color = np.random.uniform(min_color, max_color)
   contrast = np.random.uniform(min_contrast, max_contrast)
@@ -117,14 +198,33 @@ def random_enhancements(video,
   sharpness = np.random.uniform(min_sharpness, max_sharpness)
 
   for i in range(t):
-    image = Image.fromarray((modified[i]))
+    image = Image.fromarray((video[i]))
     image = ImageEnhance.Color(image).enhance(color)
     image = ImageEnhance.Contrast(image).enhance(contrast)
     image = ImageEnhance.Brightness(image).enhance(brightness)
     image = ImageEnhance.Sharpness(image).enhance(sharpness)
-    modified[i] = np.array(image)
+    out[i] = np.asarray(image)
 
-  return modified
+  return out
+
+
+def _copy_frames_as_uint8(video, indices, out):
+  """Copy frames `indices` of `video` into uint8 `out` as `augment_video`.
+
+  Frames are converted one at a time so that at most one frame of
+  intermediate values is allocated.
+
+  """
+
+  scale = video.max() <= 0.5 and video.min() >= -0.5
+
+  for i, j in enumerate(indices):
+    frame = video[j]
+    if scale:
+      frame = frame * 255.0
+    np.copyto(out[i], frame, casting="unsafe")
+
+  return out
 
 
 def augment_video(video,
@@ -145,12 +245,45 @@ def augment_video(video,
                   enhance_min_brightness=0.0,
                   enhance_max_brightness=1.0,
                   enhance_min_sharpness=0.0,
-                  enhance_max_sharpness=2.0):
-  """Wrapper for various video augmentation operations."""
+                  enhance_max_sharpness=2.0,
+                  out=None):
+  """Wrapper for various video augmentation operations.
+
+  When `out` is given, a caller-owned uint8 array of the augmented clip's
+  shape, the clip is augmented in it without further clip-sized
+  allocations: frames are copied in once, enhanced in place, then flipped
+  and shifted frame by frame through one scratch frame and masked in
+  place. Given the same random state the result is that of the default
+  mode.
+
+  """
 
   if isinstance(video, list):
     video = np.asarray(video)
 
+  if out is not None:
+    return _augment_video_into(
+        video,
+        out,
+        do_random_subsampling=do_random_subsampling,
+        do_random_flips=do_random_flips,
+        do_random_masking=do_random_masking,
+        do_random_enhancement=do_random_enhancement,
+        do_random_shift=do_random_shift,
+        subsample_length=subsample_length,
+        subsample_max_frame_skips=subsample_max_frame_skips,
+        shift_max_xy=shift_max_xy,
+        enhance_kwargs={
+            "min_color": enhance_min_color,
+            "max_color": enhance_max_color,
+            "min_contrast": enhance_min_contrast,
+            "max_contrast": enhance_max_contrast,
+            "min_brightness": enhance_min_brightness,
+            "max_brightness": enhance_max_brightness,
+            "min_sharpness": enhance_min_sharpness,
+            "max_sharpness": enhance_max_sharpness
+        })
+
   mod = np.copy(video)
 
   if mod.max() <= 0.5 and mod.min() >= -0.5:
@@ -188,31 +321,82 @@ def augment_video(video,
   return mod
 
 
+def _augment_video_into(video, out, do_random_subsampling, do_random_flips,
+                        do_random_masking, do_random_enhancement,
+                        do_random_shift, subsample_length,
+                        subsample_max_frame_skips, shift_max_xy,
+                        enhance_kwargs):
+  """`augment_video` into `out`, drawing random numbers in the same order."""
+
+  if do_random_subsampling:
+    indices = _random_temporal_subsample_indices(
+        len(video),
+        length=subsample_length,
+        max_frame_skips=subsample_max_frame_skips)
+  else:
+    indices = np.arange(len(video))
+
+  shape = (len(indices),) + video.shape[1:]
+  if out.shape != shape or out.dtype != np.uint8:
+    raise ValueError("Expected out of shape {} and dtype uint8, saw {} and "
+                     "{}.".format(shape, out.shape, out.dtype))
+
+  _copy_frames_as_uint8(video, indices, out)
+
+  if do_random_enhancement:
+    random_enhancements(out, out=out, **enhance_kwargs)
+
+  flips = _random_flips() if do_random_flips else (False, False)
+  shifts = _random_xy_shifts(shift_max_xy) if do_random_shift else (0, 0)
+
+  if any(flips) or any(shifts):
+    scratch = np.empty((1,) + out.shape[1:], dtype=out.dtype)
+    for i in range(len(out)):
+      np.copyto(scratch, out[i:i + 1])
+      _shift_into(_flip(scratch, *flips), out[i:i + 1], *shifts)
+
+  if do_random_masking:
+    random_mask(out, out=out)
+
+  return out
+
+
 def augment_audio(audio,
                   do_random_shift=True,
                   do_add_gaussian_noise=True,
                   shift_reduction=0.05,
                   gaussian_snr=10,
-                  data_range=[-0.5, 0.5]):
-  """Wrapper for various audio augmentation operations."""
+                  data_range=[-0.5, 0.5],
+                  out=None):
+  """Wrapper for various audio augmentation operations.
+
+  When `out` is given, an array of the augmented audio's length, the
+  shifted audio is copied into it once and noise is added in place.
+
+  """
 
   if isinstance(audio, list):
     audio = np.asarray(audio)
 
   original_type = audio.dtype
 
-  if original_type != np.float32:
-    audio = audio.astype(np.float32)
-
-  modified = np.copy(audio)
-
   if do_random_shift:
-    max_shift = int(len(modified) * (shift_reduction))
-    target_length = len(modified) - max_shift
+    max_shift = int(len(audio) * (shift_reduction))
+    target_length = len(audio) - max_shift
     offset = np.random.randint(0, max_shift)
     end_index = offset + target_length
     audio = audio[offset:end_index]
 
+  if out is None:
+    # A float32 copy, so that noise is not added to the caller's audio.
+    augmented = np.array(audio, dtype=np.float32)
+  else:
+    if out.shape != audio.shape:
+      raise ValueError("Expected out of shape {}, saw {}.".format(
+          audio.shape, out.shape))
+    np.copyto(out, audio, casting="unsafe")
+    augmented = out
+
   if do_add_gaussian_noise:
 
     assert audio.max() <= data_range[1]
@@ -220,8 +404,370 @@ def augment_audio(audio,
 
     noise = np.random.uniform(data_range[0] / float(gaussian_snr),
                               data_range[1] / float(gaussian_snr), len(audio))
-    audio += noise
+    np.add(augmented, noise, out=augmented, casting="unsafe")
+
+  if out is not None:
+    return out
+
+  return augmented.astype(original_type, copy=False)
+
+
+def _blend(degenerate, image, factor):
+  """`PIL.Image.blend(degenerate, image, factor)`, in place in `image`.
+
+  Arrays are float32 holding uint8 values. The blend is computed in
+  float32 and truncated as PIL does, with `factor` broadcast against the
+  arrays, e.g. of shape (B, 1, 1, 1, 1) for per-clip factors.
+
+  """
+  image -= degenerate
+  image *= factor
+  image += degenerate
+  np.clip(image, 0, 255, out=image)
+  return np.floor(image, out=image)
+
+
+def _luminance(frames):
+  """The PIL "L" conversion of float32 RGB `frames`, dropping the channel.
+
+  PIL's fixed point weights are exact in float32 as no partial sum
+  exceeds 2**24.
+
+  """
+  weights = np.array([19595, 38470, 7471], dtype=np.float32)
+  return np.floor((np.dot(frames, weights) + 0x8000) / 0x10000)
+
+
+def _clip_factors(factors, frames):
+  """Reshape per-clip `factors` to broadcast against (B, T, H, W, C)."""
+  factors = np.asarray(factors, dtype=np.float32)
+  return factors.reshape((-1,) + (1,) * (frames.ndim - 1))
+
+
+def _enhance_color(frames, factors):
+  grey = _luminance(frames)[..., None]
+  return _blend(grey, frames, _clip_factors(factors, frames))
+
+
+def _enhance_contrast(frames, factors):
+  mean = np.floor(
+      _luminance(frames).mean(axis=(-2, -1), dtype=np.float64) + 0.5)
+  return _blend(mean[..., None, None, None].astype(np.float32), frames,
+                _clip_factors(factors, frames))
+
+
+def _enhance_brightness(frames, factors):
+  return _blend(np.float32(0), frames, _clip_factors(factors, frames))
+
+
+def _enhance_sharpness(frames, factors):
+
+  # PIL's SMOOTH filter, [[1, 1, 1], [1, 5, 1], [1, 1, 1]] / 13, as a
+  # separable 3x3 box sum plus 4 times the center, leaving the border
+  # pixels unchanged.
+  rows = frames[..., :-2, :, :] + frames[..., 1:-1, :, :]
+  rows += frames[..., 2:, :, :]
+  box = rows[..., :-2, :] + rows[..., 1:-1, :]
+  box += rows[..., 2:, :]
+  box += 4 * frames[..., 1:-1, 1:-1, :]
+  box /= 13.0
+  box += 0.5
+  np.clip(box, 0, 255, out=box)
+  np.floor(box, out=box)
+
+  # Blending border pixels with themselves leaves them unchanged, so only
+  # the interior is blended, in place.
+  _blend(box, frames[..., 1:-1, 1:-1, :], _clip_factors(factors, frames))
+
+  return frames
+
+
+def _enhance_batch(enhance, videos, factors):
+  return enhance(videos.astype(np.float32), factors).astype(np.uint8)
+
+
+def enhance_color_batch(videos, factors):
+  """`ImageEnhance.Color` of each frame of (B, T, H, W, 3) uint8 `videos`."""
+  return _enhance_batch(_enhance_color, videos, factors)
+
+
+def enhance_contrast_batch(videos, factors):
+  """`ImageEnhance.Contrast` of each frame, relative to that frame's mean."""
+  return _enhance_batch(_enhance_contrast, videos, factors)
+
+
+def enhance_brightness_batch(videos, factors):
+  """`ImageEnhance.Brightness` of each frame of `videos`."""
+  return _enhance_batch(_enhance_brightness, videos, factors)
+
+
+def enhance_sharpness_batch(videos, factors):
+  """`ImageEnhance.Sharpness` of each frame of `videos`."""
+  return _enhance_batch(_enhance_sharpness, videos, factors)
+
 
-  audio = audio.astype(original_type)
+def random_enhancements_batch(videos,
+                              rng=None,
+                              min_color=0,
+                              max_color=1.0,
+                              min_contrast=0,
+                              max_contrast=1.0,
+                              min_brightness=0,
+                              max_brightness=1.0,
+                              min_sharpness=0,
+                              max_sharpness=2.0):
+  """`random_enhancements` of each clip of (B, T, H, W, 3) uint8 `videos`.
 
-  return audio
+  Each clip's factors are sampled independently, from the same
+  distributions as `random_enhancements`, and applied to all of its
+  frames.
+
+  """
+
+  if videos.dtype != np.uint8:
+    msg = "Random enhancer expects type uint8."
+    raise ValueError(msg)
+
+  rng = np.random.default_rng(rng)
+  batch_size = len(videos)
+
+  color = rng.uniform(min_color, max_color, batch_size)
+  contrast = rng.uniform(min_contrast, max_contrast, batch_size)
+  brightness = rng.uniform(min_brightness, max_brightness, batch_size)
+  sharpness = rng.uniform(min_sharpness, max_sharpness, batch_size)
+
+  enhanced = np.empty_like(videos)
+
+  # Enhance in float32 throughout, truncating after each step as PIL
+  # does, rather than converting to and from uint8 between steps. Clips
+  # are enhanced one at a time so that the float32 working set stays in
+  # cache across the ~40 passes over it.
+  for i in range(batch_size):
+    frames = videos[i:i + 1].astype(np.float32)
+    frames = _enhance_color(frames, color[i:i + 1])
+    frames = _enhance_contrast(frames, contrast[i:i + 1])
+    frames = _enhance_brightness(frames, brightness[i:i + 1])
+    frames = _enhance_sharpness(frames, sharpness[i:i + 1])
+    enhanced[i] = frames[0]
+
+  return enhanced
+
+
+def random_temporal_subsample_indices_batch(rng,
+                                            batch_size,
+                                            num_frames,
+                                            length=15,
+                                            max_frame_skips=1):
+  """(B, length) frame indices distributed as `random_temporal_subsample`."""
+
+  if num_frames <= length + max_frame_skips:
+    msg = "Can't subsample target length %s > source %s" % (
+        length + max_frame_skips, num_frames)
+    raise ValueError(msg)
+
+  num_frame_skips = rng.integers(0, max_frame_skips, batch_size)
+  sample_size = length + num_frame_skips
+  start = rng.integers(0, num_frames - sample_size)
+
+  # Keep `length` of each clip's first `sample_size` positions: positions
+  # beyond those get the lowest keys, so dropping the `max_frame_skips`
+  # lowest keys drops them and `num_frame_skips` random others.
+  window = length + max_frame_skips
+  keys = rng.random((batch_size, window))
+  keys[np.arange(window)[None, :] >= sample_size[:, None]] = -1
+  kept = np.sort(np.argsort(keys, axis=1)[:, max_frame_skips:], axis=1)
+
+  return start[:, None] + kept
+
+
+def random_flip_and_shift_indices(rng,
+                                  batch_size,
+                                  x,
+                                  y,
+                                  do_random_flips=True,
+                                  do_random_shift=True,
+                                  max_xy_shift=5):
+  """Source rows and columns of `random_flips` then `random_xy_shift`.
+
+  Returns:
+    tuple: (B, x) source row and (B, y) source column indices, -1 where
+      the shift pads with zeros.
+
+  """
+
+  rows = np.tile(np.arange(x), (batch_size, 1))
+  cols = np.tile(np.arange(y), (batch_size, 1))
+
+  if do_random_flips:
+    flips = rng.integers(0, 2, (batch_size, 2)) > 0
+    rows = np.where(flips[:, :1], x - 1 - rows, rows)
+    cols = np.where(flips[:, 1:], y - 1 - cols, cols)
+
+  if do_random_shift:
+    for size, axis_indices in [(x, rows), (y, cols)]:
+      shift = rng.integers(0, max_xy_shift, batch_size)
+      # Padding before shifts content forward, padding after backward.
+      sign = np.where(rng.integers(0, 2, batch_size) > 0, 1, -1)
+      positions = np.arange(size)[None, :] + (sign * shift)[:, None]
+      valid = (positions >= 0) & (positions < size)
+      axis_indices[...] = np.where(
+          valid,
+          np.take_along_axis(axis_indices,
+                             np.clip(positions, 0, size - 1),
+                             axis=1), -1)
+
+  return rows, cols
+
+
+def random_mask_batch(rng,
+                      batch_size,
+                      x,
+                      y,
+                      num_mask_patches=5,
+                      max_xy_mask_fraction=0.3):
+  """(B, x, y) masks, True where `random_mask` would zero a clip."""
+
+  mask_fraction = rng.uniform(0, max_xy_mask_fraction,
+                              (batch_size, num_mask_patches))
+
+  x_width = (mask_fraction * x).astype(np.int64)
+  x_start = rng.integers(0, x - x_width)
+  y_width = (mask_fraction * y).astype(np.int64)
+  y_start = rng.integers(0, y - y_width)
+
+  in_x = ((np.arange(x)[None, None, :] >= x_start[..., None]) &
+          (np.arange(x)[None, None, :] < (x_start + x_width)[..., None]))
+  in_y = ((np.arange(y)[None, None, :] >= y_start[..., None]) &
+          (np.arange(y)[None, None, :] < (y_start + y_width)[..., None]))
+
+  return np.any(in_x[..., :, None] & in_y[..., None, :], axis=1)
+
+
+def augment_video_batch(videos,
+                        rng=None,
+                        do_random_subsampling=True,
+                        do_random_flips=True,
+                        do_random_masking=True,
+                        do_random_enhancement=True,
+                        do_random_shift=True,
+                        subsample_length=15,
+                        subsample_max_frame_skips=1,
+                        shift_max_xy=5,
+                        mask_num_patches=5,
+                        mask_max_patch_fraction=0.3,
+                        enhance_min_color=0.0,
+                        enhance_max_color=1.0,
+                        enhance_min_contrast=0.0,
+                        enhance_max_contrast=1.0,
+                        enhance_min_brightness=0.0,
+                        enhance_max_brightness=1.0,
+                        enhance_min_sharpness=0.0,
+                        enhance_max_sharpness=2.0,
+                        out=None):
+  """`augment_video` of each clip of a (B, T, H, W, C) batch.
+
+  Each clip's augmentation parameters are sampled independently from the
+  same distributions as `augment_video`, but enhancements are vectorized
+  over the batch and subsampling, flips, shifts and masks are applied as
+  one gather of precomputed frame, row and column indices followed by one
+  masked zeroing.
+
+  Masking uses `mask_num_patches` and `mask_max_patch_fraction`, which
+  `augment_video` ignores; their defaults are those of `random_mask`, as
+  used by `augment_video`.
+
+  Args:
+    videos(np.ndarray): A batch of clips, uint8 or as for `augment_video`.
+    rng(np.random.Generator or int): The source of randomness, or a seed
+      from which to create one; unseeded if None.
+    out(np.ndarray): Optionally, a caller-owned uint8 array of the
+      augmented batch's shape into which to write it.
+
+  Returns:
+    np.ndarray: The augmented uint8 clips, `out` if it was provided.
+
+  """
+
+  if isinstance(videos, list):
+    videos = np.asarray(videos)
+
+  if videos.ndim != 5:
+    raise ValueError("Expected videos of shape (B, T, H, W, C), saw {}.".format(
+        videos.shape))
+
+  mod = videos
+
+  if mod.max() <= 0.5 and mod.min() >= -0.5:
+    mod = mod * 255.0
+
+  # Convert range and type
+  if mod.dtype != np.uint8:
+    mod = mod.astype(np.uint8)
+
+  rng = np.random.default_rng(rng)
+  b, t, x, y, _ = mod.shape
+
+  if do_random_subsampling:
+    frames = random_temporal_subsample_indices_batch(
+        rng,
+        b,
+        t,
+        length=subsample_length,
+        max_frame_skips=subsample_max_frame_skips)
+    mod = mod[np.arange(b)[:, None], frames]
+
+  if do_random_enhancement:
+    mod = random_enhancements_batch(mod,
+                                    rng=rng,
+                                    min_color=enhance_min_color,
+                                    max_color=enhance_max_color,
+                                    min_contrast=enhance_min_contrast,
+                                    max_contrast=enhance_max_contrast,
+                                    min_brightness=enhance_min_brightness,
+                                    max_brightness=enhance_max_brightness,
+                                    min_sharpness=enhance_min_sharpness,
+                                    max_sharpness=enhance_max_sharpness)
+
+  if out is None:
+    out = np.empty_like(mod)
+  elif (out.shape != mod.shape or out.dtype != np.uint8 or
+        not out.flags["C_CONTIGUOUS"]):
+    raise ValueError("Expected a C-contiguous out of shape {} and dtype "
+                     "uint8, saw {} and {}.".format(mod.shape, out.shape,
+                                                    out.dtype))
+
+  if not (do_random_flips or do_random_shift or do_random_masking):
+    np.copyto(out, mod)
+    return out
+
+  rows, cols = random_flip_and_shift_indices(rng,
+                                             b,
+                                             x,
+                                             y,
+                                             do_random_flips=do_random_flips,
+                                             do_random_shift=do_random_shift,
+                                             max_xy_shift=shift_max_xy)
+
+  zeroed = (rows < 0)[:, :, None] | (cols < 0)[:, None, :]
+  if do_random_masking:
+    zeroed |= random_mask_batch(rng,
+                                b,
+                                x,
+                                y,
+                                num_mask_patches=mask_num_patches,
+                                max_xy_mask_fraction=mask_max_patch_fraction)
+
+  # Gather each clip's pixels by their flat source index, which is much
+  # faster than fancy indexing over the frame, row and column axes.
+  pixels = np.maximum(rows, 0)[:, :, None] * y + np.maximum(cols, 0)[:, None, :]
+  pixels = pixels.reshape((b, x * y))
+  zeroed = zeroed.reshape((b, x * y))
+
+  t, c = mod.shape[1], mod.shape[4]
+
+  for i in range(b):
+    clip = out[i].reshape((t, x * y, c))
+    np.take(mod[i].reshape((t, x * y, c)), pixels[i], axis=1, out=clip)
+    clip[:, zeroed[i]] = 0
+
+  return out
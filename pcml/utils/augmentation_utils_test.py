@@ -12,9 +12,15 @@
 # limitations under the License.
 """Tests of augmentation utilities."""
 
+import time
+import tracemalloc
+
 import tensorflow as tf
 import numpy as np
 
+from PIL import Image
+from PIL import ImageEnhance
+
 from clarify.utils import augmentation_utils
 
 
@@ -56,6 +62,264 @@ class TestVideoAugmentationUtils(tf.test.TestCase):
     augmented = augmentation_utils.augment_video(self.test_video)
     self.assertTrue(isinstance(augmented, np.ndarray))
 
+  def test_random_xy_shift_matches_padding(self):
+
+    video = np.random.randint(0, 256, (4, 12, 16, 3)).astype(np.uint8)
+
+    for seed in range(20):
+
+      # The pad then slice implementation it replaces.
+      np.random.seed(seed)
+      t, x, y, c = video.shape
+      x_shift = np.random.randint(0, 5)
+      y_shift = np.random.randint(0, 5)
+      pad = [[0, 0], [0, 0], [0, 0], [0, 0]]
+      pad[1][np.random.randint(0, 2)] = x_shift
+      pad[2][np.random.randint(0, 2)] = y_shift
+      padded = np.pad(video, pad_width=pad, mode='constant')
+      expected = padded[:, pad[1][1]:(x + pad[1][1]),
+                        pad[2][1]:(y + pad[2][1]), :]
+
+      np.random.seed(seed)
+      self.assertAllEqual(augmentation_utils.random_xy_shift(video), expected)
+
+  def test_augment_video_into_out(self):
+
+    uint8_video = np.random.randint(0, 256, (20, 24, 32, 3)).astype(np.uint8)
+    float_video = (self.test_video - 0.5) * 0.9
+
+    for video in [uint8_video, float_video]:
+      for seed in range(5):
+
+        np.random.seed(seed)
+        expected = augmentation_utils.augment_video(video)
+
+        out = np.empty((15,) + video.shape[1:], dtype=np.uint8)
+        np.random.seed(seed)
+        augmented = augmentation_utils.augment_video(video, out=out)
+
+        self.assertTrue(augmented is out)
+        self.assertAllEqual(augmented, expected)
+
+    with self.assertRaises(ValueError):
+      augmentation_utils.augment_video(uint8_video,
+                                       out=np.empty_like(uint8_video))
+
+
+class TestBatchVideoAugmentationUtils(tf.test.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(0)
+    self.videos = rng.randint(0, 256, (3, 20, 24, 32, 3)).astype(np.uint8)
+
+  def test_enhancements_match_pil(self):
+
+    factors = np.array([0.3, 1.0, 1.7])
+
+    for enhancer, enhance_batch in [
+        (ImageEnhance.Color, augmentation_utils.enhance_color_batch),
+        (ImageEnhance.Contrast, augmentation_utils.enhance_contrast_batch),
+        (ImageEnhance.Brightness, augmentation_utils.enhance_brightness_batch),
+        (ImageEnhance.Sharpness, augmentation_utils.enhance_sharpness_batch)
+    ]:
+
+      enhanced = enhance_batch(self.videos[:, :4], factors)
+
+      for i, factor in enumerate(factors):
+        for j in range(4):
+          expected = np.array(
+              enhancer(Image.fromarray(self.videos[i, j])).enhance(factor))
+          error = np.abs(enhanced[i, j].astype(np.int32) - expected)
+          self.assertTrue(error.max() <= 1)
+
+  def test_random_enhancements_batch(self):
+
+    enhanced = augmentation_utils.random_enhancements_batch(self.videos[:, :2],
+                                                            rng=0)
+    self.assertEqual(enhanced.dtype, np.uint8)
+    self.assertEqual(enhanced.shape, (3, 2, 24, 32, 3))
+
+    with self.assertRaises(ValueError):
+      augmentation_utils.random_enhancements_batch(
+          self.videos.astype(np.float32))
+
+  def test_temporal_subsample_indices_batch(self):
+
+    rng = np.random.default_rng(0)
+    indices = augmentation_utils.random_temporal_subsample_indices_batch(
+        rng, 1000, 20, length=10, max_frame_skips=3)
+
+    self.assertEqual(indices.shape, (1000, 10))
+    self.assertTrue(np.all(np.diff(indices, axis=1) > 0))
+    self.assertTrue(np.all(indices >= 0) and np.all(indices < 20))
+
+    # As `random_temporal_subsample`, up to max_frame_skips - 1 frames are
+    # skipped, so each sample spans at most length + 2 frames.
+    spans = indices[:, -1] - indices[:, 0] + 1
+    self.assertEqual(set(spans), set([10, 11, 12]))
+
+    with self.assertRaises(ValueError):
+      augmentation_utils.random_temporal_subsample_indices_batch(rng,
+                                                                 1,
+                                                                 10,
+                                                                 length=10)
+
+  def test_flips_and_shifts_match_per_clip(self):
+
+    video = self.videos[0]
+
+    # Every flip and shift yields one of the per-clip results.
+    expected = []
+    for flip_x in [False, True]:
+      for flip_y in [False, True]:
+        flipped = video
+        if flip_x:
+          flipped = np.flip(flipped, axis=1)
+        if flip_y:
+          flipped = np.flip(flipped, axis=2)
+        expected.append(flipped)
+
+    augmented = augmentation_utils.augment_video_batch(
+        np.stack([video] * 16),
+        rng=0,
+        do_random_subsampling=False,
+        do_random_enhancement=False,
+        do_random_masking=False,
+        do_random_shift=False)
+
+    for clip in augmented:
+      self.assertTrue(any(np.array_equal(clip, e) for e in expected))
+
+    rng = np.random.default_rng(1)
+    rows, cols = augmentation_utils.random_flip_and_shift_indices(
+        rng, 2000, 24, 32, do_random_flips=False, max_xy_shift=5)
+
+    # Shifts of up to max_xy_shift - 1 in either direction pad with zeros.
+    shifts = rows[:, 0]
+    shifts = np.where(rows[:, 0] < 0, -np.sum(rows < 0, axis=1), shifts)
+    self.assertEqual(set(shifts), set(range(-4, 5)))
+    for row in rows:
+      valid = row[row >= 0]
+      self.assertAllEqual(np.diff(valid), np.ones(len(valid) - 1))
+
+  def test_mask_matches_distribution(self):
+
+    video = np.ones((1, 24, 32, 1), dtype=np.uint8)
+    num_samples = 2000
+
+    np.random.seed(0)
+    expected = np.mean([
+        1 - augmentation_utils.random_mask(video).mean()
+        for _ in range(num_samples)
+    ])
+
+    masks = augmentation_utils.random_mask_batch(np.random.default_rng(0),
+                                                 num_samples, 24, 32)
+    self.assertTrue(abs(masks.mean() - expected) < 0.01)
+
+  def test_default_masking_matches_augment_video(self):
+
+    videos = np.full((1000, 2, 24, 32, 3), 255, dtype=np.uint8)
+    kwargs = {
+        "do_random_subsampling": False,
+        "do_random_flips": False,
+        "do_random_enhancement": False,
+        "do_random_shift": False
+    }
+
+    np.random.seed(0)
+    expected = np.array([
+        np.mean(augmentation_utils.augment_video(video, **kwargs) == 0)
+        for video in videos
+    ])
+    masked = np.mean(augmentation_utils.augment_video_batch(videos,
+                                                            rng=0,
+                                                            **kwargs) == 0,
+                     axis=(1, 2, 3, 4))
+
+    self.assertTrue(abs(masked.mean() - expected.mean()) < 0.01)
+    self.assertTrue(abs(masked.std() - expected.std()) < 0.01)
+
+  def test_e2e(self):
+
+    augmented = augmentation_utils.augment_video_batch(self.videos, rng=0)
+    self.assertEqual(augmented.shape, (3, 15, 24, 32, 3))
+    self.assertEqual(augmented.dtype, np.uint8)
+
+    augmented_ = augmentation_utils.augment_video_batch(self.videos, rng=0)
+    self.assertAllEqual(augmented, augmented_)
+
+    # Inputs in [-0.5, 0.5] are scaled as by `augment_video`.
+    augmented = augmentation_utils.augment_video_batch(self.videos / 255.0 -
+                                                       0.5,
+                                                       rng=0)
+    self.assertEqual(augmented.dtype, np.uint8)
+
+
+def _peak_traced_bytes(fn, *args, **kwargs):
+  """The peak bytes allocated while calling `fn`."""
+  tracemalloc.start()
+  try:
+    fn(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return peak
+
+
+class VideoAugmentationBenchmark(tf.test.Benchmark):
+
+  def benchmark_augment_video_memory(self):
+    """Report the peak bytes allocated augmenting a clip with and without out.
+
+    Peak allocations include the returned clip in the default mode; with
+    `out` the caller owns the only clip-sized array.
+
+    """
+
+    video = np.random.randint(0, 256, (20, 96, 96, 3)).astype(np.uint8)
+    out = np.empty((15, 96, 96, 3), dtype=np.uint8)
+
+    np.random.seed(0)
+    default_peak = _peak_traced_bytes(augmentation_utils.augment_video, video)
+    np.random.seed(0)
+    out_peak = _peak_traced_bytes(augmentation_utils.augment_video,
+                                  video,
+                                  out=out)
+
+    self.report_benchmark(name="augment_video_memory",
+                          iters=1,
+                          wall_time=0,
+                          extras={
+                              "clip_bytes": out.nbytes,
+                              "default_peak_bytes": default_peak,
+                              "out_peak_bytes": out_peak
+                          })
+
+  def benchmark_augment_video_batch(self, batch_size=16):
+    """Compare augmenting a batch of clips with augmenting each clip."""
+
+    videos = np.random.randint(0, 256,
+                               (batch_size, 20, 96, 96, 3)).astype(np.uint8)
+
+    start = time.time()
+    for video in videos:
+      augmentation_utils.augment_video(video)
+    clip_secs = time.time() - start
+
+    start = time.time()
+    augmentation_utils.augment_video_batch(videos, rng=0)
+    batch_secs = time.time() - start
+
+    self.report_benchmark(name="augment_video_batch",
+                          iters=batch_size,
+                          wall_time=batch_secs,
+                          extras={
+                              "clip_secs": clip_secs,
+                              "batch_secs": batch_secs,
+                              "speedup": clip_secs / batch_secs
+                          })
+
 
 class TestAudioAugmentationUtils(tf.test.TestCase):
 
@@ -75,6 +339,23 @@ class TestAudioAugmentationUtils(tf.test.TestCase):
 
     augmented = augmentation_utils.augment_audio(self.test_audio, **aug_hparams)
 
+  def test_augment_audio_into_out(self):
+
+    audio = self.test_audio.astype(np.float32)
+    original = np.copy(audio)
+
+    np.random.seed(0)
+    expected = augmentation_utils.augment_audio(audio)
+    self.assertAllEqual(audio, original)
+
+    out = np.empty((len(audio) - int(len(audio) * 0.05),), dtype=np.float32)
+    np.random.seed(0)
+    augmented = augmentation_utils.augment_audio(audio, out=out)
+
+    self.assertTrue(augmented is out)
+    self.assertAllEqual(augmented, expected)
+    self.assertAllEqual(audio, original)
+
 
 if __name__ == "__main__":
   tf.test.main()
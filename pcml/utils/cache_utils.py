@@ -0,0 +1,246 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Byte-bounded caches for row values read from Cloud Bigtable."""
+
+import collections
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+
+
+def _as_bytes(key):
+  if isinstance(key, str):
+    return key.encode()
+  return key
+
+
+class DiskBlockCache(object):
+  """An on-disk cache tier shared by processes on the same host.
+
+  Each value is stored in its own file under `cache_dir`, written
+  atomically, and read back through `mmap` so concurrent readers share
+  the host's page cache. Least recently used files are evicted once the
+  directory grows beyond `max_bytes`.
+
+  """
+
+  def __init__(self, cache_dir, max_bytes):
+
+    if max_bytes <= 0:
+      raise ValueError("Expected max_bytes > 0, saw {}.".format(max_bytes))
+
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    self._lock = threading.Lock()
+
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+    self._num_bytes = sum(size for _, _, size in self._list_entries())
+
+  def _path(self, key):
+    name = hashlib.sha1(_as_bytes(key)).hexdigest()
+    return os.path.join(self.cache_dir, name)
+
+  def _list_entries(self):
+    entries = []
+    for name in os.listdir(self.cache_dir):
+      if name.startswith("."):
+        continue
+      path = os.path.join(self.cache_dir, name)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        # Evicted by another process.
+        continue
+      entries.append((stat.st_mtime, path, stat.st_size))
+    return entries
+
+  def get(self, key):
+
+    path = self._path(key)
+
+    try:
+      with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+          value = b""
+        else:
+          with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            value = mapped[:]
+      # Mark as recently used for eviction purposes.
+      os.utime(path, None)
+    except (IOError, OSError):
+      with self._lock:
+        self.misses += 1
+      return None
+
+    with self._lock:
+      self.hits += 1
+
+    return value
+
+  def put(self, key, value):
+
+    path = self._path(key)
+
+    if os.path.exists(path) or len(value) > self.max_bytes:
+      return
+
+    fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".")
+    with os.fdopen(fd, "wb") as f:
+      f.write(value)
+    os.replace(tmp_path, path)
+
+    with self._lock:
+      self._num_bytes += len(value)
+      over_budget = self._num_bytes > self.max_bytes
+
+    if over_budget:
+      self._evict()
+
+  def _evict(self):
+    """Evict least recently used files down to 90% of `max_bytes`."""
+
+    entries = sorted(self._list_entries())
+    num_bytes = sum(size for _, _, size in entries)
+    target = int(0.9 * self.max_bytes)
+
+    for _, path, size in entries:
+      if num_bytes <= target:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      num_bytes -= size
+      with self._lock:
+        self.evictions += 1
+
+    with self._lock:
+      self._num_bytes = num_bytes
+
+  def as_dict(self):
+    return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "num_bytes": self._num_bytes,
+        "max_bytes": self.max_bytes
+    }
+
+
+class LRUBlockCache(object):
+  """A thread-safe, byte-bounded LRU cache of row values keyed by row key.
+
+  Values are evicted least recently used first once the summed size of
+  the cached values exceeds `max_bytes`. When a `disk_cache` is provided
+  it is consulted on memory misses and populated on every `put`.
+
+  """
+
+  def __init__(self, max_bytes, disk_cache=None):
+
+    if max_bytes <= 0:
+      raise ValueError("Expected max_bytes > 0, saw {}.".format(max_bytes))
+
+    self.max_bytes = max_bytes
+    self.disk_cache = disk_cache
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.num_bytes = 0
+
+    self._values = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._values)
+
+  def __contains__(self, key):
+    return _as_bytes(key) in self._values
+
+  def _insert(self, key, value):
+    """Insert, evicting as needed. Expects the lock to be held."""
+
+    if len(value) > self.max_bytes:
+      return
+
+    if key in self._values:
+      self.num_bytes -= len(self._values.pop(key))
+
+    self._values[key] = value
+    self.num_bytes += len(value)
+
+    while self.num_bytes > self.max_bytes:
+      _, evicted = self._values.popitem(last=False)
+      self.num_bytes -= len(evicted)
+      self.evictions += 1
+
+  def get(self, key):
+    """Return the cached value for `key` or None."""
+
+    key = _as_bytes(key)
+
+    with self._lock:
+      if key in self._values:
+        self._values.move_to_end(key)
+        self.hits += 1
+        return self._values[key]
+
+    if self.disk_cache is not None:
+      value = self.disk_cache.get(key)
+      if value is not None:
+        with self._lock:
+          self.hits += 1
+          self._insert(key, value)
+        return value
+
+    with self._lock:
+      self.misses += 1
+
+    return None
+
+  def put(self, key, value):
+
+    key = _as_bytes(key)
+
+    with self._lock:
+      self._insert(key, value)
+
+    if self.disk_cache is not None:
+      self.disk_cache.put(key, value)
+
+  def clear(self):
+    with self._lock:
+      self._values.clear()
+      self.num_bytes = 0
+
+  def as_dict(self):
+    stats = {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "num_bytes": self.num_bytes,
+        "max_bytes": self.max_bytes,
+        "num_entries": len(self._values)
+    }
+    if self.disk_cache is not None:
+      stats["disk"] = self.disk_cache.as_dict()
+    return stats
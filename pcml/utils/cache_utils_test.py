@@ -0,0 +1,86 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of row value caches."""
+
+import os
+import tempfile
+
+import tensorflow as tf
+
+from clarify.utils import cache_utils
+
+
+class TestLRUBlockCache(tf.test.TestCase):
+
+  def test_byte_bounded_eviction(self):
+
+    cache = cache_utils.LRUBlockCache(max_bytes=10)
+
+    cache.put(b"a", b"1234")
+    cache.put("b", b"1234")
+    self.assertEqual(cache.num_bytes, 8)
+
+    # Touch "a" so that "b" is the least recently used.
+    self.assertEqual(cache.get("a"), b"1234")
+
+    cache.put(b"c", b"1234")
+    self.assertTrue(b"a" in cache)
+    self.assertFalse(b"b" in cache)
+    self.assertTrue(b"c" in cache)
+    self.assertEqual(cache.num_bytes, 8)
+
+    self.assertEqual(cache.get(b"b"), None)
+
+    # Values larger than the whole cache are not retained.
+    cache.put(b"d", b"x" * 11)
+    self.assertFalse(b"d" in cache)
+
+    self.assertEqual(cache.as_dict()["hits"], 1)
+    self.assertEqual(cache.as_dict()["misses"], 1)
+    self.assertEqual(cache.as_dict()["evictions"], 1)
+
+  def test_disk_tier_shared_between_caches(self):
+
+    cache_dir = tempfile.mkdtemp()
+
+    writer = cache_utils.LRUBlockCache(max_bytes=100,
+                                       disk_cache=cache_utils.DiskBlockCache(
+                                           cache_dir, max_bytes=1000))
+    writer.put(b"frame", b"abc")
+
+    # E.g. a second trainer process on the same host.
+    reader = cache_utils.LRUBlockCache(max_bytes=100,
+                                       disk_cache=cache_utils.DiskBlockCache(
+                                           cache_dir, max_bytes=1000))
+    self.assertEqual(reader.get(b"frame"), b"abc")
+    self.assertEqual(reader.disk_cache.hits, 1)
+    self.assertTrue(b"frame" in reader)
+
+  def test_disk_tier_eviction(self):
+
+    cache_dir = tempfile.mkdtemp()
+    disk_cache = cache_utils.DiskBlockCache(cache_dir, max_bytes=10)
+
+    for i in range(5):
+      disk_cache.put("key{}".format(i), b"1234")
+
+    num_bytes = sum(
+        os.path.getsize(os.path.join(cache_dir, name))
+        for name in os.listdir(cache_dir))
+    self.assertTrue(num_bytes <= 10)
+    self.assertTrue(disk_cache.evictions > 0)
+    self.assertEqual(disk_cache.get("key4"), b"1234")
+
+
+if __name__ == "__main__":
+  tf.test.main()
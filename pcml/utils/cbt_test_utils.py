@@ -0,0 +1,154 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-memory stand-ins for Cloud Bigtable tables, shared by tests."""
+
+import time
+
+
+def _as_bytes(key):
+  if isinstance(key, str):
+    return key.encode()
+  return key
+
+
+class FakeCell(object):
+
+  def __init__(self, value):
+    self.value = value
+
+
+class FakeSample(object):
+
+  def __init__(self, row_key, offset_bytes=0):
+    self.row_key = row_key
+    self.offset_bytes = offset_bytes
+
+
+class FakeStatus(object):
+
+  def __init__(self, code=0):
+    self.code = code
+
+
+class FakeRow(object):
+  """Stands in for both a DirectRow (writes) and PartialRowData (reads)."""
+
+  def __init__(self, row_key):
+    self.row_key = _as_bytes(row_key)
+    self.cells = {}
+
+  def set_cell(self, column_family_id, column, value, timestamp=None):
+    family = self.cells.setdefault(column_family_id, {})
+    family[_as_bytes(column)] = [FakeCell(_as_bytes(value))]
+
+
+class FakeTable(object):
+  """In-memory stand-in for a Cloud Bigtable table.
+
+  Counts read round trips and optionally sleeps `latency` seconds per
+  round trip so batched and per-row read paths can be compared locally.
+
+  """
+
+  def __init__(self, latency=0.0):
+    self.latency = latency
+    self.rows = {}
+    self.num_read_calls = 0
+
+  def _round_trip(self):
+    self.num_read_calls += 1
+    if self.latency > 0:
+      time.sleep(self.latency)
+
+  def exists(self):
+    return True
+
+  def row(self, row_key):
+    return FakeRow(row_key)
+
+  def sample_row_keys(self, sample_every=10):
+    """Every `sample_every`th key then, as in Bigtable, an empty end key.
+
+    Offsets are the summed size of the values of the preceding rows.
+
+    """
+    samples = []
+    offset_bytes = 0
+    for i, key in enumerate(sorted(self.rows.keys())):
+      if i > 0 and i % sample_every == 0:
+        samples.append(FakeSample(key, offset_bytes))
+      offset_bytes += sum(
+          len(cells[0].value)
+          for columns in self.rows[key].cells.values()
+          for cells in columns.values())
+    samples.append(FakeSample(b"", offset_bytes))
+    return iter(samples)
+
+  def mutate_rows(self, rows):
+    for row in rows:
+      stored = self.rows.setdefault(row.row_key, FakeRow(row.row_key))
+      for family, columns in row.cells.items():
+        stored.cells.setdefault(family, {}).update(columns)
+    return [FakeStatus() for _ in rows]
+
+  def read_row(self, row_key, filter_=None):
+    self._round_trip()
+    return self.rows.get(_as_bytes(row_key))
+
+  def _in_range(self, key, start_key, end_key, start_inclusive, end_inclusive):
+    if start_key is not None:
+      start_key = _as_bytes(start_key)
+      if key < start_key or (key == start_key and not start_inclusive):
+        return False
+    if end_key is not None:
+      end_key = _as_bytes(end_key)
+      if key > end_key or (key == end_key and not end_inclusive):
+        return False
+    return True
+
+  def read_rows(self,
+                start_key=None,
+                end_key=None,
+                limit=None,
+                filter_=None,
+                end_inclusive=False,
+                row_set=None):
+    self._round_trip()
+    self.last_read_kwargs = {
+        "start_key": start_key,
+        "end_key": end_key,
+        "limit": limit,
+        "filter_": filter_
+    }
+
+    keys = sorted(self.rows.keys())
+
+    if row_set is not None:
+      requested = set(_as_bytes(key) for key in row_set.row_keys)
+      selected = []
+      for key in keys:
+        in_ranges = any(
+            self._in_range(key, r.start_key, r.end_key, r.start_inclusive,
+                           r.end_inclusive) for r in row_set.row_ranges)
+        if key in requested or in_ranges:
+          selected.append(key)
+    else:
+      selected = [
+          key for key in keys
+          if self._in_range(key, start_key, end_key, True, end_inclusive)
+      ]
+
+    if limit:
+      selected = selected[:limit]
+
+    return iter([self.rows[key] for key in selected])
@@ -14,23 +14,168 @@
 
 import tensorflow as tf
 import numpy as np
+import collections
 import datetime
+import itertools
 import json
 import math
-
+import multiprocessing
+import multiprocessing.pool
+import os
+import queue
+import re
+import threading
+import time
+
+from antidote.utils import codec_utils
+from antidote.utils import read_policy_utils
 from antidote.utils import video_utils
 
 from google.cloud.bigtable import column_family as cbt_lib_column_family
 from google.cloud import bigtable
 from google.cloud.bigtable import row_filters
+from google.cloud.bigtable import row_set as cbt_lib_row_set
 
 from tensor2tensor.data_generators.generator_utils import to_example
 
 from collections import namedtuple
+from concurrent import futures
 
 MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX = 9999
 
 
+def _make_bigtable_client(project=None, sa_key_path=None):
+  if isinstance(sa_key_path, str):
+    return bigtable.Client.from_service_account_json(sa_key_path,
+                                                     project=project,
+                                                     admin=True)
+  return bigtable.Client(project=project, admin=True)
+
+
+class BigtableClientPool(object):
+  """A process-wide pool of Bigtable clients and table handles.
+
+  Clients are keyed by (project, credentials) and table handles by
+  (project, credentials, instance, table) so that selections constructed
+  in the same process share gRPC channels and auth rather than each
+  setting up their own. Each table is checked for (and if need be
+  created by `ensure_fn`) only when its handle is first created.
+
+  gRPC channels must not be used across a fork so the pool is reset in
+  forked children, both eagerly via `os.register_at_fork` and, where that
+  isn't available, on first use in a process other than the one that
+  populated it. Inherited clients are dropped rather than closed.
+
+  """
+
+  def __init__(self, client_fn=_make_bigtable_client):
+    self._client_fn = client_fn
+    self._lock = threading.Lock()
+    self.num_fork_resets = 0
+    self._reset()
+
+  def _reset(self):
+    self._pid = os.getpid()
+    self._clients = {}
+    self._tables = {}
+    self.client_hits = 0
+    self.client_misses = 0
+    self.table_hits = 0
+    self.table_misses = 0
+
+  def reset_after_fork(self):
+    # A fresh lock, the parent's may have been held when it forked.
+    self._lock = threading.Lock()
+    self._reset()
+    self.num_fork_resets += 1
+
+  def _maybe_reset(self):
+    if self._pid != os.getpid():
+      self.reset_after_fork()
+
+  def _get_client(self, project, sa_key_path):
+    """Expects the lock to be held."""
+
+    key = (project, sa_key_path)
+
+    if key in self._clients:
+      self.client_hits += 1
+    else:
+      self.client_misses += 1
+      self._clients[key] = self._client_fn(project=project,
+                                           sa_key_path=sa_key_path)
+
+    return self._clients[key]
+
+  def get_client(self, project=None, sa_key_path=None):
+    self._maybe_reset()
+    with self._lock:
+      return self._get_client(project, sa_key_path)
+
+  def get_table(self,
+                project,
+                instance,
+                table,
+                sa_key_path=None,
+                ensure_fn=None):
+    """Return a (client, instance, table) sharing pooled handles.
+
+    Args:
+      project(str): The GCP project, None for the client default.
+      instance(str): The Bigtable instance name.
+      table(str): The table name.
+      sa_key_path(str): Optional service account key path.
+      ensure_fn(callable): Optionally called with a new table handle,
+        e.g. to create the table if it doesn't exist.
+
+    """
+
+    self._maybe_reset()
+
+    key = (project, sa_key_path, instance, table)
+
+    with self._lock:
+
+      if key in self._tables:
+        self.table_hits += 1
+        return self._tables[key]
+
+      self.table_misses += 1
+
+      client = self._get_client(project, sa_key_path)
+      instance_handle = client.instance(instance)
+      table_handle = instance_handle.table(table)
+
+      if ensure_fn is not None:
+        ensure_fn(table_handle)
+
+      self._tables[key] = (client, instance_handle, table_handle)
+
+      return self._tables[key]
+
+  def clear(self):
+    with self._lock:
+      self._clients.clear()
+      self._tables.clear()
+
+  def as_dict(self):
+    return {
+        "num_clients": len(self._clients),
+        "num_tables": len(self._tables),
+        "client_hits": self.client_hits,
+        "client_misses": self.client_misses,
+        "table_hits": self.table_hits,
+        "table_misses": self.table_misses,
+        "num_fork_resets": self.num_fork_resets
+    }
+
+
+CLIENT_POOL = BigtableClientPool()
+
+if hasattr(os, "register_at_fork"):
+  os.register_at_fork(after_in_child=CLIENT_POOL.reset_after_fork)
+
+
 class BigTableSelection(object):
 
   def __init__(self,
@@ -42,6 +187,7 @@ class BigTableSelection(object):
                sa_key_path=None,
                column_qualifier=None,
                column_family=None,
+               read_policy=None,
                *args,
                **kwargs):
 
@@ -68,60 +214,257 @@ class BigTableSelection(object):
 
     self.table_name = table
 
+    # Optional read_policy_utils.ReadPolicy applied to point and bounded
+    # range reads.
+    self.read_policy = read_policy
+
+    self.sa_key_path = sa_key_path
+    self._materialized_pid = None
+
     self.materialize(sa_key_path=sa_key_path)
 
   def materialize(self, sa_key_path=None):
+    """Obtain client, instance and table handles from `CLIENT_POOL`."""
 
-    if isinstance(sa_key_path, str):
-      self.client = bigtable.Client.from_service_account_json(sa_key_path,
-                                                              admin=True)
-    else:
-      self.client = bigtable.Client(admin=True)
+    self.client, self.instance, self.table = CLIENT_POOL.get_table(
+        project=self.project,
+        instance=self.instance_name,
+        table=self.table_name,
+        sa_key_path=sa_key_path,
+        ensure_fn=self._ensure_table)
+
+  def _maybe_rematerialize(self):
+    """Re-obtain handles in a process forked after they were obtained.
+
+    `CLIENT_POOL` drops handles inherited across a fork but a selection
+    built before the fork would otherwise keep using the parent's.
+
+    """
+    if self._materialized_pid != os.getpid():
+      self.materialize(sa_key_path=self.sa_key_path)
+
+  @property
+  def client(self):
+    self._maybe_rematerialize()
+    return self._client
+
+  @client.setter
+  def client(self, client):
+    self._client = client
 
-    self.instance = self.client.instance(self.instance_name)
+  @property
+  def instance(self):
+    self._maybe_rematerialize()
+    return self._instance
+
+  @instance.setter
+  def instance(self, instance):
+    self._instance = instance
+
+  @property
+  def table(self):
+    self._maybe_rematerialize()
+    return self._table
 
-    self.table = self.instance.table(self.table_name)
+  @table.setter
+  def table(self, table):
+    # Handles are current for the process that set them.
+    self._table = table
+    self._materialized_pid = os.getpid()
 
-    if self.table.exists():
+  def _ensure_table(self, table):
+
+    if table.exists():
       return
 
     max_versions_rule = cbt_lib_column_family.MaxVersionsGCRule(1)
     cf = {key: max_versions_rule for key in self.column_families}
-    self.table.create(column_families=cf)
+    table.create(column_families=cf)
 
-  def get_basic_row_iterator(self):
-    """Convenience function to obtain iterator, maybe using prefix."""
+  def _read_row(self, row_key, op="read_row", **kwargs):
+    """`table.read_row` under `self.read_policy`, if set."""
 
-    table = self.table
+    if self.read_policy is None:
+      return self.table.read_row(row_key, **kwargs)
 
-    row_filter = None
+    return self.read_policy.call(op,
+                                 lambda: self.table.read_row(row_key, **kwargs))
 
-    if isinstance(self.prefix, str):
+  def _read_rows(self, op="read_rows", **kwargs):
+    """`table.read_rows` under `self.read_policy`, if set.
+
+    With a policy rows are consumed into a list within each attempt, so
+    that deadlines and hedging cover the whole read, and should therefore
+    be bounded.
+
+    """
+
+    if self.read_policy is None:
+      return self.table.read_rows(**kwargs)
+
+    return self.read_policy.call(op,
+                                 lambda: list(self.table.read_rows(**kwargs)))
+
+  def _prefix_range(self):
+    """(start_key, end_key) spanning keys starting with `self.prefix`.
+
+    None if there's no prefix or it isn't a literal (regex-free) string,
+    in which case it's applied as a `RowKeyRegexFilter`.
+
+    """
+
+    if not isinstance(self.prefix, str) or not self.prefix:
+      return None
+
+    if re.escape(self.prefix) != self.prefix:
+      return None
+
+    return self.prefix.encode(), _prefix_end_key(self.prefix)
+
+  def _prefix_read_kwargs(self, row_filter=None):
+    """`read_rows` kwargs restricting a read to `self.prefix`."""
+
+    kwargs = {}
+    prefix_range = self._prefix_range()
+
+    if prefix_range is not None:
+      kwargs["start_key"], kwargs["end_key"] = prefix_range
+
+    elif isinstance(self.prefix, str):
 
       prefix = self.prefix
 
       if not prefix.endswith(".*"):
         prefix += ".*"
 
-      row_filter = row_filters.RowKeyRegexFilter(regex=prefix)
+      prefix_filter = row_filters.RowKeyRegexFilter(regex=prefix)
+
+      if row_filter is None:
+        row_filter = prefix_filter
+      else:
+        row_filter = row_filters.RowFilterChain(
+            filters=[prefix_filter, row_filter])
+
+    if row_filter is not None:
+      kwargs["filter_"] = row_filter
+
+    return kwargs
+
+  def get_basic_row_iterator(self):
+    """Convenience function to obtain iterator, maybe using prefix.
+
+    Literal prefixes are read as a key range rather than filtering every
+    row of the table with a regex.
+
+    """
+
+    return self.table.read_rows(**self._prefix_read_kwargs())
+
+  def count_rows(self, max_rows=None):
+    """Count rows with `self.prefix`, stopping once `max_rows` are seen.
+
+    Only keys are transferred: each row is limited to one cell whose
+    value is stripped.
+
+    """
+
+    key_only_filter = row_filters.RowFilterChain(filters=[
+        row_filters.CellsRowLimitFilter(1),
+        row_filters.StripValueTransformerFilter(True)
+    ])
 
-    partial_rows = table.read_rows(filter_=row_filter)
+    kwargs = self._prefix_read_kwargs(row_filter=key_only_filter)
+    if max_rows is not None:
+      kwargs["limit"] = max_rows
 
-    return partial_rows
+    count = 0
+    for _ in self.table.read_rows(**kwargs):
+      count += 1
+      if max_rows is not None and count >= max_rows:
+        break
+
+    return count
 
   def rows_at_least(self, min_rows=1):
-    """That there are at least `min_rows` in the table."""
+    """That there are more than `min_rows` rows with `self.prefix`."""
 
-    iterator = self.get_basic_row_iterator()
+    if min_rows < 0:
+      return True
 
-    i = 0
+    # Reading one more row than `min_rows` settles it.
+    return self.count_rows(max_rows=int(math.floor(min_rows)) + 1) > min_rows
 
-    for row in iterator:
-      i += 1
-      if i > min_rows:
+  def approximate_num_bytes(self):
+    """Approximate bytes stored under `self.prefix` per `sample_row_keys`.
+
+    Samples are taken by Bigtable at intervals of up to hundreds of MB so
+    this is coarse, and zero for small prefixes, but costs a single call
+    regardless of the number of rows. Without a literal prefix this is the
+    size of the whole table.
+
+    """
+
+    start_key, end_key = self._prefix_range() or (b"", b"")
+
+    start_offset = None
+    end_offset = 0
+
+    for sample in self.table.sample_row_keys():
+      row_key = sample.row_key
+      if start_key and row_key and row_key < start_key:
+        continue
+      if start_offset is None:
+        # The first sample at or beyond the start of the prefix.
+        start_offset = sample.offset_bytes
+      end_offset = sample.offset_bytes
+      if end_key and (not row_key or row_key >= end_key):
+        break
+
+    if start_offset is None:
+      return 0
+
+    return end_offset - start_offset
+
+  def approximate_row_count(self, mean_row_bytes):
+    """Approximate rows under `self.prefix`, see `approximate_num_bytes`."""
+
+    if mean_row_bytes <= 0:
+      raise ValueError(
+          "Expected mean_row_bytes > 0, saw {}.".format(mean_row_bytes))
+
+    return int(self.approximate_num_bytes() / mean_row_bytes)
+
+  def wait_until_rows_at_least(self,
+                               min_rows,
+                               timeout_secs=None,
+                               poll_interval_secs=10,
+                               max_poll_interval_secs=120):
+    """Poll `rows_at_least` until it holds or `timeout_secs` pass.
+
+    The interval between polls doubles from `poll_interval_secs` up to
+    `max_poll_interval_secs`.
+
+    Returns:
+      bool: Whether there were more than `min_rows` rows before timing out.
+
+    """
+
+    start_time = time.time()
+    interval = poll_interval_secs
+
+    while True:
+
+      if self.rows_at_least(min_rows):
         return True
 
-    return i > min_rows
+      elapsed = time.time() - start_time
+      if timeout_secs is not None and elapsed + interval > timeout_secs:
+        return False
+
+      tf.logging.info("Waiting for more than {} rows with prefix {}.".format(
+          min_rows, self.prefix))
+      time.sleep(interval)
+      interval = min(2 * interval, max_poll_interval_secs)
 
   def as_dict(self):
     return {
@@ -146,6 +489,12 @@ def _maybe_decode_bytes(obj):
   return obj
 
 
+def _maybe_encode_str(obj):
+  if isinstance(obj, str):
+    return obj.encode()
+  return obj
+
+
 class AVCorrespondenceSample(object):
 
   def __init__(self, video, audio, labels, meta):
@@ -235,6 +584,15 @@ class AVCorrespondenceSample(object):
         "labels": self.labels
     }
 
+  def dump_plan(self):
+    """`dump_keys` plus what's needed to decode the sample's values."""
+    d = self.dump_keys()
+    d["audioBlockSize"] = int(self.meta["audio_block_meta"]["block_size"])
+    d["frameCodec"] = self.meta["video_source"].frame_codec
+    d["audioCodec"] = self.meta["audio_source"].audio_codec
+    d["frameShape"] = self.meta["video_source"].frame_shape
+    return d
+
   def serialize(self):
     d = self.dump_keys()
     return json.dumps(d)
@@ -247,12 +605,18 @@ class VideoMeta(object):
                audio_length,
                video_id,
                shard_id,
-               audio_block_size=256):
+               audio_block_size=256,
+               frame_codec="raw",
+               audio_codec="raw",
+               frame_shape=None):
     self.video_length = video_length
     self.audio_length = audio_length
     self.video_id = video_id
     self.shard_id = shard_id
     self.audio_block_size = audio_block_size
+    self.frame_codec = frame_codec
+    self.audio_codec = audio_codec
+    self.frame_shape = frame_shape
 
   @property
   def video_length(self):
@@ -300,15 +664,59 @@ class VideoMeta(object):
     assert x > 0
     self._audio_block_size = x
 
+  @property
+  def frame_codec(self):
+    return self._frame_codec
+
+  @frame_codec.setter
+  def frame_codec(self, x):
+    codec_utils.get_codec(x)
+    self._frame_codec = x
+
+  @property
+  def audio_codec(self):
+    return self._audio_codec
+
+  @audio_codec.setter
+  def audio_codec(self, x):
+    codec_utils.get_codec(x)
+    self._audio_codec = x
+
+  @property
+  def frame_shape(self):
+    return self._frame_shape
+
+  @frame_shape.setter
+  def frame_shape(self, x):
+    if x is not None:
+      x = [int(dim) for dim in x]
+    self._frame_shape = x
+
   def as_dict(self):
     return {
         "video_length": self.video_length,
         "audio_length": self.audio_length,
         "video_id": self.video_id,
         "shard_id": self.shard_id,
-        "audio_block_size": self.audio_block_size
+        "audio_block_size": self.audio_block_size,
+        "frame_codec": self.frame_codec,
+        "audio_codec": self.audio_codec,
+        "frame_shape": self.frame_shape
     }
 
+  @classmethod
+  def from_dict(cls, d):
+    # Metadata written before codecs were introduced lacks the codec
+    # fields and was written raw.
+    return cls(video_length=d["video_length"],
+               audio_length=d["audio_length"],
+               video_id=d["video_id"],
+               shard_id=d["shard_id"],
+               audio_block_size=d["audio_block_size"],
+               frame_codec=d.get("frame_codec", "raw"),
+               audio_codec=d.get("audio_codec", "raw"),
+               frame_shape=d.get("frame_shape"))
+
 
 class VideoShardMeta(object):
 
@@ -363,6 +771,105 @@ class VideoShardMeta(object):
     }
 
 
+VIDEO_META_INDEX_DTYPE = np.dtype([
+    ("shard_id", np.int64), ("video_id", np.int64), ("video_length", np.int64),
+    ("audio_length", np.int64), ("audio_block_size", np.int64),
+    ("frame_codec", "S{}".format(codec_utils.MAX_CODEC_NAME_LENGTH)),
+    ("audio_codec", "S{}".format(codec_utils.MAX_CODEC_NAME_LENGTH)),
+    ("frame_shape", np.int64, (3,))
+])
+
+
+def _encode_codec_name(name):
+  """Encode codec `name` for the index, raising rather than truncating."""
+  encoded = name.encode()
+  if len(encoded) > codec_utils.MAX_CODEC_NAME_LENGTH:
+    raise ValueError(
+        "Codec name {} exceeds the {} bytes of a VideoMetaIndex.".format(
+            name, codec_utils.MAX_CODEC_NAME_LENGTH))
+  return encoded
+
+
+def _video_meta_to_records(video_meta):
+  records = np.zeros((len(video_meta),), dtype=VIDEO_META_INDEX_DTYPE)
+  for i, vm in enumerate(video_meta):
+    # Unknown frame shapes are stored as zeros.
+    frame_shape = list(vm.frame_shape or [])
+    frame_shape += [0] * (3 - len(frame_shape))
+    records[i] = (vm.shard_id, vm.video_id, vm.video_length, vm.audio_length,
+                  vm.audio_block_size, _encode_codec_name(vm.frame_codec),
+                  _encode_codec_name(vm.audio_codec), frame_shape)
+  return records
+
+
+class VideoMetaIndex(object):
+  """A compact, array-backed index of the `VideoMeta` of many videos.
+
+  Holds one structured array with a column per `VideoMeta` field along
+  with the `VideoShardMeta` (as dicts keyed by str shard id) of the shards
+  it was built from. Supports `len` and integer indexing (returning
+  `VideoMeta`) so it can stand in for the list returned by
+  `RawVideoSelection._lookup_all_video_metadata`.
+
+  Indices are built with `RawVideoSelection.build_video_meta_index`,
+  saved once with `save` and loaded memory-mapped by workers with `load`.
+
+  """
+
+  def __init__(self, records, shard_meta=None):
+    if records.dtype != VIDEO_META_INDEX_DTYPE:
+      msg = "Expected records of dtype {}, saw {}.".format(
+          VIDEO_META_INDEX_DTYPE, records.dtype)
+      raise ValueError(msg)
+    self.records = records
+    self.shard_meta = shard_meta if shard_meta is not None else {}
+
+  def __len__(self):
+    return len(self.records)
+
+  def __getitem__(self, i):
+    record = self.records[i]
+    frame_shape = [int(dim) for dim in record["frame_shape"] if dim > 0]
+    return VideoMeta(video_length=int(record["video_length"]),
+                     audio_length=int(record["audio_length"]),
+                     video_id=int(record["video_id"]),
+                     shard_id=int(record["shard_id"]),
+                     audio_block_size=int(record["audio_block_size"]),
+                     frame_codec=record["frame_codec"].decode(),
+                     audio_codec=record["audio_codec"].decode(),
+                     frame_shape=frame_shape or None)
+
+  def shard_records(self, shard_id):
+    return self.records[self.records["shard_id"] == shard_id]
+
+  def save(self, path):
+    """Save to local `path` (and `path`.json), replacing atomically."""
+
+    tmp_path = "{}.tmp".format(path)
+
+    with open(tmp_path, "wb") as f:
+      np.save(f, np.ascontiguousarray(self.records))
+    with open(tmp_path + ".json", "w") as f:
+      json.dump(self.shard_meta, f)
+
+    os.replace(tmp_path + ".json", path + ".json")
+    os.replace(tmp_path, path)
+
+  @classmethod
+  def load(cls, path, mmap=True):
+    """Load an index saved at local `path`, by default memory-mapped."""
+
+    records = np.load(path, mmap_mode="r" if mmap else None)
+    with open(path + ".json", "r") as f:
+      shard_meta = json.load(f)
+
+    if records.dtype != VIDEO_META_INDEX_DTYPE:
+      # Indices saved with narrower codec name fields are widened in memory.
+      records = records.astype(VIDEO_META_INDEX_DTYPE)
+
+    return cls(records=records, shard_meta=shard_meta)
+
+
 def _validate_shard_meta_key(key):
 
   # Validating its basic structure not whether its encoded or not
@@ -383,24 +890,32 @@ def _validate_shard_meta_key(key):
   assert meta == "meta"
 
 
-def _compose_av_write(table, key, value, column_family, key_tag=None):
-  """Write composition helper.
-
-  Note: Casts numpy array values to uint8.
-
-  """
+def _encode_av_value(value):
+  """Serialize a cell value, casting numpy array values to uint8."""
 
   # If it's a dictionary, serialize it to a string
   if isinstance(value, dict):
     value = json.dumps(value).encode()
   elif isinstance(value, np.ndarray):
-    value = bytes(value.astype(np.uint8).flatten().tolist())
+    value = value.astype(np.uint8, copy=False).tobytes()
   elif isinstance(value, list):
     value = bytes(value)
   elif not isinstance(value, bytes):
     msg = "Tried to write unrecognized type: {}".format(type(value))
     raise ValueError(msg)
 
+  return value
+
+
+def _compose_av_write(table, key, value, column_family, key_tag=None):
+  """Write composition helper.
+
+  Note: Casts numpy array values to uint8.
+
+  """
+
+  value = _encode_av_value(value)
+
   # Compose key and obtain row
   #if key_tag is not None:
   #  key = "{}_{}".format(key, key_tag)
@@ -418,6 +933,153 @@ def _compose_av_write(table, key, value, column_family, key_tag=None):
   return row
 
 
+# google.rpc.Code values for which a failed mutation is worth retrying.
+_RETRYABLE_MUTATION_CODES = (
+    4,  # DEADLINE_EXCEEDED
+    10,  # ABORTED
+    14  # UNAVAILABLE
+)
+
+
+def _mutate_rows_with_retry(table, rows, max_retries=3, backoff_secs=0.1):
+  """Call `table.mutate_rows`, re-sending rows that failed transiently.
+
+  Returns:
+    list: The final status of each row in `rows`, in order.
+
+  """
+
+  statuses = [None for _ in rows]
+  pending = list(range(len(rows)))
+
+  for attempt in range(max_retries + 1):
+
+    response = table.mutate_rows([rows[i] for i in pending])
+
+    retry = []
+    for i, status in zip(pending, response):
+      statuses[i] = status
+      if status.code in _RETRYABLE_MUTATION_CODES:
+        retry.append(i)
+
+    if not retry or attempt == max_retries:
+      break
+
+    tf.logging.info("Retrying {} of {} mutations.".format(
+        len(retry), len(rows)))
+    time.sleep(backoff_secs * 2**attempt)
+    pending = retry
+
+  return statuses
+
+
+class BatchedRowWriter(object):
+  """Writes rows in byte-sized batches with several requests in flight.
+
+  Rows are buffered until either `max_batch_bytes` or `max_batch_rows` is
+  reached then sent with `mutate_rows` on a background thread, keeping at
+  most `max_in_flight` requests outstanding. Rows that fail transiently
+  are retried up to `max_retries` times. Use as a context manager or call
+  `close`, which waits for all outstanding writes.
+
+  """
+
+  def __init__(self,
+               table,
+               max_batch_bytes=4 * 1024 * 1024,
+               max_batch_rows=1000,
+               max_in_flight=4,
+               max_retries=3,
+               raise_on_failure=True):
+
+    self.table = table
+    self.max_batch_bytes = max_batch_bytes
+    self.max_batch_rows = max_batch_rows
+    self.max_in_flight = max_in_flight
+    self.max_retries = max_retries
+    self.raise_on_failure = raise_on_failure
+
+    self.num_rows_written = 0
+    self.num_bytes_written = 0
+    self.failed = []
+
+    self._rows = []
+    self._batch_bytes = 0
+    self._in_flight = collections.deque()
+    self._executor = futures.ThreadPoolExecutor(max_workers=max_in_flight)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+
+    if exc_type is None:
+      self.close()
+      return
+
+    # Don't let a failure to flush mask the error that ended the block.
+    try:
+      self.close()
+    except Exception as e:
+      tf.logging.error("Failed to flush rows while handling {}: {}".format(
+          exc_type.__name__, e))
+
+  def add(self, row, num_bytes):
+    self._rows.append(row)
+    self._batch_bytes += num_bytes
+    if (self._batch_bytes >= self.max_batch_bytes or
+        len(self._rows) >= self.max_batch_rows):
+      self._send_batch()
+
+  def _send_batch(self):
+
+    if not self._rows:
+      return
+
+    while len(self._in_flight) >= self.max_in_flight:
+      self._wait_oldest()
+
+    future = self._executor.submit(_mutate_rows_with_retry, self.table,
+                                   self._rows, self.max_retries)
+    self._in_flight.append((future, self._rows, self._batch_bytes))
+
+    self._rows = []
+    self._batch_bytes = 0
+
+  def _wait_oldest(self):
+
+    future, rows, num_bytes = self._in_flight.popleft()
+    statuses = future.result()
+
+    num_failed = 0
+    for row, status in zip(rows, statuses):
+      if status.code != 0:
+        self.failed.append((row.row_key, status.code))
+        num_failed += 1
+
+    self.num_rows_written += len(rows) - num_failed
+    if num_failed == 0:
+      self.num_bytes_written += num_bytes
+
+  def flush(self):
+    """Send buffered rows and wait for all outstanding writes."""
+
+    self._send_batch()
+    while self._in_flight:
+      self._wait_oldest()
+
+    if self.failed and self.raise_on_failure:
+      msg = "Failed to write {} rows, e.g. {}.".format(len(self.failed),
+                                                       self.failed[:5])
+      raise ValueError(msg)
+
+  def close(self):
+    try:
+      self.flush()
+    finally:
+      self._executor.shutdown(wait=True)
+
+
 def audio_blocks_for_indices(start, end, block_size):
 
   query_length = end - start
@@ -434,24 +1096,59 @@ def audio_blocks_for_indices(start, end, block_size):
       "max_query_block": max_query_block,
       "num_query_blocks": num_query_blocks,
       "query_start": query_start,
-      "query_end": query_end
+      "query_end": query_end,
+      "block_size": block_size
   }
 
 
+_LEX_LETTERS = "abcdefghij"
+_LEX_TRANSLATION = str.maketrans("0123456789", _LEX_LETTERS)
+_LEX_LETTER_CODES = np.frombuffer(_LEX_LETTERS.encode(), dtype=np.uint8)
+
+
 def _lex_index(idx):
-  max_allowable_suffix = MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX
-  tag_length = len(str(max_allowable_suffix))
-  zero_str = "".join([str(0) for _ in range(tag_length)])
-  str_idx = str(idx)
-  diff_len = tag_length - len(str_idx)
-  if diff_len > 0:
-    str_idx = zero_str[0:diff_len] + str_idx
-  letters = "abcdefghij"
-  lexxed = ""
-  for c in str_idx:
-    l = letters[int(c)]
-    lexxed += l
-  return lexxed
+  if idx < 0:
+    raise ValueError("Expected non-negative index, saw {}.".format(idx))
+  tag_length = len(str(MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX))
+  return str(idx).zfill(tag_length).translate(_LEX_TRANSLATION)
+
+
+def _lex_indices(indices):
+  """Vectorized `_lex_index` for indices in [0, MAX_ALLOWABLE_...SUFFIX].
+
+  Returns:
+    np.ndarray: A (len(indices), tag_length) uint8 array of letter codes.
+
+  """
+  tag_length = len(str(MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX))
+  powers = 10**np.arange(tag_length - 1, -1, -1, dtype=np.int64)
+  digits = (np.asarray(indices, dtype=np.int64)[:, None] // powers) % 10
+  return _LEX_LETTER_CODES[digits]
+
+
+def _make_keys(key_stem, indices):
+  """Encoded keys `key_stem` + `_lex_index(i)` for each i in `indices`."""
+
+  indices = np.asarray(indices).reshape(-1)
+  key_stem = key_stem.encode()
+
+  if len(indices) == 0:
+    return []
+
+  if (indices.min() < 0 or
+      indices.max() > MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX):
+    # Suffixes outside the fixed width don't vectorize, fall back to
+    # building these one at a time.
+    return [key_stem + _lex_index(int(idx)).encode() for idx in indices]
+
+  tag_length = len(str(MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX))
+  key_length = len(key_stem) + tag_length
+
+  keys = np.empty((len(indices), key_length), dtype=np.uint8)
+  keys[:, :len(key_stem)] = np.frombuffer(key_stem, dtype=np.uint8)
+  keys[:, len(key_stem):] = _lex_indices(indices)
+
+  return keys.view("S{}".format(key_length)).reshape(-1).tolist()
 
 
 def make_audio_key(table_prefix, shard_id, video_id, audio_block_id):
@@ -465,6 +1162,12 @@ def make_audio_key(table_prefix, shard_id, video_id, audio_block_id):
   return "{}_{}".format(key, tag).encode()
 
 
+def make_audio_keys(table_prefix, shard_id, video_id, audio_block_ids):
+  """Batched `make_audio_key` over an array of `audio_block_ids`."""
+  key_stem = "{}_{}_{}_audio_".format(table_prefix, shard_id, video_id)
+  return _make_keys(key_stem, audio_block_ids)
+
+
 def make_frame_key(table_prefix, shard_id, video_id, frame_id):
 
   max_allowable_suffix = MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX
@@ -476,6 +1179,12 @@ def make_frame_key(table_prefix, shard_id, video_id, frame_id):
   return "{}_{}".format(key, tag).encode()
 
 
+def make_frame_keys(table_prefix, shard_id, video_id, frame_ids):
+  """Batched `make_frame_key` over an array of `frame_ids`."""
+  key_stem = "{}_{}_{}_frame_".format(table_prefix, shard_id, video_id)
+  return _make_keys(key_stem, frame_ids)
+
+
 def make_shard_meta_key(table_prefix, shard_id):
   """Construct the key for an individual shard's meta."""
   key = "{}_meta_{}".format(table_prefix, _lex_index(shard_id))
@@ -523,9 +1232,122 @@ def make_video_meta_last_key(table_prefix, shard_id, num_videos):
   return key
 
 
+class PrefetchStats(object):
+  """Records how long consumers of a prefetching generator waited."""
+
+  def __init__(self):
+    self.num_samples = 0
+    self.total_wait_secs = 0.0
+    self.max_wait_secs = 0.0
+
+  def record_wait(self, wait_secs):
+    self.num_samples += 1
+    self.total_wait_secs += wait_secs
+    self.max_wait_secs = max(self.max_wait_secs, wait_secs)
+
+  @property
+  def mean_wait_secs(self):
+    if self.num_samples == 0:
+      return 0.0
+    return self.total_wait_secs / self.num_samples
+
+  def as_dict(self):
+    return {
+        "num_samples": self.num_samples,
+        "total_wait_secs": self.total_wait_secs,
+        "mean_wait_secs": self.mean_wait_secs,
+        "max_wait_secs": self.max_wait_secs
+    }
+
+
+def _decode_frames(values, frame_keys, codec):
+  """Decode the `values` of `frame_keys` into a (num_frames, -1) array.
+
+  Args:
+    values(dict): Encoded frame values keyed by (bytes) row key.
+    frame_keys(list): The (bytes) keys of the frames, in the order in
+      which they should be returned; may contain duplicates.
+    codec(codec_utils.Codec): The codec with which frames were written.
+
+  """
+
+  unique_keys = list(collections.OrderedDict.fromkeys(frame_keys))
+
+  missing = [key for key in unique_keys if key not in values]
+  if missing:
+    msg = "Frame data query for keys {} got None.".format(missing)
+    raise ValueError(msg)
+
+  decoded = {key: codec.decode(values[key]) for key in unique_keys}
+
+  frame_size = len(decoded[frame_keys[0]])
+  frames = np.empty((len(frame_keys), frame_size), dtype=codec.dtype)
+
+  for i, frame_key in enumerate(frame_keys):
+
+    frame_data = decoded[frame_key]
+
+    if len(frame_data) != frame_size:
+      msg = "Frame data for key {} has length {}, expected {}.".format(
+          frame_key, len(frame_data), frame_size)
+      raise ValueError(msg)
+
+    frames[i] = frame_data
+
+  return frames
+
+
+def _decode_audio(values, audio_keys, audio_block_meta, codec):
+  """Decode the `values` of contiguous `audio_keys` and slice out a sample.
+
+  Blocks are decoded into a buffer sized for `len(audio_keys)` blocks and
+  sliced to `query_start:query_end` of `audio_block_meta`.
+
+  """
+
+  missing = [key for key in audio_keys if key not in values]
+  if missing:
+    msg = "Audio data query got None, {}".format(missing)
+    raise ValueError(msg)
+
+  query_start = audio_block_meta["query_start"]
+  query_end = audio_block_meta["query_end"]
+
+  blocks = [codec.decode(values[audio_key]) for audio_key in audio_keys]
+
+  # Only the last block of a video can be shorter than the rest.
+  block_size = audio_block_meta.get("block_size", len(blocks[0]))
+  all_audio_data = np.empty((len(audio_keys) * block_size,), dtype=codec.dtype)
+  offset = 0
+
+  for block in blocks:
+    all_audio_data[offset:offset + len(block)] = block
+    offset += len(block)
+
+  ret = all_audio_data[query_start:min(query_end, offset)]
+
+  length = len(ret)
+
+  if length == 0:
+
+    msg = "Wrong length: {}; response len: {}; block meta: {}".format(
+        length, offset, audio_block_meta)
+    raise ValueError(msg)
+
+  return ret
+
+
 class RawVideoSelection(BigTableSelection):
 
   def __init__(self, *args, **kwargs):
+    """A selection of raw video frames, audio and their metadata.
+
+    Accepts the arguments of `BigTableSelection` (less `column_families`)
+    and optionally a `block_cache` (e.g. `cache_utils.LRUBlockCache`)
+    consulted by frame and audio lookups before reading from Bigtable.
+
+    """
+    self.block_cache = kwargs.pop("block_cache", None)
     super(RawVideoSelection, self).__init__(
         # Defining these here instead of each time
         # the object is created makes this less
@@ -552,7 +1374,11 @@ class RawVideoSelection(BigTableSelection):
                  column="meta",
                  value=json.dumps(shard_meta.as_dict()),
                  timestamp=datetime.datetime(1970, 1, 1))
-    self.table.mutate_rows([row])
+    status = self.table.mutate_rows([row])[0]
+    if status.code != 0:
+      msg = "Failed to write meta for shard {}, status code {}.".format(
+          shard_meta.shard_id, status.code)
+      raise ValueError(msg)
 
   def lookup_shard_metadata(self, num_shards=99999, ignore_unfinished=False):
     if not isinstance(self.prefix, str):
@@ -567,12 +1393,11 @@ class RawVideoSelection(BigTableSelection):
 
     prefix = make_shard_meta_common_prefix(table_prefix=self.prefix)
 
-    partial_rows = self.table.read_rows(
+    partial_rows = self._read_rows(
+        op="lookup_shard_metadata",
         start_key=make_shard_meta_first_key(self.prefix),
-        end_key=make_shard_meta_last_key(self.prefix, num_shards))
-
-    if partial_rows is None:
-      return metadata
+        end_key=make_shard_meta_last_key(self.prefix, num_shards),
+        limit=num_shards)
 
     for i, row in enumerate(partial_rows):
 
@@ -599,12 +1424,8 @@ class RawVideoSelection(BigTableSelection):
 
     return metadata
 
-  def _lookup_all_video_metadata(self, num_shards=1):
-
-    all_shard_meta = self.lookup_shard_metadata(num_shards=num_shards,
-                                                ignore_unfinished=True)
-
-    all_video_meta = []
+  def _lookup_shard_video_metadata(self, shard_id):
+    """Scan the metadata of all videos written to shard `shard_id`."""
 
     # HACK: Currently the regex filter approach isn't yielding the correct list of videos.
     # But specifying the start and end key does. The only problem is that row keys are
@@ -613,31 +1434,83 @@ class RawVideoSelection(BigTableSelection):
     # letter alternative.
     num_videos = 99999999
 
-    for shard_meta_key, shard_meta in all_shard_meta.items():
+    start_key = make_video_meta_first_key(self.prefix, shard_id)
+    end_key = make_video_meta_last_key(self.prefix, shard_id, num_videos)
+
+    partial_rows = self._read_rows(op="lookup_video_metadata",
+                                   start_key=start_key,
+                                   end_key=end_key)
+
+    shard_video_meta = []
 
-      shard_id = shard_meta._shard_id
-      #num_videos = shard_meta._num_videos
-      meta_prefix = make_video_meta_common_prefix(self.prefix, shard_id)
-      start_key = make_video_meta_first_key(self.prefix, shard_id)
-      end_key = make_video_meta_last_key(self.prefix, shard_id, num_videos)
+    for row in partial_rows:
 
-      partial_rows = self.table.read_rows(start_key=start_key, end_key=end_key)
+      value = row.cells["meta"]["meta".encode()][0].value.decode()
+      shard_video_meta.append(VideoMeta.from_dict(json.loads(value)))
 
-      for row in partial_rows:
+    return shard_video_meta
 
-        value = row.cells["meta"]["meta".encode()][0].value.decode()
-        video_meta = json.loads(value)
+  def _lookup_all_video_metadata(self, num_shards=1):
 
-        vm = VideoMeta(video_length=video_meta["video_length"],
-                       audio_length=video_meta["audio_length"],
-                       video_id=video_meta["video_id"],
-                       shard_id=video_meta["shard_id"],
-                       audio_block_size=video_meta["audio_block_size"])
+    all_shard_meta = self.lookup_shard_metadata(num_shards=num_shards,
+                                                ignore_unfinished=True)
 
-        all_video_meta.append(vm)
+    all_video_meta = []
+
+    for shard_meta_key, shard_meta in all_shard_meta.items():
+
+      all_video_meta.extend(
+          self._lookup_shard_video_metadata(shard_meta.shard_id))
 
     return all_video_meta
 
+  def build_video_meta_index(self, num_shards=1, previous=None):
+    """Build a `VideoMetaIndex` of the videos in finished shards.
+
+    Args:
+      num_shards(int): The number of shards to consider, as for
+        `_lookup_all_video_metadata`.
+      previous(VideoMetaIndex): Optionally a previously built index from
+        which to reuse the rows of shards whose `VideoShardMeta` is
+        unchanged; only the remaining shards are re-scanned.
+
+    Returns:
+      VideoMetaIndex: The index.
+
+    """
+
+    all_shard_meta = self.lookup_shard_metadata(num_shards=num_shards,
+                                                ignore_unfinished=True)
+
+    parts = []
+    shard_meta = {}
+    num_scanned = 0
+
+    for _, meta in sorted(all_shard_meta.items()):
+
+      meta_dict = meta.as_dict()
+      shard_meta[str(meta.shard_id)] = meta_dict
+
+      if (previous is not None and
+          previous.shard_meta.get(str(meta.shard_id)) == meta_dict):
+        parts.append(previous.shard_records(meta.shard_id))
+        continue
+
+      parts.append(
+          _video_meta_to_records(
+              self._lookup_shard_video_metadata(meta.shard_id)))
+      num_scanned += 1
+
+    tf.logging.info("Built video meta index, scanned {} of {} shards.".format(
+        num_scanned, len(shard_meta)))
+
+    if parts:
+      records = np.concatenate(parts)
+    else:
+      records = np.empty((0,), dtype=VIDEO_META_INDEX_DTYPE)
+
+    return VideoMetaIndex(records=records, shard_meta=shard_meta)
+
   def _lookup_video_metadata(self, prefix, shard_id, video_id):
 
     key = make_video_meta_key(table_prefix=prefix,
@@ -647,17 +1520,14 @@ class RawVideoSelection(BigTableSelection):
     msg = "looking up metadata for video with key {}, shard {}, video {}".format(
         key, shard_id, video_id)
 
-    row = self.table.read_row(key)
+    row = self._read_row(key, op="lookup_video_metadata")
+    if row is None:
+      raise ValueError("No video metadata found at key {}.".format(key))
     value = row.cells["meta"]["meta".encode()][0].value.decode()
-    video_meta = json.loads(value)
 
-    return VideoMeta(video_length=video_meta["video_length"],
-                     audio_length=video_meta["audio_length"],
-                     video_id=video_meta["video_id"],
-                     shard_id=video_meta["shard_id"],
-                     audio_block_size=video_meta["audio_block_size"])
+    return VideoMeta.from_dict(json.loads(value))
 
-  def _get_random_video_meta(self, shard_meta):
+  def _get_random_video_meta(self, shard_meta, max_attempts=10):
 
     if not isinstance(shard_meta, dict):
       msg = "Expected meta dictionary, saw type {}.".format(type(shard_meta))
@@ -670,21 +1540,21 @@ class RawVideoSelection(BigTableSelection):
     and shard indices that have not been written).
     
     """
-    while True:
+    for _ in range(max_attempts):
 
-      try:
+      num_keys = len(list(shard_meta.keys()))
+      sampled_shard_index = np.random.randint(0, num_keys)
 
-        num_keys = len(list(shard_meta.keys()))
-        sampled_shard_index = np.random.randint(0, num_keys)
+      shard_meta_key = list(shard_meta.keys())[sampled_shard_index]
+      sampled_shard_meta = shard_meta[shard_meta_key]
 
-        shard_meta_key = list(shard_meta.keys())[sampled_shard_index]
-        sampled_shard_meta = shard_meta[shard_meta_key]
+      videos_per_sampled_shard = sampled_shard_meta.num_videos
+      sampled_video_index = np.random.randint(0, videos_per_sampled_shard)
 
-        videos_per_sampled_shard = sampled_shard_meta.num_videos
-        sampled_video_index = np.random.randint(0, videos_per_sampled_shard)
+      tf.logging.debug("sampled shard index: {}".format(sampled_shard_index))
+      tf.logging.debug("sampled video index: {}".format(sampled_video_index))
 
-        tf.logging.debug("sampled shard index: {}".format(sampled_shard_index))
-        tf.logging.debug("sampled video index: {}".format(sampled_video_index))
+      try:
 
         # Look up the length of the video
         meta = self._lookup_video_metadata(prefix=self.prefix,
@@ -693,181 +1563,506 @@ class RawVideoSelection(BigTableSelection):
 
         return meta
 
-      except:
+      except (ValueError,) + read_policy_utils.RETRYABLE_ERRORS:
         tf.logging.info(
             "Failed fetching meta for video and shard, will retry: {},  {}".
             format(sampled_video_index, sampled_shard_index))
 
-  def write_av(self, frames, audio, shard_id, video_id, audio_block_size=1000):
+    msg = "Failed to fetch the metadata of a random video in {} attempts.".format(
+        max_attempts)
+    raise ValueError(msg)
+
+  def write_av(self,
+               frames,
+               audio,
+               shard_id,
+               video_id,
+               audio_block_size=1000,
+               frame_codec="raw",
+               audio_codec="raw"):
 
-    if not isinstance(frames, video_utils.Video):
-      msg = "expected frames of type {}, saw {}.".format(
-          video_utils.Video, type(frames))
+    if not isinstance(frames, (video_utils.Video, video_utils.ArrayVideo)):
+      msg = "expected frames of type {} or {}, saw {}.".format(
+          video_utils.Video, video_utils.ArrayVideo, type(frames))
       raise ValueError(msg)
 
-    meta = VideoMeta(video_length=frames.length,
-                     audio_length=len(audio),
-                     shard_id=shard_id,
-                     video_id=video_id,
-                     audio_block_size=audio_block_size)
+    self.write_av_stream(frames=frames.get_iterator(),
+                         audio=audio,
+                         shard_id=shard_id,
+                         video_id=video_id,
+                         audio_block_size=audio_block_size,
+                         frame_codec=frame_codec,
+                         audio_codec=audio_codec)
+
+  def write_av_stream(self,
+                      frames,
+                      audio,
+                      shard_id,
+                      video_id,
+                      audio_block_size=1000,
+                      max_batch_bytes=4 * 1024 * 1024,
+                      max_in_flight=4,
+                      max_retries=3,
+                      frame_codec="raw",
+                      audio_codec="raw"):
+    """Write a video's frames and audio to the table as they stream in.
+
+    Only the rows of the batches in flight are held in memory so videos
+    need not fit in RAM. The video's metadata row is written last, once
+    all of its frames and audio have been written.
+
+    Args:
+      frames(iterable): Frame arrays, e.g. from `video_utils.stream_mp4`.
+      audio(np.ndarray or iterable): An audio array, e.g. from
+        `audio_utils.mp4_to_1d_array`, or an iterable of 1D chunks of one.
+      shard_id(int): The shard to which the video belongs.
+      video_id(int): The id of the video within its shard.
+      audio_block_size(int): The number of audio samples per audio row.
+      max_batch_bytes(int): The approximate size of each `mutate_rows`.
+      max_in_flight(int): The number of concurrent `mutate_rows` calls.
+      max_retries(int): The number of times to retry failed rows.
+      frame_codec(str): The `codec_utils` codec with which to encode
+        frames, one of `codec_utils.FRAME_CODECS`.
+      audio_codec(str): The `codec_utils` codec with which to encode
+        audio blocks, one of `codec_utils.AUDIO_CODECS`.
+
+    """
+
+    if frame_codec not in codec_utils.FRAME_CODECS:
+      raise ValueError("Unsupported frame codec {}, expected one of {}.".format(
+          frame_codec, codec_utils.FRAME_CODECS))
+    if audio_codec not in codec_utils.AUDIO_CODECS:
+      raise ValueError("Unsupported audio codec {}, expected one of {}.".format(
+          audio_codec, codec_utils.AUDIO_CODECS))
 
-    video_meta_key = make_video_meta_key(table_prefix=self.prefix,
-                                         shard_id=shard_id,
-                                         video_id=video_id)
+    frame_encoder = codec_utils.get_codec(frame_codec)
+    audio_encoder = codec_utils.get_codec(audio_codec)
 
-    rows = []
+    writer = BatchedRowWriter(table=self.table,
+                              max_batch_bytes=max_batch_bytes,
+                              max_in_flight=max_in_flight,
+                              max_retries=max_retries)
 
-    rows.append(
-        _compose_av_write(table=self.table,
-                          key=video_meta_key,
-                          value=meta.as_dict(),
-                          column_family="meta"))
+    def _write(key, value, column_family, codec=None):
+      if codec is not None:
+        value = codec.encode(value)
+      else:
+        value = _encode_av_value(value)
+      writer.add(_compose_av_write(table=self.table,
+                                   key=key,
+                                   value=value,
+                                   column_family=column_family),
+                 num_bytes=len(value))
+
+    with writer:
+
+      if isinstance(audio, (np.ndarray, list)):
+        audio = [np.asarray(audio)]
+
+      audio_length = 0
+      num_audio_blocks = 0
+      remainder = None
+
+      for chunk in audio:
+
+        chunk = np.asarray(chunk)
+        if remainder is not None and len(remainder) > 0:
+          chunk = np.concatenate([remainder, chunk])
+
+        num_full_blocks = len(chunk) // audio_block_size
+        keys = make_audio_keys(table_prefix=self.prefix,
+                               shard_id=shard_id,
+                               video_id=video_id,
+                               audio_block_ids=np.arange(
+                                   num_audio_blocks,
+                                   num_audio_blocks + num_full_blocks))
+
+        for i, key in enumerate(keys):
+          subset_start = i * audio_block_size
+          _write(key, chunk[subset_start:subset_start + audio_block_size],
+                 "audio", audio_encoder)
+
+        num_audio_blocks += num_full_blocks
+        audio_length += num_full_blocks * audio_block_size
+        remainder = chunk[num_full_blocks * audio_block_size:]
+
+      if remainder is not None and len(remainder) > 0:
+        key = make_audio_key(table_prefix=self.prefix,
+                             shard_id=shard_id,
+                             video_id=video_id,
+                             audio_block_id=num_audio_blocks)
+        _write(key, remainder, "audio", audio_encoder)
+        audio_length += len(remainder)
+
+      video_length = 0
+      frame_shape = None
+
+      for i, video_frame in enumerate(frames):
+
+        frame_key = make_frame_key(table_prefix=self.prefix,
+                                   shard_id=shard_id,
+                                   video_id=video_id,
+                                   frame_id=i)
+
+        video_frame = np.asarray(video_frame)
+        if frame_shape is None:
+          frame_shape = video_frame.shape
+
+        _write(frame_key, video_frame, "video_frames", frame_encoder)
+        video_length += 1
+
+      if video_length == 0 or audio_length == 0:
+        msg = "Expected non-empty frames and audio, saw {} and {}.".format(
+            video_length, audio_length)
+        raise ValueError(msg)
 
-    num_audio_blocks = math.ceil(meta.audio_length / audio_block_size)
+      # Only write metadata, which makes the video visible to sampling,
+      # once all of its data has been written.
+      writer.flush()
 
-    for i in range(num_audio_blocks):
+      meta = VideoMeta(video_length=video_length,
+                       audio_length=audio_length,
+                       shard_id=shard_id,
+                       video_id=video_id,
+                       audio_block_size=audio_block_size,
+                       frame_codec=frame_codec,
+                       audio_codec=audio_codec,
+                       frame_shape=frame_shape)
 
-      subset_start = i * audio_block_size
-      subset_end = subset_start + audio_block_size
+      video_meta_key = make_video_meta_key(table_prefix=self.prefix,
+                                           shard_id=shard_id,
+                                           video_id=video_id)
 
-      audio_subset = audio[subset_start:subset_end]
+      _write(video_meta_key, meta.as_dict(), "meta")
 
-      key = make_audio_key(table_prefix=self.prefix,
-                           shard_id=shard_id,
-                           video_id=video_id,
-                           audio_block_id=i)
+  def _frame_keys_for_indices(self, indices, meta):
 
-      rows.append(
-          _compose_av_write(table=self.table,
-                            key=key,
-                            value=audio_subset,
-                            column_family="audio"))
+    assert isinstance(indices, np.ndarray)
+    assert isinstance(meta, VideoMeta)
 
-    _ = self.table.mutate_rows(rows)
-    rows = []
+    return make_frame_keys(table_prefix=self.prefix,
+                           shard_id=meta.shard_id,
+                           video_id=meta.video_id,
+                           frame_ids=indices)
 
-    frame_write_buffer_size = 32
-    buffer_counter = 0
+  def _audio_keys(self, meta, indices):
 
-    frame_iterator = frames.get_iterator()
-    for i, video_frame in enumerate(frame_iterator):
+    audio_block_meta = audio_blocks_for_indices(
+        start=indices[0], end=indices[-1], block_size=meta.audio_block_size)
 
-      video_frame = np.asarray(video_frame)
+    keys = make_audio_keys(
+        table_prefix=self.prefix,
+        shard_id=meta.shard_id,
+        video_id=meta.video_id,
+        audio_block_ids=np.arange(audio_block_meta["num_query_blocks"]) +
+        audio_block_meta["min_query_block"])
 
-      frame_key = make_frame_key(table_prefix=self.prefix,
-                                 shard_id=shard_id,
-                                 video_id=video_id,
-                                 frame_id=i)
+    return keys, audio_block_meta
 
-      rows.append(
-          _compose_av_write(table=self.table,
-                            key=frame_key,
-                            value=video_frame,
-                            column_family="video_frames"))
-      buffer_counter += 1
+  def _read_cached_values(self, keys, column_family, contiguous=False):
+    """Read the `column_family` cell values for `keys`, via the block cache.
 
-      if buffer_counter >= frame_write_buffer_size:
-        _ = self.table.mutate_rows(rows)
-        rows = []
-        buffer_counter = 0
+    Keys missing from `self.block_cache` (all keys when there is no cache)
+    are read in one request: a `RowSet` of the missing keys or, when
+    `contiguous`, a single key range spanning them.
 
-    if buffer_counter > 0:
-      _ = self.table.mutate_rows(rows)
+    Returns:
+      dict: Cell values keyed by row key; absent rows are omitted.
 
-  def _frame_keys_for_indices(self, indices, meta):
+    """
 
-    assert isinstance(indices, np.ndarray)
-    assert isinstance(meta, VideoMeta)
+    values = {}
 
-    frame_keys = []
+    if self.block_cache is not None:
+      for key in keys:
+        value = self.block_cache.get(key)
+        if value is not None:
+          values[key] = value
 
-    for i in range(len(indices)):
+    missing = [key for key in keys if key not in values]
 
-      index = indices[i]
+    if not missing:
+      return values
 
-      frame_key = make_frame_key(table_prefix=self.prefix,
-                                 shard_id=meta.shard_id,
-                                 video_id=meta.video_id,
-                                 frame_id=index)
+    op = "read_{}".format(column_family)
 
-      frame_keys.append(frame_key)
+    if contiguous:
+      partial_rows = self._read_rows(op=op,
+                                     start_key=missing[0],
+                                     end_key=missing[-1],
+                                     end_inclusive=True)
+    else:
+      row_set = cbt_lib_row_set.RowSet()
+      for key in missing:
+        row_set.add_row_key(key)
+      partial_rows = self._read_rows(op=op, row_set=row_set)
 
-    return frame_keys
+    for row in partial_rows:
+      value = row.cells[column_family][column_family.encode()][0].value
+      values[row.row_key] = value
+      if self.block_cache is not None:
+        self.block_cache.put(row.row_key, value)
 
-  def _audio_keys(self, meta, indices):
+    return values
 
-    audio_block_meta = audio_blocks_for_indices(
-        start=indices[0], end=indices[-1], block_size=meta.audio_block_size)
+  def _lookup_frame_data(self, frame_keys, batched=True, meta=None):
+    """Look up frame data for `frame_keys`, preserving their order.
+
+    By default all frames not already in the block cache are fetched with
+    a single `read_rows` call over a `RowSet` of the requested keys and
+    written directly into one preallocated (num_frames, H*W*C) uint8 array.
+    With `batched=False` each frame is fetched with its own `read_row` call.
 
-    keys = []
+    Frames are decoded with the `frame_codec` of `meta`, the `VideoMeta`
+    of the video to which they belong, or as raw bytes if it's None.
 
-    for i in range(audio_block_meta["num_query_blocks"]):
+    """
 
-      audio_key = make_audio_key(
-          table_prefix=self.prefix,
-          shard_id=meta.shard_id,
-          video_id=meta.video_id,
-          audio_block_id=audio_block_meta["min_query_block"] + i)
+    codec = codec_utils.get_codec(meta.frame_codec if meta else "raw")
 
-      keys.append(audio_key)
+    if not batched:
+      return self._lookup_frame_data_per_row(frame_keys, codec=codec)
 
-    return keys, audio_block_meta
+    frame_keys = [_maybe_encode_str(key) for key in frame_keys]
 
-  def _lookup_frame_data(self, frame_keys):
+    # Rows are returned in key order rather than request order so look
+    # each requested key back up by name.
+    unique_keys = list(collections.OrderedDict.fromkeys(frame_keys))
+    values = self._read_cached_values(unique_keys, column_family="video_frames")
+
+    return _decode_frames(values, frame_keys, codec)
+
+  def _lookup_frame_data_per_row(self, frame_keys, codec=None):
+
+    if codec is None:
+      codec = codec_utils.get_codec("raw")
 
     frames = np.asarray([None for _ in frame_keys])
 
     for i, frame_key in enumerate(frame_keys):
 
-      row = self.table.read_row(frame_key)
+      row = self._read_row(frame_key, op="read_video_frames")
 
       if row is None:
         msg = "Frame data query for key {} got None.".format(frame_key)
         raise ValueError(msg)
 
       frame_data = row.cells["video_frames"]["video_frames".encode()][0].value
-      frames[i] = np.asarray(list(frame_data), dtype=np.uint8)
+      frames[i] = codec.decode(frame_data)
 
     return np.asarray([np.asarray(thing) for thing in frames])
 
-  def _lookup_audio_data(self, audio_keys, audio_block_meta):
+  def _lookup_audio_data(self, audio_keys, audio_block_meta, meta=None):
+    """Look up the audio samples described by `audio_block_meta`.
+
+    Audio blocks for a sample have consecutive ids so, while their keys
+    also sort contiguously, those not already in the block cache are read
+    with a single start/end key range scan. Block ids past
+    `MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX` widen the key suffix and break
+    that ordering, in which case the exact keys are read instead. They
+    are decoded with the `audio_codec` of `meta` (raw if it's None) into a
+    buffer sized for `num_query_blocks` blocks and sliced to
+    `query_start:query_end`. Raw values are returned as uint8, as written.
 
-    query_start = audio_block_meta["query_start"]
-    query_end = audio_block_meta["query_end"]
+    """
 
-    all_audio_data = np.array([])
+    codec = codec_utils.get_codec(meta.audio_codec if meta else "raw")
 
-    for audio_key in audio_keys:
+    audio_keys = [_maybe_encode_str(key) for key in audio_keys]
 
-      row = self.table.read_row(audio_key)
+    # Suffixes are fixed width only for block ids up to the maximum.
+    tag_length = len(str(MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX))
+    contiguous = (audio_keys == sorted(audio_keys) and all(
+        len(key.rsplit(b"_", 1)[-1]) == tag_length for key in audio_keys))
 
-      if row is None:
-        msg = "Audio data query got None, {}".format(audio_key)
-        raise ValueError(msg)
+    values = self._read_cached_values(audio_keys,
+                                      column_family="audio",
+                                      contiguous=contiguous)
+
+    return _decode_audio(values, audio_keys, audio_block_meta, codec)
 
-      value = row.cells["audio"]["audio".encode()][0].value
-      data = np.asarray(list(value), dtype=np.uint8)
+  def _sample_example_set(self,
+                          all_video_meta,
+                          frames_per_video,
+                          max_frame_shift=0,
+                          max_frame_skip=0,
+                          keys_only=False,
+                          rng=None):
+    """Sample one set of AV correspondence examples.
 
-      all_audio_data = np.concatenate([all_audio_data, data])
+    Args:
+      all_video_meta(list): The `VideoMeta` of the videos to sample from,
+        or a `VideoMetaIndex`.
+      frames_per_video(int): The number of frames per sampled video.
+      max_frame_shift(int): See `AVSamplable.sample_av_pair`.
+      max_frame_skip(int): See `AVSamplable.sample_av_pair`.
+      keys_only(bool): Whether to skip looking up frame and audio data.
+      rng(np.random.RandomState): Optional source of randomness, defaults
+        to the global `np.random` state.
 
-    ret = all_audio_data[query_start:query_end]
+    Returns:
+      dict: AVCorrespondenceSample's keyed by example type.
 
-    length = len(ret)
+    """
 
-    if not isinstance(ret, np.ndarray) or length == 0:
+    rng = rng if rng is not None else np.random
 
-      msg = "Wrong type or length: {}, {}; response len: {}; other: {}".format(
-          type(ret), length, len(all_audio_data), _logging_data())
-      raise ValueError(msg)
+    num_videos = len(all_video_meta)
 
-    return ret
+    #v0 = self._get_random_video_meta(all_shard_meta)
+    #v1 = self._get_random_video_meta(all_shard_meta)
+    v0i, v1i = rng.randint(0, num_videos, 2)
+    v0 = all_video_meta[v0i]
+    v1 = all_video_meta[v1i]
+
+    def _sample(vlen, alen):
+      avs = video_utils.AVSamplable(video_length=vlen,
+                                    audio_length=alen,
+                                    rng=rng)
+      return avs.sample_av_pair(num_frames=frames_per_video,
+                                max_frame_shift=max_frame_shift,
+                                max_frame_skip=max_frame_skip)
+
+    # Get indices for two samples from the first video
+    # The first one frames and audio
+    f00_, a00_, sampling_meta00 = _sample(v0.video_length, v0.audio_length)
+    # and the second one only audio
+    _, a01_, sampling_meta01 = _sample(v0.video_length, v0.audio_length)
+
+    # Then sample audio indices from the second video
+    _, a10_, sampling_meta10 = _sample(v1.video_length, v1.audio_length)
+
+    kf00 = self._frame_keys_for_indices(f00_, meta=v0)
+
+    ka00, abm00 = self._audio_keys(meta=v0, indices=a00_)
+    ka01, abm01 = self._audio_keys(meta=v0, indices=a01_)
+    ka10, abm10 = self._audio_keys(meta=v1, indices=a10_)
+
+    positive_same = AVCorrespondenceSample(
+        video=np.array([]),
+        audio=np.array([]),
+        labels={
+            "same_video": 1,
+            "overlap": 1
+        },
+        meta={
+            "video_source": v0,
+            "audio_source": v0,
+            "video_sample_meta": sampling_meta00,
+            "audio_sample_meta": sampling_meta00,
+            "audio_keys": ka00,
+            "frame_keys": kf00,
+            "audio_block_meta": abm00
+        })
+
+    negative_same = AVCorrespondenceSample(
+        video=np.array([]),
+        audio=np.array([]),
+        labels={
+            "same_video": 1,
+            "overlap": 0
+        },
+        meta={
+            "video_source": v0,
+            "audio_source": v0,
+            "video_sample_meta": sampling_meta00,
+            "audio_sample_meta": sampling_meta01,
+            "audio_keys": ka01,
+            "frame_keys": kf00,
+            "audio_block_meta": abm01
+        })
+
+    negative_different = AVCorrespondenceSample(
+        video=np.array([]),
+        audio=np.array([]),
+        labels={
+            "same_video": 0,
+            "overlap": 0
+        },
+        meta={
+            "video_source": v0,
+            "audio_source": v1,
+            "video_sample_meta": sampling_meta00,
+            "audio_sample_meta": sampling_meta10,
+            "audio_keys": ka10,
+            "frame_keys": kf00,
+            "audio_block_meta": abm10
+        })
+
+    example_set = {
+        "positive_same": positive_same,
+        "negative_same": negative_same,
+        #"negative_different": negative_different
+    }
+
+    if keys_only:
+      return example_set
+
+    # Then look up the actual frame and audio data for those sampled indices
+    # (from bigtable).
+    f00 = self._lookup_frame_data(kf00, meta=v0)
+
+    a00 = self._lookup_audio_data(audio_keys=ka00,
+                                  audio_block_meta=abm00,
+                                  meta=v0)
+    a01 = self._lookup_audio_data(audio_keys=ka01,
+                                  audio_block_meta=abm01,
+                                  meta=v0)
+    a10 = self._lookup_audio_data(audio_keys=ka10,
+                                  audio_block_meta=abm10,
+                                  meta=v1)
+
+    # Lastly store the sampled data in nice organized AVCorrespondenceSample
+    # objects.
+
+    example_set["positive_same"].video = f00
+    example_set["positive_same"].audio = a00
+
+    example_set["negative_same"].video = f00
+    example_set["negative_same"].audio = a01
+
+    #example_set["negative_different"].video = f00
+    #example_set["negative_different"].audio = a10
+
+    return example_set
 
   def sample_av_correspondence_examples(self,
                                         frames_per_video,
                                         max_num_samples=None,
                                         max_frame_shift=0,
                                         max_frame_skip=0,
-                                        keys_only=False):
+                                        keys_only=False,
+                                        num_prefetch_workers=0,
+                                        prefetch_queue_depth=None,
+                                        seed=None,
+                                        prefetch_stats=None,
+                                        video_meta_index=None):
+    """Generate sets of AV correspondence examples.
+
+    When `num_prefetch_workers` > 0 example sets are sampled and looked up
+    by that many worker threads, keeping up to `prefetch_queue_depth`
+    completed sets in memory, and are yielded in the order they complete.
+    Worker `i` samples from `np.random.RandomState(seed + i)` when a seed
+    is given.
+
+    Args:
+      frames_per_video(int): The number of frames per sampled video.
+      max_num_samples(int): The number of example sets to generate,
+        unbounded if None.
+      max_frame_shift(int): See `AVSamplable.sample_av_pair`.
+      max_frame_skip(int): See `AVSamplable.sample_av_pair`.
+      keys_only(bool): Whether to only yield sampled keys.
+      num_prefetch_workers(int): The number of prefetching threads, zero
+        to sample serially.
+      prefetch_queue_depth(int): The maximum number of completed example
+        sets held in memory, defaults to 2 * `num_prefetch_workers`.
+      seed(int): Optional base seed for sampling.
+      prefetch_stats(PrefetchStats): Optional object in which to record
+        how long the consumer waited on each example set.
+      video_meta_index(VideoMetaIndex): Optional index of the videos to
+        sample from, by default video metadata is scanned from the table.
+
+    """
 
     #make_video_meta_common_prefix(table_prefix, shard_id)
 
@@ -876,126 +2071,464 @@ class RawVideoSelection(BigTableSelection):
     # TODO: Provide more clear logging in the event there aren't any completed
     # shards.
 
-    all_video_meta = self._lookup_all_video_metadata()
-    num_videos = len(all_video_meta)
+    if video_meta_index is not None:
+      all_video_meta = video_meta_index
+    else:
+      all_video_meta = self._lookup_all_video_metadata()
+
+    sample_kwargs = {
+        "all_video_meta": all_video_meta,
+        "frames_per_video": frames_per_video,
+        "max_frame_shift": max_frame_shift,
+        "max_frame_skip": max_frame_skip,
+        "keys_only": keys_only
+    }
+
+    if num_prefetch_workers > 0:
+      for example_set in self._prefetch_example_sets(
+          sample_kwargs=sample_kwargs,
+          max_num_samples=max_num_samples,
+          num_workers=num_prefetch_workers,
+          queue_depth=prefetch_queue_depth,
+          seed=seed,
+          stats=prefetch_stats):
+        yield example_set
+      return
+
+    rng = np.random.RandomState(seed) if seed is not None else np.random
 
     i = 0
     while True:
 
-      #v0 = self._get_random_video_meta(all_shard_meta)
-      #v1 = self._get_random_video_meta(all_shard_meta)
-      v0i, v1i = np.random.randint(0, num_videos, 2)
-      v0 = all_video_meta[v0i]
-      v1 = all_video_meta[v1i]
-
-      def _sample(vlen, alen):
-        avs = video_utils.AVSamplable(video_length=vlen, audio_length=alen)
-        return avs.sample_av_pair(num_frames=frames_per_video,
-                                  max_frame_shift=max_frame_shift,
-                                  max_frame_skip=max_frame_skip)
-
-      # Get indices for two samples from the first video
-      # The first one frames and audio
-      f00_, a00_, sampling_meta00 = _sample(v0.video_length, v0.audio_length)
-      # and the second one only audio
-      _, a01_, sampling_meta01 = _sample(v0.video_length, v0.audio_length)
-
-      # Then sample audio indices from the second video
-      _, a10_, sampling_meta10 = _sample(v1.video_length, v1.audio_length)
-
-      kf00 = self._frame_keys_for_indices(f00_, meta=v0)
-
-      ka00, abm00 = self._audio_keys(meta=v0, indices=a00_)
-      ka01, abm01 = self._audio_keys(meta=v0, indices=a01_)
-      ka10, abm10 = self._audio_keys(meta=v1, indices=a10_)
-
-      positive_same = AVCorrespondenceSample(
-          video=np.array([]),
-          audio=np.array([]),
-          labels={
-              "same_video": 1,
-              "overlap": 1
-          },
-          meta={
-              "video_source": v0,
-              "audio_source": v0,
-              "video_sample_meta": sampling_meta00,
-              "audio_sample_meta": sampling_meta00,
-              "audio_keys": ka00,
-              "frame_keys": kf00,
-              "audio_block_meta": abm00
-          })
-
-      negative_same = AVCorrespondenceSample(
-          video=np.array([]),
-          audio=np.array([]),
-          labels={
-              "same_video": 1,
-              "overlap": 0
-          },
-          meta={
-              "video_source": v0,
-              "audio_source": v0,
-              "video_sample_meta": sampling_meta00,
-              "audio_sample_meta": sampling_meta01,
-              "audio_keys": ka01,
-              "frame_keys": kf00,
-              "audio_block_meta": abm01
-          })
-
-      negative_different = AVCorrespondenceSample(
-          video=np.array([]),
-          audio=np.array([]),
-          labels={
-              "same_video": 0,
-              "overlap": 0
-          },
-          meta={
-              "video_source": v0,
-              "audio_source": v1,
-              "video_sample_meta": sampling_meta00,
-              "audio_sample_meta": sampling_meta10,
-              "audio_keys": ka10,
-              "frame_keys": kf00,
-              "audio_block_meta": abm10
-          })
-
-      example_set = {
-          "positive_same": positive_same,
-          "negative_same": negative_same,
-          #"negative_different": negative_different
-      }
+      yield self._sample_example_set(rng=rng, **sample_kwargs)
 
-      if keys_only:
-        yield example_set
-      else:
+      i += 1
 
-        # Then look up the actual frame and audio data for those sampled indices
-        # (from bigtable).
-        f00 = self._lookup_frame_data(kf00)
+      if max_num_samples and max_num_samples <= i:
+        break
 
-        a00 = self._lookup_audio_data(audio_keys=ka00, audio_block_meta=abm00)
-        a01 = self._lookup_audio_data(audio_keys=ka01, audio_block_meta=abm01)
-        a10 = self._lookup_audio_data(audio_keys=ka10, audio_block_meta=abm10)
+  def _prefetch_example_sets(self,
+                             sample_kwargs,
+                             max_num_samples=None,
+                             num_workers=4,
+                             queue_depth=None,
+                             seed=None,
+                             stats=None):
+    """Sample example sets on worker threads, yielding as they complete."""
+
+    if queue_depth is None:
+      queue_depth = 2 * num_workers
+    if queue_depth <= 0:
+      raise ValueError("Expected queue_depth > 0, saw {}.".format(queue_depth))
+
+    # Bounds the number of completed example sets held in memory; each
+    # worker additionally holds at most the one it is building.
+    ready = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    lock = threading.Lock()
+    num_claimed = [0]
+
+    def _claim():
+      with lock:
+        if max_num_samples and num_claimed[0] >= max_num_samples:
+          return False
+        num_claimed[0] += 1
+        return True
 
-        # Lastly store the sampled data in nice organized AVCorrespondenceSample
-        # objects.
+    def _put(item):
+      while not stop.is_set():
+        try:
+          ready.put(item, timeout=0.1)
+          return True
+        except queue.Full:
+          continue
+      return False
+
+    def _work(worker_index):
+      worker_seed = None if seed is None else seed + worker_index
+      rng = np.random.RandomState(worker_seed)
+      try:
+        while not stop.is_set() and _claim():
+          if not _put(
+              (self._sample_example_set(rng=rng, **sample_kwargs), None)):
+            return
+      except Exception as e:
+        _put((None, e))
+        return
+      _put((None, None))
+
+    workers = []
+    for worker_index in range(num_workers):
+      worker = threading.Thread(target=_work, args=(worker_index,))
+      worker.daemon = True
+      worker.start()
+      workers.append(worker)
+
+    num_finished = 0
+
+    try:
+      while num_finished < num_workers:
 
-        example_set["positive_same"].video = f00
-        example_set["positive_same"].audio = a00
+        wait_start = time.time()
+        example_set, err = ready.get()
+        wait_secs = time.time() - wait_start
 
-        example_set["negative_same"].video = f00
-        example_set["negative_same"].audio = a01
+        if err is not None:
+          raise err
 
-        #example_set["negative_different"].video = f00
-        #example_set["negative_different"].audio = a10
+        if example_set is None:
+          num_finished += 1
+          continue
+
+        if stats is not None:
+          stats.record_wait(wait_secs)
 
         yield example_set
 
-      i += 1
+    finally:
+      stop.set()
+      for worker in workers:
+        worker.join()
+
+  def write_sampling_plan(self,
+                          plan_path,
+                          num_example_sets,
+                          frames_per_video,
+                          max_frame_shift=0,
+                          max_frame_skip=0,
+                          seed=None,
+                          video_meta_index=None):
+    """Write a keys-only sampling plan, one JSON line per example.
+
+    The first phase of bulk materialization: examples are sampled as by
+    `sample_av_correspondence_examples` with `keys_only=True` and each is
+    written as its `AVCorrespondenceSample.dump_plan` along with its
+    "exampleType". The plan is fetched with `materialize_sampling_plan`.
+
+    Returns:
+      int: The number of examples written to the plan.
 
-      if max_num_samples and max_num_samples <= i:
-        break
+    """
+
+    if num_example_sets <= 0:
+      raise ValueError(
+          "Expected num_example_sets > 0, saw {}.".format(num_example_sets))
+
+    example_sets = self.sample_av_correspondence_examples(
+        frames_per_video=frames_per_video,
+        max_num_samples=num_example_sets,
+        max_frame_shift=max_frame_shift,
+        max_frame_skip=max_frame_skip,
+        keys_only=True,
+        seed=seed,
+        video_meta_index=video_meta_index)
+
+    num_examples = 0
+
+    with tf.gfile.Open(plan_path, "w") as f:
+      for example_set in example_sets:
+        for example_type in sorted(example_set.keys()):
+          entry = example_set[example_type].dump_plan()
+          entry["exampleType"] = example_type
+          f.write(json.dumps(entry) + "\n")
+          num_examples += 1
+
+    return num_examples
+
+  def _read_sorted_keys(self,
+                        keys,
+                        column_family,
+                        max_keys_per_read,
+                        stats=None):
+    """Read deduplicated `keys` in key order, `max_keys_per_read` at a time."""
+
+    keys = sorted(set(keys))
+    values = {}
+
+    for start in range(0, len(keys), max_keys_per_read):
+      values.update(
+          self._read_cached_values(keys[start:start + max_keys_per_read],
+                                   column_family=column_family))
+      if stats is not None:
+        stats.num_read_calls += 1
+
+    return values
+
+  def _read_plan_values(self,
+                        entries,
+                        max_keys_per_read=1000,
+                        stats=None,
+                        previous_keys=None):
+    """Read the deduplicated frame and audio values of plan `entries`.
+
+    Args:
+      entries(list): Sampling plan entries.
+      max_keys_per_read(int): The maximum number of keys per read.
+      stats(MaterializeStats): Optional object in which to record stats.
+      previous_keys(dict): Optionally, sets of the keys of each column
+        family read for earlier entries, used to count keys read again
+        and updated with those of `entries`.
+
+    Returns:
+      tuple: Dicts of frame and of audio values keyed by row key.
+
+    """
+
+    values = []
+
+    for column_family, plan_key in [("video_frames", "frameKeys"),
+                                    ("audio", "audioKeys")]:
+
+      keys = [
+          _maybe_encode_str(key) for entry in entries for key in entry[plan_key]
+      ]
+      unique_keys = set(keys)
+
+      values.append(
+          self._read_sorted_keys(unique_keys,
+                                 column_family=column_family,
+                                 max_keys_per_read=max_keys_per_read,
+                                 stats=stats))
+
+      if stats is not None:
+        stats.num_keys_requested += len(keys)
+        stats.num_unique_keys += len(unique_keys)
+
+      if previous_keys is not None:
+        read = previous_keys.setdefault(column_family, set())
+        if stats is not None:
+          stats.num_cross_window_duplicate_keys += len(unique_keys & read)
+        read.update(unique_keys)
+
+    return tuple(values)
+
+  def _plan_entry_example(self, entry, frame_values, audio_values):
+    """The example dict of plan `entry` given its read values."""
+
+    frame_keys = [_maybe_encode_str(key) for key in entry["frameKeys"]]
+    audio_keys = [_maybe_encode_str(key) for key in entry["audioKeys"]]
+
+    video = _decode_frames(
+        frame_values, frame_keys,
+        codec_utils.get_codec(entry.get("frameCodec", "raw")))
+
+    query_start, query_end = entry["audioSampleBounds"]
+    audio = _decode_audio(
+        audio_values, audio_keys, {
+            "query_start": query_start,
+            "query_end": query_end,
+            "block_size": entry["audioBlockSize"]
+        }, codec_utils.get_codec(entry.get("audioCodec", "raw")))
+
+    video_shape = list(video.shape)
+    if entry.get("frameShape"):
+      video_shape = [len(frame_keys)] + list(entry["frameShape"])
+
+    return {
+        "video": video.reshape(-1).tolist(),
+        "video_shape": video_shape,
+        "audio": audio.tolist(),
+        "same_video": [entry["labels"]["same_video"]],
+        "overlap": [entry["labels"]["overlap"]]
+    }
+
+  def materialize_sampling_plan(self,
+                                plan_path,
+                                output_prefix,
+                                examples_per_shard=1000,
+                                max_keys_per_read=1000,
+                                examples_per_read_window=None,
+                                stats=None):
+    """Fetch the data for a sampling plan into TFRecord shards.
+
+    The second phase of bulk materialization. The plan written by
+    `write_sampling_plan` is read `examples_per_read_window` examples at a
+    time. The frame and audio keys of each window are deduplicated, so
+    that frames shared by several of its examples are fetched once, and
+    read in sorted key order `max_keys_per_read` keys per `read_rows`
+    rather than at random. Examples are written in plan order to shards
+    of `examples_per_shard`, "{output_prefix}-{shard_index:05d}", as
+    tf.Examples with features "video", "video_shape", "audio",
+    "same_video" and "overlap".
+
+    The values of a window's unique keys are held in memory while its
+    examples are written, so larger windows trade memory for fewer
+    repeated reads, which are counted in
+    `stats.num_cross_window_duplicate_keys`.
+
+    Args:
+      plan_path(str): The path to a sampling plan.
+      output_prefix(str): The path prefix of the shards to write.
+      examples_per_shard(int): The number of examples per shard.
+      max_keys_per_read(int): The maximum number of keys per read.
+      examples_per_read_window(int): The number of examples whose keys are
+        deduplicated and read together, by default `examples_per_shard`.
+      stats(MaterializeStats): Optional object in which to record stats.
+
+    Returns:
+      list: The paths of the written shards.
+
+    """
+
+    examples_per_read_window = examples_per_read_window or examples_per_shard
+
+    for name, value in [("examples_per_shard", examples_per_shard),
+                        ("examples_per_read_window", examples_per_read_window)]:
+      if value <= 0:
+        raise ValueError("Expected {} > 0, saw {}.".format(name, value))
+
+    if stats is None:
+      stats = MaterializeStats()
+
+    start_time = time.time()
+    shard_paths = []
+    previous_keys = {}
+
+    writer = None
+    num_shard_examples = 0
+
+    try:
+
+      with tf.gfile.Open(plan_path, "r") as f:
+
+        lines = (line for line in f if line.strip())
+
+        while True:
+
+          entries = [
+              json.loads(line)
+              for line in itertools.islice(lines, examples_per_read_window)
+          ]
+          if not entries:
+            break
+
+          frame_values, audio_values = self._read_plan_values(
+              entries,
+              max_keys_per_read=max_keys_per_read,
+              stats=stats,
+              previous_keys=previous_keys)
+          stats.num_read_windows += 1
+
+          for entry in entries:
+
+            if writer is None:
+              shard_path = "{}-{:05d}".format(output_prefix, len(shard_paths))
+              writer = tf.python_io.TFRecordWriter(shard_path)
+              shard_paths.append(shard_path)
+              stats.num_shards += 1
+
+            example = self._plan_entry_example(entry, frame_values,
+                                               audio_values)
+            writer.write(_serialize_example_dict(example))
+            stats.num_examples += 1
+            num_shard_examples += 1
+
+            if num_shard_examples == examples_per_shard:
+              writer.close()
+              writer = None
+              num_shard_examples = 0
+              stats.elapsed_secs = time.time() - start_time
+              tf.logging.info("Materialized {}: {}".format(
+                  shard_paths[-1], stats.as_dict()))
+
+    finally:
+      if writer is not None:
+        writer.close()
+
+    stats.elapsed_secs = time.time() - start_time
+    tf.logging.info("Materialized {} examples to {} shards: {}".format(
+        stats.num_examples, len(shard_paths), stats.as_dict()))
+
+    return shard_paths
+
+
+class MaterializeStats(object):
+  """Key deduplication and throughput of a sampling plan materialization."""
+
+  def __init__(self):
+    self.num_examples = 0
+    self.num_shards = 0
+    self.num_read_windows = 0
+    # Frame and audio keys summed over examples, the number of those
+    # remaining after deduplication within each read window, and the
+    # number of the latter already read for an earlier window.
+    self.num_keys_requested = 0
+    self.num_unique_keys = 0
+    self.num_cross_window_duplicate_keys = 0
+    self.num_read_calls = 0
+    self.elapsed_secs = 0.0
+
+  @property
+  def cross_window_duplicate_rate(self):
+    """The fraction of keys read that an earlier window had also read."""
+    if self.num_unique_keys == 0:
+      return 0.0
+    return self.num_cross_window_duplicate_keys / float(self.num_unique_keys)
+
+  @property
+  def examples_per_sec(self):
+    if self.elapsed_secs <= 0:
+      return 0.0
+    return self.num_examples / self.elapsed_secs
+
+  def as_dict(self):
+    return {
+        "num_examples": self.num_examples,
+        "num_shards": self.num_shards,
+        "num_read_windows": self.num_read_windows,
+        "num_keys_requested": self.num_keys_requested,
+        "num_unique_keys": self.num_unique_keys,
+        "num_cross_window_duplicate_keys": self.num_cross_window_duplicate_keys,
+        "cross_window_duplicate_rate": self.cross_window_duplicate_rate,
+        "num_read_calls": self.num_read_calls,
+        "elapsed_secs": self.elapsed_secs,
+        "examples_per_sec": self.examples_per_sec
+    }
+
+
+def _serialize_example_dict(example_dict):
+
+  if not isinstance(example_dict, dict):
+    msg = "Expected generator to yield dict's, saw {}.".format(
+        type(example_dict))
+    raise ValueError(msg)
+
+  return to_example(example_dict).SerializeToString()
+
+
+class LoadStats(object):
+  """Throughput and mutation status of a bulk load."""
+
+  def __init__(self):
+    self.num_examples = 0
+    self.num_bytes = 0
+    self.num_rows_written = 0
+    self.elapsed_secs = 0.0
+    # (row_key, status code) of each row that failed to be written.
+    self.failed = []
+
+  @property
+  def examples_per_sec(self):
+    if self.elapsed_secs <= 0:
+      return 0.0
+    return self.num_examples / self.elapsed_secs
+
+  @property
+  def bytes_per_sec(self):
+    if self.elapsed_secs <= 0:
+      return 0.0
+    return self.num_bytes / self.elapsed_secs
+
+  def as_dict(self):
+    return {
+        "num_examples": self.num_examples,
+        "num_bytes": self.num_bytes,
+        "num_rows_written": self.num_rows_written,
+        "num_rows_failed": len(self.failed),
+        "elapsed_secs": self.elapsed_secs,
+        "examples_per_sec": self.examples_per_sec,
+        "bytes_per_sec": self.bytes_per_sec
+    }
 
 
 class TFExampleSelection(BigTableSelection):
@@ -1015,43 +2548,113 @@ class TFExampleSelection(BigTableSelection):
                                  generator,
                                  prefix_tag_length=4,
                                  max_num_examples=-1,
-                                 log_every=100):
-    """Builds TFExample from dict, serializes, and writes to CBT."""
+                                 log_every=100,
+                                 max_batch_bytes=4 * 1024 * 1024,
+                                 max_batch_rows=500,
+                                 max_in_flight=4,
+                                 num_producers=1,
+                                 use_processes=False,
+                                 load_stats=None):
+    """Builds TFExample from dict, serializes, and writes to CBT.
+
+    Serialized examples are buffered and written in batches of up to
+    `max_batch_bytes` or `max_batch_rows` rows with up to `max_in_flight`
+    `mutate_rows` calls outstanding. With `num_producers` > 1 the
+    generator's dicts are converted to serialized examples by a pool of
+    that many threads or, with `use_processes`, processes.
+
+    Args:
+      generator(iterable): Yields example dicts.
+      prefix_tag_length(int): The length of the random key suffix.
+      max_num_examples(int): Stop after this many examples if > 0.
+      log_every(int): Log progress and throughput every this many examples.
+      max_batch_bytes(int): The approximate size of each `mutate_rows`.
+      max_batch_rows(int): The maximum number of rows per `mutate_rows`.
+      max_in_flight(int): The number of concurrent `mutate_rows` calls.
+      num_producers(int): The number of example serialization workers.
+      use_processes(bool): Whether serialization workers are processes.
+      load_stats(LoadStats): Optional object in which to record
+        throughput and the status of failed row mutations.
+
+    Returns:
+      int: The index of the last example loaded.
+
+    """
 
     prefix = self.prefix
     table = self.table
 
-    for i, example_dict in enumerate(generator):
+    if load_stats is None:
+      load_stats = LoadStats()
 
-      if not isinstance(example_dict, dict):
-        msg = "Expected generator to yield dict's, saw {}.".format(
-            type(example_dict))
-        raise ValueError(msg)
+    if max_num_examples > 0:
+      generator = itertools.islice(generator, max_num_examples + 1)
 
-      example = to_example(example_dict)
-      example = example.SerializeToString()
+    pool = None
+    if num_producers > 1:
+      if use_processes:
+        pool = multiprocessing.Pool(num_producers)
+      else:
+        pool = multiprocessing.pool.ThreadPool(num_producers)
+      serialized_examples = pool.imap(_serialize_example_dict,
+                                      generator,
+                                      chunksize=8)
+    else:
+      serialized_examples = map(_serialize_example_dict, generator)
 
-      # Random target key
-      target_key = random_key(prefix=prefix, length=prefix_tag_length).encode()
+    writer = BatchedRowWriter(table=table,
+                              max_batch_bytes=max_batch_bytes,
+                              max_batch_rows=max_batch_rows,
+                              max_in_flight=max_in_flight,
+                              raise_on_failure=False)
 
-      row = table.row(target_key)
-      row.set_cell(column_family_id="tfexample",
-                   column="example",
-                   value=example,
-                   timestamp=datetime.datetime(1970, 1, 1))
-      # Don't set a timestamp so we set instead of
-      # append cell values.
-      #timestamp=datetime.datetime.utcnow())
+    i = 0
+    start_time = time.time()
 
-      table.mutate_rows([row])
+    try:
+      with writer:
 
-      if log_every > 0 and i % log_every == 0:
-        tf.logging.info("Generated {} examples...".format(i))
+        for i, example in enumerate(serialized_examples):
 
-      if max_num_examples > 0 and i >= max_num_examples:
-        break
+          # Random target key
+          target_key = random_key(prefix=prefix,
+                                  length=prefix_tag_length).encode()
+
+          row = table.row(target_key)
+          row.set_cell(column_family_id="tfexample",
+                       column="example",
+                       value=example,
+                       timestamp=datetime.datetime(1970, 1, 1))
+          # Don't set a timestamp so we set instead of
+          # append cell values.
+          #timestamp=datetime.datetime.utcnow())
+
+          writer.add(row, num_bytes=len(example))
+          load_stats.num_examples += 1
+          load_stats.num_bytes += len(example)
+
+          if log_every > 0 and i % log_every == 0:
+            load_stats.elapsed_secs = time.time() - start_time
+            tf.logging.info(
+                "Generated {} examples ({:.1f} examples/s, {:.1f} bytes/s)...".
+                format(i, load_stats.examples_per_sec,
+                       load_stats.bytes_per_sec))
+
+    finally:
+      if pool is not None:
+        pool.terminate()
 
-    tf.logging.info("Generated {} examples.".format(i))
+    load_stats.elapsed_secs = time.time() - start_time
+    load_stats.num_rows_written = writer.num_rows_written
+    load_stats.failed = writer.failed
+
+    tf.logging.info(
+        "Generated {} examples ({:.1f} examples/s, {:.1f} bytes/s).".format(
+            i, load_stats.examples_per_sec, load_stats.bytes_per_sec))
+
+    if load_stats.failed:
+      tf.logging.warning("Failed to write {} of {} examples.".format(
+          len(load_stats.failed), load_stats.num_examples))
 
     return i
 
@@ -1067,6 +2670,181 @@ class TFExampleSelection(BigTableSelection):
 
       yield parsed_example
 
+  def key_ranges(self, num_ranges):
+    """Split the selection's key space into up to `num_ranges` ranges.
+
+    Split points are chosen among the tablet boundaries reported by
+    `sample_row_keys` so each range is served by few tablets.
+
+    Returns:
+      list: (start_key, end_key) pairs of bytes, end exclusive, where an
+        empty key is unbounded.
+
+    """
+
+    start_key = b""
+    end_key = b""
+    if isinstance(self.prefix, str):
+      start_key = self.prefix.encode()
+      end_key = _prefix_end_key(self.prefix)
+
+    sample_keys = [sample.row_key for sample in self.table.sample_row_keys()]
+
+    return _split_key_range(start_key=start_key,
+                            end_key=end_key,
+                            sample_keys=sample_keys,
+                            num_ranges=num_ranges)
+
+  def iterate_serialized_range(self,
+                               start_key,
+                               end_key,
+                               range_stats=None,
+                               range_index=0):
+    """Yield serialized examples in [start_key, end_key) in key order."""
+
+    partial_rows = self.table.read_rows(start_key=start_key or None,
+                                        end_key=end_key or None)
+
+    num_rows = 0
+    num_bytes = 0
+    start_time = time.time()
+
+    for row in partial_rows:
+      ex = row.cells["tfexample"]["example".encode()][0].value
+      num_rows += 1
+      num_bytes += len(ex)
+      yield ex
+
+    if range_stats is not None:
+      range_stats.record(range_index=range_index,
+                         start_key=start_key,
+                         end_key=end_key,
+                         num_rows=num_rows,
+                         num_bytes=num_bytes,
+                         elapsed_secs=time.time() - start_time)
+
+  def as_dataset(self,
+                 num_ranges=8,
+                 batch_size=None,
+                 feature_spec=None,
+                 num_parallel_reads=None,
+                 range_stats=None):
+    """A `tf.data.Dataset` reading the selection's examples in parallel.
+
+    The key space is split with `key_ranges` and the ranges are read
+    concurrently and interleaved. Without `batch_size` the dataset yields
+    serialized examples. With it, they are batched and, given a
+    `feature_spec`, parsed with one vectorized `tf.io.parse_example` per
+    batch.
+
+    Args:
+      num_ranges(int): The number of key ranges to split reads across.
+      batch_size(int): Optionally batch serialized examples.
+      feature_spec(dict): Feature spec for `tf.io.parse_example`, used
+        only when batching.
+      num_parallel_reads(int): The number of ranges read concurrently,
+        defaults to the number of ranges.
+      range_stats(RangeReadStats): Optional object in which to record
+        per-range row counts, bytes and read time.
+
+    """
+
+    ranges = self.key_ranges(num_ranges)
+    num_parallel_reads = num_parallel_reads or len(ranges)
+
+    def _range_generator(range_index):
+      start_key, end_key = ranges[range_index]
+      for ex in self.iterate_serialized_range(start_key=start_key,
+                                              end_key=end_key,
+                                              range_stats=range_stats,
+                                              range_index=range_index):
+        yield ex
+
+    def _read_range(range_index):
+      return tf.data.Dataset.from_generator(_range_generator,
+                                            output_types=tf.string,
+                                            output_shapes=tf.TensorShape([]),
+                                            args=(range_index,))
+
+    dataset = tf.data.Dataset.range(len(ranges))
+    dataset = dataset.interleave(_read_range,
+                                 cycle_length=num_parallel_reads,
+                                 block_length=1,
+                                 num_parallel_calls=num_parallel_reads)
+
+    if batch_size:
+      dataset = dataset.batch(batch_size)
+      if feature_spec is not None:
+        dataset = dataset.map(
+            lambda serialized: tf.io.parse_example(serialized, feature_spec),
+            num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+    return dataset
+
+
+def _prefix_end_key(prefix):
+  """The smallest key greater than all keys starting with `prefix`."""
+
+  prefix = _maybe_encode_str(prefix).rstrip(b"\xff")
+
+  if not prefix:
+    return b""
+
+  return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+def _split_key_range(start_key, end_key, sample_keys, num_ranges):
+  """Split [start_key, end_key) at up to `num_ranges` - 1 sampled keys.
+
+  An empty `start_key` or `end_key` is unbounded.
+
+  """
+
+  splits = sorted(
+      set(key for key in sample_keys
+          if key > start_key and (not end_key or key < end_key)))
+
+  chosen = []
+  if splits and num_ranges > 1:
+    num_splits = min(num_ranges - 1, len(splits))
+    for j in range(1, num_splits + 1):
+      chosen.append(splits[int(j * len(splits) / (num_splits + 1))])
+    chosen = sorted(set(chosen))
+
+  boundaries = [start_key] + chosen + [end_key]
+
+  return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+class RangeReadStats(object):
+  """Per key range row counts, bytes and read time."""
+
+  def __init__(self):
+    self.ranges = {}
+    self._lock = threading.Lock()
+
+  def record(self, range_index, start_key, end_key, num_rows, num_bytes,
+             elapsed_secs):
+    with self._lock:
+      self.ranges[range_index] = {
+          "start_key": start_key,
+          "end_key": end_key,
+          "num_rows": num_rows,
+          "num_bytes": num_bytes,
+          "elapsed_secs": elapsed_secs
+      }
+
+  def slowest(self, n=1):
+    """The stats of the `n` ranges that took longest to read."""
+    with self._lock:
+      return sorted(self.ranges.values(),
+                    key=lambda stats: stats["elapsed_secs"],
+                    reverse=True)[:n]
+
+  def as_dict(self):
+    with self._lock:
+      return dict(self.ranges)
+
 
 def random_key(prefix="raw_", length=4):
 
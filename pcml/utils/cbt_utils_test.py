@@ -13,16 +13,20 @@
 """Additional distributed datagen and augmentation problem defs."""
 
 import tensorflow as tf
+import json
 import os
 import uuid
 import tempfile
+import time
 import numpy as np
 
 #from pcml.operations import cbt_datagen
 
 from tensor2tensor.utils import registry
 
+from clarify.utils import cbt_test_utils
 from clarify.utils import cbt_utils
+from clarify.utils import codec_utils
 #from pcml.operations import extract
 
 from clarify.utils.cfg_utils import Config
@@ -31,6 +35,96 @@ TEST_CONFIG = Config()
 
 from clarify.utils.cbt_utils import _lex_index
 
+from clarify.utils import cache_utils
+from clarify.utils import read_policy_utils
+from clarify.utils import video_utils
+
+
+class _FlakyFakeTable(cbt_test_utils.FakeTable):
+  """Fails every other row of each `mutate_rows` call on its first attempt."""
+
+  def __init__(self, *args, **kwargs):
+    super(_FlakyFakeTable, self).__init__(*args, **kwargs)
+    self.attempted = set()
+    self.num_mutate_calls = 0
+
+  def mutate_rows(self, rows):
+    self.num_mutate_calls += 1
+    statuses = []
+    for i, row in enumerate(rows):
+      if i % 2 == 1 and row.row_key not in self.attempted:
+        self.attempted.add(row.row_key)
+        statuses.append(cbt_test_utils.FakeStatus(code=14))
+      else:
+        super(_FlakyFakeTable, self).mutate_rows([row])
+        statuses.append(cbt_test_utils.FakeStatus())
+    return statuses
+
+
+class _FakeInstance(object):
+
+  def __init__(self, tables):
+    self.tables = tables
+
+  def table(self, table_id):
+    return self.tables.setdefault(table_id, cbt_test_utils.FakeTable())
+
+
+class _FakeClient(object):
+
+  def __init__(self, project=None, sa_key_path=None):
+    self.project = project
+    self.instances = {}
+
+  def instance(self, instance_id):
+    return _FakeInstance(self.instances.setdefault(instance_id, {}))
+
+
+class _FakeRawVideoSelection(cbt_utils.RawVideoSelection):
+
+  def materialize(self, sa_key_path=None):
+    self.table = cbt_test_utils.FakeTable()
+
+
+class _FakeTFExampleSelection(cbt_utils.TFExampleSelection):
+
+  def materialize(self, sa_key_path=None):
+    self.table = cbt_test_utils.FakeTable()
+
+
+def _make_fake_selection(num_frames=40,
+                         audio_length=12345,
+                         frame_shape=(8, 8, 3),
+                         audio_block_size=1000,
+                         prefix="train",
+                         block_cache=None):
+  """A fake-table-backed selection holding one written video."""
+
+  selection = _FakeRawVideoSelection(project="fake",
+                                     instance="fake",
+                                     table="fake",
+                                     prefix=prefix,
+                                     block_cache=block_cache)
+
+  video = video_utils.Video()
+  for _ in range(num_frames):
+    video.insert(np.random.randint(0, 255, frame_shape).astype(np.uint8))
+  audio = np.random.randint(0, 255, (audio_length,)).astype(np.uint8)
+
+  selection.write_av(frames=video,
+                     audio=audio,
+                     shard_id=0,
+                     video_id=0,
+                     audio_block_size=audio_block_size)
+
+  selection.set_shard_meta(
+      cbt_utils.VideoShardMeta(shard_id=0,
+                               num_videos=1,
+                               status="finished",
+                               num_shards=1))
+
+  return selection, video, audio
+
 
 class TestCBTUtils(tf.test.TestCase):
 
@@ -93,6 +187,31 @@ class TestCBTUtils(tf.test.TestCase):
     vsm.status = "finished"
     vsm.as_dict()
 
+  def test_batched_key_generation(self):
+
+    self.assertEqual(_lex_index(0), "aaaa")
+    self.assertEqual(_lex_index(1234), "bcde")
+    self.assertEqual(_lex_index(12345), "bcdef")
+
+    indices = np.array([0, 7, 42, 999, 1234, 9999])
+    self.assertEqual(
+        cbt_utils.make_frame_keys("train", 3, 12, indices),
+        [cbt_utils.make_frame_key("train", 3, 12, i) for i in indices])
+    self.assertEqual(
+        cbt_utils.make_audio_keys("train", 3, 12, indices),
+        [cbt_utils.make_audio_key("train", 3, 12, i) for i in indices])
+
+    # Beyond the fixed suffix width keys match the per-index functions.
+    indices = np.array([9998, 10000, 123456])
+    self.assertEqual(
+        cbt_utils.make_frame_keys("train", 0, 0, indices),
+        [cbt_utils.make_frame_key("train", 0, 0, i) for i in indices])
+
+    self.assertEqual(cbt_utils.make_frame_keys("train", 0, 0, []), [])
+
+    with self.assertRaises(ValueError):
+      cbt_utils.make_frame_keys("train", 0, 0, np.array([1, -1]))
+
   def test_set_and_lookup_shard_meta(self):
 
     table_tag = "{}-meta".format(self.table)
@@ -118,6 +237,706 @@ class TestCBTUtils(tf.test.TestCase):
 
     self.assertEqual(recv_meta[train_meta_key].as_dict(), sent_meta.as_dict())
 
+
+class TestCBTUtilsFakeTable(tf.test.TestCase):
+
+  def test_lookup_frame_data_batched(self):
+
+    selection, video, _ = _make_fake_selection()
+    meta = selection._lookup_all_video_metadata()[0]
+
+    # Request frames out of key order to check order is preserved.
+    indices = np.array([7, 3, 5, 4, 20])
+    frame_keys = selection._frame_keys_for_indices(indices, meta=meta)
+
+    selection.table.num_read_calls = 0
+    batched = selection._lookup_frame_data(frame_keys)
+    self.assertEqual(selection.table.num_read_calls, 1)
+
+    per_row = selection._lookup_frame_data(frame_keys, batched=False)
+    self.assertEqual(selection.table.num_read_calls, 1 + len(frame_keys))
+
+    self.assertEqual(batched.dtype, np.uint8)
+    self.assertEqual(batched.shape, (len(indices), 8 * 8 * 3))
+    self.assertAllEqual(batched, per_row)
+
+    frames = list(video.get_iterator())
+    for i, index in enumerate(indices):
+      self.assertAllEqual(batched[i], frames[index].flatten())
+
+    with self.assertRaises(ValueError):
+      selection._lookup_frame_data(frame_keys + [b"train_0_0_frame_jjjj"])
+
+  def test_lookup_audio_data_range_scan(self):
+
+    selection, _, audio = _make_fake_selection(audio_length=12345,
+                                               audio_block_size=1000)
+    meta = selection._lookup_all_video_metadata()[0]
+
+    # Spans several blocks including the final, shorter one.
+    for start, end in [(10, 20), (950, 3050), (11000, 12340)]:
+
+      keys, abm = selection._audio_keys(meta=meta,
+                                        indices=np.arange(start, end))
+
+      selection.table.num_read_calls = 0
+      data = selection._lookup_audio_data(audio_keys=keys, audio_block_meta=abm)
+      self.assertEqual(selection.table.num_read_calls, 1)
+
+      self.assertEqual(data.dtype, np.uint8)
+      self.assertAllEqual(data, audio[start:end - 1])
+
+  def test_lookup_audio_data_across_key_suffix_width(self):
+
+    max_suffix = cbt_utils.MAX_ALLOWABLE_FRAME_AUDIO_KEY_SUFFIX
+    selection, _, audio = _make_fake_selection(num_frames=2,
+                                               audio_length=max_suffix + 4,
+                                               audio_block_size=1)
+    meta = selection._lookup_all_video_metadata()[0]
+
+    # Blocks max_suffix - 2 .. max_suffix + 2, where the key suffix widens.
+    start, end = max_suffix - 2, max_suffix + 3
+    keys, abm = selection._audio_keys(meta=meta, indices=np.arange(start, end))
+    self.assertNotEqual(keys, sorted(keys))
+
+    selection.table.num_read_calls = 0
+    data = selection._lookup_audio_data(audio_keys=keys, audio_block_meta=abm)
+    self.assertEqual(selection.table.num_read_calls, 1)
+    self.assertIsNone(selection.table.last_read_kwargs["start_key"])
+
+    self.assertAllEqual(data, audio[start:end - 1])
+
+  def test_write_av_stream(self):
+
+    selection, video, audio = _make_fake_selection(num_frames=20,
+                                                   audio_length=4321)
+
+    streamed = _FakeRawVideoSelection(project="fake",
+                                      instance="fake",
+                                      table="fake",
+                                      prefix="train")
+    streamed.table = _FlakyFakeTable()
+
+    def _audio_chunks(chunk_size=777):
+      for i in range(0, len(audio), chunk_size):
+        yield audio[i:i + chunk_size]
+
+    streamed.write_av_stream(frames=video.get_iterator(),
+                             audio=_audio_chunks(),
+                             shard_id=0,
+                             video_id=0,
+                             max_batch_bytes=1000,
+                             max_in_flight=3)
+
+    # The reference table additionally holds the shard's metadata.
+    expected_keys = set(selection.table.rows.keys())
+    expected_keys.remove(cbt_utils.make_shard_meta_key("train", 0))
+    self.assertEqual(set(streamed.table.rows.keys()), expected_keys)
+
+    def _values(row):
+      return {
+          (family, column): cells[0].value
+          for family, columns in row.cells.items()
+          for column, cells in columns.items()
+      }
+
+    for key in expected_keys:
+      self.assertEqual(_values(streamed.table.rows[key]),
+                       _values(selection.table.rows[key]))
+
+    # Batches were sized by bytes and failed rows were re-sent.
+    self.assertTrue(streamed.table.num_mutate_calls > 5)
+    self.assertTrue(len(streamed.table.attempted) > 0)
+
+    with self.assertRaises(ValueError):
+      streamed.write_av_stream(frames=iter([]),
+                               audio=audio,
+                               shard_id=0,
+                               video_id=1)
+
+  def test_write_and_read_with_codecs(self):
+
+    selection, _, _ = _make_fake_selection(num_frames=2)
+
+    frame = np.tile(np.arange(32, dtype=np.uint8)[:, None, None], (1, 16, 3))
+    video = video_utils.Video()
+    for _ in range(12):
+      video.insert(frame)
+    audio = np.sin(np.arange(3500) / 10.0).astype(np.float32)
+
+    selection.write_av(frames=video,
+                       audio=audio,
+                       shard_id=0,
+                       video_id=1,
+                       audio_block_size=1000,
+                       frame_codec="png",
+                       audio_codec="pcm16")
+
+    meta = selection._lookup_shard_video_metadata(0)
+    self.assertEqual(meta[0].frame_codec, "raw")
+    self.assertEqual(meta[0].audio_codec, "raw")
+    meta = meta[1]
+    self.assertEqual(meta.frame_codec, "png")
+    self.assertEqual(meta.audio_codec, "pcm16")
+    self.assertEqual(meta.frame_shape, [32, 16, 3])
+
+    frame_keys = selection._frame_keys_for_indices(np.arange(2, 6), meta=meta)
+    frames = selection._lookup_frame_data(frame_keys, meta=meta)
+    self.assertAllEqual(frames, [frame.reshape(-1)] * 4)
+    self.assertAllEqual(
+        selection._lookup_frame_data(frame_keys, batched=False, meta=meta),
+        frames)
+
+    audio_keys, abm = selection._audio_keys(meta=meta,
+                                            indices=np.arange(950, 3050))
+    decoded = selection._lookup_audio_data(audio_keys, abm, meta=meta)
+    self.assertEqual(decoded.dtype, np.float32)
+    self.assertAllClose(decoded, audio[950:3049], atol=1e-4)
+
+    # Codecs survive the round trip through a video metadata index.
+    index = selection.build_video_meta_index()
+    self.assertEqual(index[1].as_dict(), meta.as_dict())
+    self.assertEqual(index[0].frame_shape, [8, 8, 3])
+
+    # Metadata written before codecs were recorded is read as raw.
+    legacy = meta.as_dict()
+    for key in ["frame_codec", "audio_codec", "frame_shape"]:
+      del legacy[key]
+    legacy = cbt_utils.VideoMeta.from_dict(legacy)
+    self.assertEqual(legacy.frame_codec, "raw")
+    self.assertEqual(legacy.frame_shape, None)
+
+    with self.assertRaises(ValueError):
+      selection.write_av(frames=video,
+                         audio=audio,
+                         shard_id=0,
+                         video_id=2,
+                         audio_codec="png")
+
+  def test_sampling_plan_materialization(self):
+
+    selection, _, _ = _make_fake_selection()
+    plan_path = os.path.join(tempfile.mkdtemp(), "plan.jsonl")
+
+    num_examples = selection.write_sampling_plan(plan_path=plan_path,
+                                                 num_example_sets=5,
+                                                 frames_per_video=4,
+                                                 seed=1)
+    self.assertEqual(num_examples, 10)
+
+    with open(plan_path) as f:
+      entries = [json.loads(line) for line in f]
+    self.assertEqual(len(entries), 10)
+    self.assertEqual(entries[0]["exampleType"], "negative_same")
+    self.assertEqual(entries[0]["frameShape"], [8, 8, 3])
+
+    # Frames shared between examples are read once, in a few reads.
+    stats = cbt_utils.MaterializeStats()
+    selection.table.num_read_calls = 0
+    shard_paths = selection.materialize_sampling_plan(
+        plan_path=plan_path,
+        output_prefix=os.path.join(tempfile.mkdtemp(), "examples"),
+        examples_per_shard=4,
+        stats=stats)
+
+    self.assertEqual(len(shard_paths), 3)
+    self.assertEqual(stats.num_examples, 10)
+    self.assertEqual(stats.num_shards, 3)
+    self.assertTrue(stats.num_unique_keys < stats.num_keys_requested)
+    self.assertEqual(selection.table.num_read_calls, 6)
+
+    examples = [
+        tf.train.Example.FromString(record).features.feature
+        for path in shard_paths
+        for record in tf.python_io.tf_record_iterator(path)
+    ]
+    self.assertEqual(len(examples), 10)
+
+    # Each example matches what the per-sample lookups would have fetched.
+    meta = selection._lookup_all_video_metadata()[0]
+    for entry, example in zip(entries, examples):
+      query_start, query_end = entry["audioSampleBounds"]
+      expected_audio = selection._lookup_audio_data(entry["audioKeys"], {
+          "query_start": query_start,
+          "query_end": query_end
+      },
+                                                    meta=meta)
+      self.assertAllEqual(example["audio"].int64_list.value, expected_audio)
+      self.assertAllEqual(
+          example["video"].int64_list.value,
+          selection._lookup_frame_data(entry["frameKeys"]).reshape(-1))
+      self.assertEqual(example["video_shape"].int64_list.value, [4, 8, 8, 3])
+      self.assertEqual(example["same_video"].int64_list.value,
+                       [entry["labels"]["same_video"]])
+
+    # Keys shared across shards are read again by later windows...
+    self.assertEqual(stats.num_read_windows, 3)
+    self.assertTrue(stats.num_cross_window_duplicate_keys > 0)
+    self.assertTrue(0 < stats.as_dict()["cross_window_duplicate_rate"] < 1)
+
+    # ...but only once given a window spanning the plan, which writes the
+    # same shards.
+    window_stats = cbt_utils.MaterializeStats()
+    selection.table.num_read_calls = 0
+    window_shard_paths = selection.materialize_sampling_plan(
+        plan_path=plan_path,
+        output_prefix=os.path.join(tempfile.mkdtemp(), "examples"),
+        examples_per_shard=4,
+        examples_per_read_window=10,
+        stats=window_stats)
+
+    self.assertEqual(selection.table.num_read_calls, 2)
+    self.assertEqual(window_stats.num_read_windows, 1)
+    self.assertEqual(window_stats.num_cross_window_duplicate_keys, 0)
+    self.assertEqual(
+        window_stats.num_unique_keys,
+        stats.num_unique_keys - stats.num_cross_window_duplicate_keys)
+    for path, window_path in zip(shard_paths, window_shard_paths):
+      self.assertEqual(list(tf.python_io.tf_record_iterator(path)),
+                       list(tf.python_io.tf_record_iterator(window_path)))
+
+  def test_reads_under_read_policy(self):
+
+    selection, _, audio = _make_fake_selection()
+    policy = read_policy_utils.ReadPolicy(deadline_secs=5.0)
+    selection.read_policy = policy
+
+    meta = selection._lookup_all_video_metadata()[0]
+    frame_keys = selection._frame_keys_for_indices(np.arange(3), meta=meta)
+    selection._lookup_frame_data(frame_keys)
+    selection._lookup_frame_data(frame_keys, batched=False)
+    audio_keys, abm = selection._audio_keys(meta=meta,
+                                            indices=np.arange(950, 3050))
+    self.assertAllEqual(selection._lookup_audio_data(audio_keys, abm),
+                        audio[950:3049])
+
+    latency = policy.as_dict()["latency"]
+    self.assertEqual(latency["lookup_video_metadata"]["count"], 1)
+    self.assertEqual(latency["read_video_frames"]["count"], 4)
+    self.assertEqual(latency["read_audio"]["count"], 1)
+
+    # Sampling a video that was never written fails after bounded retries.
+    shard_meta = {
+        "shard":
+            cbt_utils.VideoShardMeta(shard_id=0,
+                                     num_videos=1000,
+                                     status="finished",
+                                     num_shards=1)
+    }
+    selection.table.rows.clear()
+    with self.assertRaises(ValueError):
+      selection._get_random_video_meta(shard_meta, max_attempts=3)
+
+  def test_row_counts(self):
+
+    selection, _, _ = _make_fake_selection(num_frames=30)
+    table = selection.table
+    num_train_rows = len(table.rows)
+
+    # Rows outside of the prefix aren't counted.
+    other = _FakeRawVideoSelection(project="fake",
+                                   instance="fake",
+                                   table="fake",
+                                   prefix="eval")
+    other.table = table
+    table.rows[b"eval_0_meta_aaaa"] = cbt_test_utils.FakeRow(
+        b"eval_0_meta_aaaa")
+
+    self.assertEqual(selection.count_rows(), num_train_rows)
+    self.assertEqual(other.count_rows(), 1)
+
+    # Reads stop at the threshold and only transfer keys.
+    self.assertEqual(selection.count_rows(max_rows=5), 5)
+    self.assertEqual(table.last_read_kwargs["limit"], 5)
+    self.assertEqual(table.last_read_kwargs["start_key"], b"train")
+    self.assertEqual(table.last_read_kwargs["end_key"], b"traio")
+    self.assertTrue(table.last_read_kwargs["filter_"] is not None)
+
+    self.assertTrue(selection.rows_at_least(num_train_rows - 1))
+    self.assertEqual(table.last_read_kwargs["limit"], num_train_rows)
+    self.assertFalse(selection.rows_at_least(num_train_rows))
+    self.assertTrue(selection.rows_at_least(0.5 * num_train_rows))
+
+    self.assertTrue(
+        selection.wait_until_rows_at_least(num_train_rows - 1, timeout_secs=0))
+    self.assertFalse(
+        selection.wait_until_rows_at_least(num_train_rows,
+                                           timeout_secs=0.2,
+                                           poll_interval_secs=0.05))
+
+    # Sampled offsets bound the bytes stored under the prefix.
+    num_bytes = selection.approximate_num_bytes()
+    self.assertTrue(0 < num_bytes <= 30 * 8 * 8 * 3 + 12345)
+    self.assertEqual(selection.approximate_row_count(mean_row_bytes=num_bytes),
+                     1)
+
+  def test_client_pool(self):
+
+    pool = cbt_utils.BigtableClientPool(client_fn=_FakeClient)
+    num_ensured = []
+
+    def _ensure(table):
+      num_ensured.append(table)
+
+    _, _, table = pool.get_table("p", "i", "t", ensure_fn=_ensure)
+    client, _, same_table = pool.get_table("p", "i", "t", ensure_fn=_ensure)
+    _, _, other_table = pool.get_table("p", "i", "u", ensure_fn=_ensure)
+
+    self.assertTrue(table is same_table)
+    self.assertFalse(table is other_table)
+    self.assertTrue(pool.get_client("p") is client)
+    self.assertFalse(pool.get_client("p", sa_key_path="/key.json") is client)
+    self.assertEqual(len(num_ensured), 2)
+
+    stats = pool.as_dict()
+    self.assertEqual(stats["table_hits"], 1)
+    self.assertEqual(stats["table_misses"], 2)
+    self.assertEqual(stats["num_clients"], 2)
+
+    # Selections share handles from the module's pool.
+    original_pool = cbt_utils.CLIENT_POOL
+    cbt_utils.CLIENT_POOL = pool
+    try:
+      first = cbt_utils.RawVideoSelection(project="p",
+                                          instance="i",
+                                          table="t",
+                                          prefix="train")
+      second = cbt_utils.RawVideoSelection(project="p",
+                                           instance="i",
+                                           table="t",
+                                           prefix="eval")
+    finally:
+      cbt_utils.CLIENT_POOL = original_pool
+    self.assertTrue(first.table is table)
+    self.assertTrue(second.client is client)
+
+    # Handles created before a fork are not reused after it.
+    pool._pid = -1
+    _, _, table_after_fork = pool.get_table("p", "i", "t")
+    self.assertFalse(table_after_fork is table)
+    self.assertEqual(pool.num_fork_resets, 1)
+    self.assertEqual(pool.as_dict()["table_misses"], 1)
+
+  def test_selection_rematerializes_after_fork(self):
+
+    pool = cbt_utils.BigtableClientPool(client_fn=_FakeClient)
+
+    original_pool = cbt_utils.CLIENT_POOL
+    cbt_utils.CLIENT_POOL = pool
+    try:
+      selection = cbt_utils.RawVideoSelection(project="p",
+                                              instance="i",
+                                              table="t",
+                                              prefix="train")
+      table = selection.table
+
+      read_fd, write_fd = os.pipe()
+      pid = os.fork()
+      if pid == 0:
+        # Report from the child which handles the selection now uses.
+        os.close(read_fd)
+        result = "{}{}{}".format(
+            int(selection.table is table),
+            int(selection.table is pool._tables[("p", None, "i", "t")][2]),
+            pool.num_fork_resets)
+        os.write(write_fd, result.encode())
+        os._exit(0)
+
+      os.close(write_fd)
+      _, status = os.waitpid(pid, 0)
+      with os.fdopen(read_fd) as f:
+        result = f.read()
+    finally:
+      cbt_utils.CLIENT_POOL = original_pool
+
+    self.assertEqual(status, 0)
+    self.assertEqual(result, "011")
+    self.assertTrue(selection.table is table)
+    self.assertEqual(pool.num_fork_resets, 0)
+
+  def test_lookups_via_block_cache(self):
+
+    cache = cache_utils.LRUBlockCache(max_bytes=10**6)
+    selection, video, audio = _make_fake_selection(block_cache=cache)
+    meta = selection._lookup_all_video_metadata()[0]
+
+    frame_keys = selection._frame_keys_for_indices(np.arange(3, 9), meta=meta)
+    audio_keys, abm = selection._audio_keys(meta=meta,
+                                            indices=np.arange(950, 3050))
+
+    selection.table.num_read_calls = 0
+    cold_frames = selection._lookup_frame_data(frame_keys)
+    cold_audio = selection._lookup_audio_data(audio_keys, abm)
+    self.assertEqual(selection.table.num_read_calls, 2)
+
+    warm_frames = selection._lookup_frame_data(frame_keys)
+    warm_audio = selection._lookup_audio_data(audio_keys, abm)
+    self.assertEqual(selection.table.num_read_calls, 2)
+
+    self.assertAllEqual(cold_frames, warm_frames)
+    self.assertAllEqual(cold_audio, warm_audio)
+    self.assertAllEqual(warm_audio, audio[950:3049])
+    self.assertEqual(cache.misses, len(frame_keys) + len(audio_keys))
+    self.assertEqual(cache.hits, len(frame_keys) + len(audio_keys))
+
+    # Overlapping windows only read the frames not seen before.
+    frame_keys = selection._frame_keys_for_indices(np.arange(5, 12), meta=meta)
+    selection._lookup_frame_data(frame_keys)
+    self.assertEqual(selection.table.num_read_calls, 3)
+
+  def test_video_meta_index(self):
+
+    selection, _, _ = _make_fake_selection()
+
+    def _write_shard(shard_id, num_videos):
+      for video_id in range(num_videos):
+        video = video_utils.Video()
+        for _ in range(10 + video_id):
+          video.insert(np.zeros((8, 8, 3), dtype=np.uint8))
+        selection.write_av(frames=video,
+                           audio=np.zeros((5000,), dtype=np.uint8),
+                           shard_id=shard_id,
+                           video_id=video_id)
+      selection.set_shard_meta(
+          cbt_utils.VideoShardMeta(shard_id=shard_id,
+                                   num_videos=num_videos,
+                                   status="finished",
+                                   num_shards=2))
+
+    selection.set_shard_meta(
+        cbt_utils.VideoShardMeta(shard_id=0,
+                                 num_videos=1,
+                                 status="finished",
+                                 num_shards=2))
+    _write_shard(1, 3)
+
+    index = selection.build_video_meta_index(num_shards=2)
+    expected = selection._lookup_all_video_metadata(num_shards=2)
+    self.assertEqual(len(index), 4)
+    self.assertEqual([index[i].as_dict() for i in range(len(index))],
+                     [vm.as_dict() for vm in expected])
+
+    path = os.path.join(tempfile.mkdtemp(), "video_meta_index.npy")
+    index.save(path)
+    loaded = cbt_utils.VideoMetaIndex.load(path)
+    self.assertTrue(isinstance(loaded.records, np.memmap))
+    self.assertEqual(loaded[3].as_dict(), index[3].as_dict())
+
+    # Nothing changed so only shard meta is read.
+    selection.table.num_read_calls = 0
+    refreshed = selection.build_video_meta_index(num_shards=2, previous=loaded)
+    self.assertEqual(selection.table.num_read_calls, 1)
+    self.assertTrue(np.array_equal(refreshed.records, index.records))
+
+    # Only the re-written shard is re-scanned.
+    _write_shard(1, 4)
+    selection.table.num_read_calls = 0
+    refreshed = selection.build_video_meta_index(num_shards=2, previous=loaded)
+    self.assertEqual(selection.table.num_read_calls, 2)
+    self.assertEqual(len(refreshed), 5)
+
+    generator = selection.sample_av_correspondence_examples(
+        frames_per_video=4, max_num_samples=2, video_meta_index=refreshed)
+    self.assertEqual(len(list(generator)), 2)
+
+  def test_video_meta_index_long_codec_names(self):
+
+    codec = codec_utils.ZstdCodec(level=9)
+    codec.name = "zstd_level9"
+    codec_utils.register_codec(codec)
+
+    index = cbt_utils.VideoMetaIndex(
+        cbt_utils._video_meta_to_records([
+            cbt_utils.VideoMeta(video_length=10,
+                                audio_length=5000,
+                                video_id=0,
+                                shard_id=0,
+                                frame_codec="zstd_level9",
+                                audio_codec="pcm16",
+                                frame_shape=[8, 8, 3])
+        ]))
+
+    path = os.path.join(tempfile.mkdtemp(), "video_meta_index.npy")
+    index.save(path)
+    loaded = cbt_utils.VideoMetaIndex.load(path)
+    self.assertEqual(loaded[0].frame_codec, "zstd_level9")
+    self.assertTrue(codec_utils.get_codec(loaded[0].frame_codec) is codec)
+
+    # Names that don't fit are rejected rather than truncated.
+    with self.assertRaises(ValueError):
+      cbt_utils._encode_codec_name("x" *
+                                   (codec_utils.MAX_CODEC_NAME_LENGTH + 1))
+
+  def test_random_load_from_generator_batched(self):
+
+    def _dummy_generator(n):
+      for i in range(n):
+        yield {"video": [i, 1, 2], "target": [i % 2]}
+
+    for num_producers, use_processes in [(1, False), (3, False), (2, True)]:
+
+      selection = _FakeTFExampleSelection(project="fake",
+                                          instance="fake",
+                                          table="fake",
+                                          prefix="train_")
+      selection.table = _FlakyFakeTable()
+
+      stats = cbt_utils.LoadStats()
+      num_loaded = selection.random_load_from_generator(
+          generator=_dummy_generator(50),
+          prefix_tag_length=8,
+          max_num_examples=40,
+          max_batch_rows=16,
+          num_producers=num_producers,
+          use_processes=use_processes,
+          load_stats=stats)
+
+      self.assertEqual(num_loaded, 40)
+      self.assertEqual(stats.num_examples, 41)
+      self.assertEqual(stats.num_rows_written, 41)
+      self.assertEqual(stats.failed, [])
+      self.assertTrue(stats.num_bytes > 0)
+      # Batches of at most 16 rows, each retried once.
+      self.assertTrue(selection.table.num_mutate_calls <= 6)
+
+  def test_batched_row_writer_keeps_original_error(self):
+
+    class _FailingFakeTable(cbt_test_utils.FakeTable):
+
+      def mutate_rows(self, rows):
+        return [cbt_test_utils.FakeStatus(code=14) for _ in rows]
+
+    def _write(error=None):
+      with cbt_utils.BatchedRowWriter(table=_FailingFakeTable(),
+                                      max_retries=0) as writer:
+        row = writer.table.row(b"key")
+        row.set_cell("cf", b"cf", b"value")
+        writer.add(row, num_bytes=5)
+        if error is not None:
+          raise error
+
+    # The failure to write is raised on a clean exit...
+    with self.assertRaises(ValueError):
+      _write()
+
+    # ...but doesn't replace an error raised within the block.
+    with self.assertRaises(KeyError):
+      _write(KeyError("original"))
+
+  def test_split_key_range(self):
+
+    self.assertEqual(cbt_utils._prefix_end_key("train_"), b"train`")
+    self.assertEqual(cbt_utils._prefix_end_key(b"a\xff\xff"), b"b")
+    self.assertEqual(cbt_utils._prefix_end_key(b"\xff"), b"")
+
+    sample_keys = [b"a", b"train_b", b"train_d", b"train_f", b"z", b""]
+
+    ranges = cbt_utils._split_key_range(b"train_", b"train`", sample_keys, 3)
+    self.assertEqual(ranges, [(b"train_", b"train_d"), (b"train_d", b"train_f"),
+                              (b"train_f", b"train`")])
+
+    ranges = cbt_utils._split_key_range(b"train_", b"train`", sample_keys, 1)
+    self.assertEqual(ranges, [(b"train_", b"train`")])
+
+    # No more ranges than sampled split points allow.
+    ranges = cbt_utils._split_key_range(b"", b"", sample_keys, 100)
+    self.assertEqual(len(ranges), 6)
+    self.assertEqual(ranges[0][0], b"")
+    self.assertEqual(ranges[-1][1], b"")
+
+  def test_tfexample_dataset(self):
+
+    selection = _FakeTFExampleSelection(project="fake",
+                                        instance="fake",
+                                        table="fake",
+                                        prefix="train_")
+
+    def _dummy_generator(n):
+      for i in range(n):
+        yield {"target": [i]}
+
+    selection.random_load_from_generator(generator=_dummy_generator(100),
+                                         prefix_tag_length=8)
+    num_rows = len(selection.table.rows)
+
+    # Rows outside of the prefix are not read.
+    row = selection.table.row(b"eval_aaaa")
+    row.set_cell("tfexample", "example", b"not an example")
+    selection.table.mutate_rows([row])
+
+    ranges = selection.key_ranges(num_ranges=4)
+    self.assertEqual(len(ranges), 4)
+
+    range_stats = cbt_utils.RangeReadStats()
+    serialized = []
+    for i, (start_key, end_key) in enumerate(ranges):
+      serialized.extend(
+          selection.iterate_serialized_range(start_key,
+                                             end_key,
+                                             range_stats=range_stats,
+                                             range_index=i))
+    self.assertEqual(len(serialized), num_rows)
+    self.assertEqual(sum(r["num_rows"] for r in range_stats.ranges.values()),
+                     num_rows)
+    self.assertEqual(len(range_stats.slowest(2)), 2)
+
+    dataset = selection.as_dataset(
+        num_ranges=4,
+        batch_size=10,
+        feature_spec={"target": tf.io.FixedLenFeature([1], tf.int64)})
+    next_batch = dataset.make_one_shot_iterator().get_next()
+    targets = []
+    with self.test_session() as sess:
+      while True:
+        try:
+          targets.extend(sess.run(next_batch)["target"].flatten().tolist())
+        except tf.errors.OutOfRangeError:
+          break
+    self.assertEqual(len(targets), num_rows)
+
+  def test_prefetch_av_correspondence_examples(self):
+
+    selection, _, _ = _make_fake_selection()
+
+    def _keys(example_sets):
+      return [
+          example_set["positive_same"].serialize() +
+          example_set["negative_same"].serialize()
+          for example_set in example_sets
+      ]
+
+    serial = list(
+        selection.sample_av_correspondence_examples(frames_per_video=4,
+                                                    max_num_samples=5,
+                                                    seed=1234))
+
+    stats = cbt_utils.PrefetchStats()
+    prefetched = list(
+        selection.sample_av_correspondence_examples(frames_per_video=4,
+                                                    max_num_samples=5,
+                                                    seed=1234,
+                                                    num_prefetch_workers=1,
+                                                    prefetch_stats=stats))
+
+    # A single worker seeded with `seed` reproduces the serial sequence.
+    self.assertEqual(_keys(serial), _keys(prefetched))
+    self.assertEqual(stats.num_samples, 5)
+    for example_set in prefetched:
+      self.assertEqual(example_set["positive_same"].video.shape, (4, 192))
+
+    prefetched = list(
+        selection.sample_av_correspondence_examples(frames_per_video=4,
+                                                    max_num_samples=17,
+                                                    num_prefetch_workers=3,
+                                                    prefetch_queue_depth=2))
+    self.assertEqual(len(prefetched), 17)
+
+    # Closing an unbounded generator early stops its workers.
+    generator = selection.sample_av_correspondence_examples(
+        frames_per_video=4, num_prefetch_workers=2)
+    generator.__next__()
+    generator.close()
+
   """
   def test_generate_av_correspondence_examples(self):
 
@@ -283,5 +1102,50 @@ class TestCBTUtils(tf.test.TestCase):
   """
 
 
+class CBTUtilsBenchmark(tf.test.Benchmark):
+  """Compares read paths against a fake table with simulated latency.
+
+  Run with `python cbt_utils_test.py --benchmarks=.`.
+
+  """
+
+  def benchmark_key_generation(self, num_frames=32, iters=1000):
+
+    indices = np.arange(100, 100 + num_frames)
+
+    start = time.time()
+    for _ in range(iters):
+      _ = [cbt_utils.make_frame_key("train", 12, 345, i) for i in indices]
+    self.report_benchmark(name="make_frame_key_per_index",
+                          iters=iters,
+                          wall_time=(time.time() - start) / iters)
+
+    start = time.time()
+    for _ in range(iters):
+      _ = cbt_utils.make_frame_keys("train", 12, 345, indices)
+    self.report_benchmark(name="make_frame_keys_batched",
+                          iters=iters,
+                          wall_time=(time.time() - start) / iters)
+
+  def benchmark_lookup_frame_data(self, num_frames=32, latency=0.002):
+
+    selection, _, _ = _make_fake_selection(num_frames=num_frames + 1)
+    selection.table.latency = latency
+    meta = selection._lookup_all_video_metadata()[0]
+    frame_keys = selection._frame_keys_for_indices(np.arange(num_frames),
+                                                   meta=meta)
+
+    for batched in [False, True]:
+      selection.table.num_read_calls = 0
+      start = time.time()
+      selection._lookup_frame_data(frame_keys, batched=batched)
+      self.report_benchmark(
+          name="lookup_frame_data_{}".format(
+              "batched" if batched else "per_row"),
+          iters=1,
+          wall_time=time.time() - start,
+          extras={"round_trips": selection.table.num_read_calls})
+
+
 if __name__ == "__main__":
   tf.test.main()
@@ -0,0 +1,214 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Codecs for the values of video frame and audio cells.
+
+The codec used for a video's frames and audio is recorded in its
+`cbt_utils.VideoMeta` so readers can decode accordingly. The default
+"raw" codec matches what was written before codecs were introduced:
+values cast to uint8 and stored as raw bytes.
+
+"""
+
+import numpy as np
+
+
+def _zstd():
+  """zstandard importer, for cases where it is specifically needed."""
+  try:
+    import zstandard  # pylint: disable=g-import-not-at-top
+  except ImportError:
+    raise ImportError("The zstd codec requires the zstandard package.")
+  return zstandard
+
+
+def _lz4_frame():
+  """lz4.frame importer, for cases where it is specifically needed."""
+  try:
+    import lz4.frame  # pylint: disable=g-import-not-at-top
+  except ImportError:
+    raise ImportError("The lz4 codec requires the lz4 package.")
+  return lz4.frame
+
+
+def _cv2():
+  """OpenCV importer, for cases where it is specifically needed."""
+  import cv2  # pylint: disable=g-import-not-at-top
+  return cv2
+
+
+class Codec(object):
+  """Encodes arrays to cell values and decodes them to flat arrays."""
+
+  name = None
+
+  # The dtype of decoded arrays.
+  dtype = np.uint8
+
+  def encode(self, array):
+    raise NotImplementedError()
+
+  def decode(self, value, shape=None):
+    """Decode `value` to a 1D array; `shape` is the encoded array's shape."""
+    raise NotImplementedError()
+
+
+class RawCodec(Codec):
+  """Values cast to uint8 and stored as raw bytes."""
+
+  name = "raw"
+
+  def encode(self, array):
+    return np.asarray(array).astype(np.uint8, copy=False).tobytes()
+
+  def decode(self, value, shape=None):
+    return np.frombuffer(value, dtype=np.uint8)
+
+
+class ZstdCodec(RawCodec):
+  """Raw uint8 bytes compressed as a zstd frame."""
+
+  name = "zstd"
+
+  def __init__(self, level=3):
+    self.level = level
+
+  def encode(self, array):
+    raw = super(ZstdCodec, self).encode(array)
+    return _zstd().ZstdCompressor(level=self.level).compress(raw)
+
+  def decode(self, value, shape=None):
+    raw = _zstd().ZstdDecompressor().decompress(value)
+    return super(ZstdCodec, self).decode(raw)
+
+
+class LZ4Codec(RawCodec):
+  """Raw uint8 bytes compressed as an lz4 frame."""
+
+  name = "lz4"
+
+  def encode(self, array):
+    raw = super(LZ4Codec, self).encode(array)
+    return _lz4_frame().compress(raw)
+
+  def decode(self, value, shape=None):
+    return super(LZ4Codec, self).decode(_lz4_frame().decompress(value))
+
+
+class ImageCodec(Codec):
+  """A frame encoded as an image file with OpenCV.
+
+  Frames must be (H, W) or (H, W, C) uint8 arrays; channels are encoded
+  in the order given and decoded in the same order.
+
+  """
+
+  extension = None
+
+  def _params(self):
+    return []
+
+  def encode(self, array):
+    array = np.asarray(array).astype(np.uint8, copy=False)
+    ok, encoded = _cv2().imencode(self.extension, array, self._params())
+    if not ok:
+      raise ValueError("Failed to encode frame of shape {} as {}.".format(
+          array.shape, self.name))
+    return encoded.tobytes()
+
+  def decode(self, value, shape=None):
+    cv2 = _cv2()
+    decoded = cv2.imdecode(np.frombuffer(value, dtype=np.uint8),
+                           cv2.IMREAD_UNCHANGED)
+    if decoded is None:
+      raise ValueError("Failed to decode {} frame.".format(self.name))
+    return decoded.reshape(-1)
+
+
+class PNGCodec(ImageCodec):
+  """Lossless per frame PNG."""
+
+  name = "png"
+  extension = ".png"
+
+
+class JPEGCodec(ImageCodec):
+  """Lossy per frame JPEG."""
+
+  name = "jpeg"
+  extension = ".jpg"
+
+  def __init__(self, quality=90):
+    self.quality = quality
+
+  def _params(self):
+    return [_cv2().IMWRITE_JPEG_QUALITY, self.quality]
+
+
+class PCM16Codec(Codec):
+  """Float audio in [-1, 1] stored as little-endian 16 bit PCM.
+
+  Unlike "raw", which casts audio to uint8, this preserves float audio
+  such as that produced by `audio_utils.mp4_to_1d_array`.
+
+  """
+
+  name = "pcm16"
+  dtype = np.float32
+
+  _scale = float(np.iinfo(np.int16).max)
+
+  def encode(self, array):
+    array = np.clip(np.asarray(array, dtype=np.float32), -1.0, 1.0)
+    return np.round(array * self._scale).astype("<i2").tobytes()
+
+  def decode(self, value, shape=None):
+    pcm = np.frombuffer(value, dtype="<i2")
+    return pcm.astype(np.float32) / self._scale
+
+
+_CODECS = {}
+
+# The longest codec name, in bytes, that fits in a `VideoMetaIndex`.
+MAX_CODEC_NAME_LENGTH = 32
+
+
+def register_codec(codec):
+  if not isinstance(codec, Codec):
+    raise ValueError("Expected a Codec, saw {}.".format(type(codec)))
+  if len(codec.name.encode()) > MAX_CODEC_NAME_LENGTH:
+    raise ValueError(
+        "Expected a codec name of at most {} bytes, saw {}.".format(
+            MAX_CODEC_NAME_LENGTH, codec.name))
+  _CODECS[codec.name] = codec
+  return codec
+
+
+def get_codec(name):
+  if name not in _CODECS:
+    raise ValueError("Unrecognized codec {}, expected one of {}.".format(
+        name, sorted(_CODECS.keys())))
+  return _CODECS[name]
+
+
+FRAME_CODECS = ["raw", "zstd", "lz4", "png", "jpeg"]
+AUDIO_CODECS = ["raw", "zstd", "lz4", "pcm16"]
+
+for _codec in [
+    RawCodec(),
+    ZstdCodec(),
+    LZ4Codec(),
+    PNGCodec(),
+    JPEGCodec(),
+    PCM16Codec()
+]:
+  register_codec(_codec)
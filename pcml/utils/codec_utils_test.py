@@ -0,0 +1,135 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of frame and audio cell codecs."""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from clarify.utils import codec_utils
+
+
+def _synthetic_frame(shape=(96, 128, 3)):
+  """A smooth gradient with mild noise, roughly like a video frame."""
+  h, w, c = shape
+  gradient = (np.arange(h)[:, None, None] + np.arange(w)[None, :, None] +
+              np.arange(c)[None, None, :] * 40)
+  noise = np.random.randint(0, 8, shape)
+  return ((gradient + noise) % 256).astype(np.uint8)
+
+
+def _synthetic_audio(length=16000):
+  t = np.arange(length) / 16000.0
+  return (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def _available(name):
+  codec = codec_utils.get_codec(name)
+  try:
+    codec.encode(np.zeros((4, 4, 3), dtype=np.uint8))
+  except ImportError:
+    return False
+  return True
+
+
+class TestCodecUtils(tf.test.TestCase):
+
+  def test_lossless_frame_codecs_round_trip(self):
+
+    frame = _synthetic_frame()
+
+    for name in ["raw", "zstd", "lz4", "png"]:
+      if not _available(name):
+        continue
+      codec = codec_utils.get_codec(name)
+      decoded = codec.decode(codec.encode(frame), shape=frame.shape)
+      self.assertEqual(decoded.dtype, np.uint8)
+      self.assertAllEqual(decoded, frame.reshape(-1))
+
+  def test_jpeg_is_approximate(self):
+
+    frame = _synthetic_frame()
+    codec = codec_utils.get_codec("jpeg")
+
+    encoded = codec.encode(frame)
+    decoded = codec.decode(encoded, shape=frame.shape)
+
+    self.assertTrue(len(encoded) < frame.nbytes)
+    self.assertEqual(decoded.shape, (frame.size,))
+    error = np.abs(decoded.astype(np.int32) - frame.reshape(-1))
+    self.assertTrue(np.mean(error) < 8)
+
+  def test_pcm16_preserves_float_audio(self):
+
+    audio = _synthetic_audio()
+    codec = codec_utils.get_codec("pcm16")
+
+    encoded = codec.encode(audio)
+    decoded = codec.decode(encoded)
+
+    self.assertEqual(len(encoded), 2 * len(audio))
+    self.assertEqual(decoded.dtype, np.float32)
+    self.assertAllClose(decoded, audio, atol=1.0 / 32767)
+
+    # Out of range values are clipped.
+    decoded = codec.decode(codec.encode(np.array([-2.0, 2.0])))
+    self.assertAllClose(decoded, [-1.0, 1.0])
+
+  def test_unknown_codec(self):
+    with self.assertRaises(ValueError):
+      codec_utils.get_codec("gif")
+
+  def test_register_codec_rejects_long_names(self):
+    codec = codec_utils.RawCodec()
+    codec.name = "r" * (codec_utils.MAX_CODEC_NAME_LENGTH + 1)
+    with self.assertRaises(ValueError):
+      codec_utils.register_codec(codec)
+    with self.assertRaises(ValueError):
+      codec_utils.get_codec(codec.name)
+
+
+class CodecUtilsBenchmark(tf.test.Benchmark):
+
+  def benchmark_codecs(self, num_rows=64):
+    """Report the bytes per row and decode cost of each available codec."""
+
+    frame = _synthetic_frame()
+    audio_block = _synthetic_audio(1000)
+
+    for name in ["raw", "zstd", "lz4", "png", "jpeg", "pcm16"]:
+
+      if not _available(name):
+        continue
+
+      codec = codec_utils.get_codec(name)
+      value = audio_block if name == "pcm16" else frame
+      encoded = codec.encode(value)
+
+      start = time.time()
+      for _ in range(num_rows):
+        codec.decode(encoded, shape=value.shape)
+      decode_secs = (time.time() - start) / num_rows
+
+      self.report_benchmark(name="codec_{}".format(name),
+                            iters=num_rows,
+                            wall_time=decode_secs,
+                            extras={
+                                "bytes_per_row": len(encoded),
+                                "input_bytes_per_row": value.nbytes,
+                                "decode_secs_per_row": decode_secs
+                            })
+
+
+if __name__ == "__main__":
+  tf.test.main()
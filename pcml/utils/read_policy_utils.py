@@ -0,0 +1,290 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Deadlines, retries and hedged requests for Cloud Bigtable reads."""
+
+import bisect
+import random
+import threading
+import time
+
+from concurrent import futures
+
+from google.api_core import exceptions as api_exceptions
+
+
+class ReadDeadlineExceeded(Exception):
+  """A read did not complete within its `ReadPolicy` deadline."""
+
+
+# Errors after which a read may succeed if re-issued.
+RETRYABLE_ERRORS = (ReadDeadlineExceeded, api_exceptions.DeadlineExceeded,
+                    api_exceptions.ServiceUnavailable, api_exceptions.Aborted,
+                    api_exceptions.TooManyRequests)
+
+
+class LatencyHistogram(object):
+  """A thread-safe histogram of latencies with exponentially sized buckets.
+
+  Bucket `i` counts latencies no greater than `bounds[i]`, and greater
+  than `bounds[i - 1]`, with a last bucket for those beyond `bounds[-1]`.
+  Percentiles are estimated as the upper bound of the bucket in which
+  they fall.
+
+  """
+
+  def __init__(self, min_secs=1e-4, max_secs=100.0, growth_factor=2.0):
+
+    if min_secs <= 0 or max_secs <= min_secs or growth_factor <= 1:
+      raise ValueError(
+          "Expected 0 < min_secs < max_secs and growth_factor > 1, saw "
+          "{}, {}, {}.".format(min_secs, max_secs, growth_factor))
+
+    self.bounds = []
+    bound = min_secs
+    while bound < max_secs:
+      self.bounds.append(bound)
+      bound *= growth_factor
+    self.bounds.append(max_secs)
+
+    self.counts = [0] * (len(self.bounds) + 1)
+    self.count = 0
+    self.total_secs = 0.0
+    self.max_secs = 0.0
+
+    self._lock = threading.Lock()
+
+  def record(self, secs):
+    bucket = bisect.bisect_left(self.bounds, secs)
+    with self._lock:
+      self.counts[bucket] += 1
+      self.count += 1
+      self.total_secs += secs
+      self.max_secs = max(self.max_secs, secs)
+
+  def percentile(self, q):
+    """The estimated `q`th percentile latency, or None if empty."""
+
+    if not 0 <= q <= 100:
+      raise ValueError("Expected 0 <= q <= 100, saw {}.".format(q))
+
+    with self._lock:
+      if self.count == 0:
+        return None
+      rank = q / 100.0 * self.count
+      cumulative = 0
+      for bucket, count in enumerate(self.counts):
+        cumulative += count
+        if cumulative >= rank and count > 0:
+          if bucket == len(self.bounds):
+            return self.max_secs
+          return min(self.bounds[bucket], self.max_secs)
+      return self.max_secs
+
+  def as_dict(self):
+    mean_secs = self.total_secs / self.count if self.count else 0.0
+    return {
+        "count": self.count,
+        "mean_secs": mean_secs,
+        "max_secs": self.max_secs,
+        "p50_secs": self.percentile(50),
+        "p90_secs": self.percentile(90),
+        "p99_secs": self.percentile(99),
+        "buckets": {
+            str(bound): count
+            for bound, count in zip(self.bounds + ["inf"], self.counts)
+            if count > 0
+        }
+    }
+
+
+class ReadPolicy(object):
+  """Deadlines, retries with backoff and hedging for named read operations.
+
+  `call(op, fn)` invokes `fn` until it succeeds or `max_attempts` attempts
+  have failed with one of `retryable_errors`, sleeping between attempts
+  for an exponentially growing, jittered backoff. Other errors are raised
+  immediately.
+
+  When `deadline_secs` is set an attempt that has not completed within it
+  fails with `ReadDeadlineExceeded`. When `hedge_percentile` is set and
+  `op` has at least `hedge_min_samples` recorded latencies, a duplicate of
+  an attempt that is still outstanding after that percentile of `op`'s
+  latency is issued and whichever completes first is used. The latency of
+  each successful attempt is recorded in a `LatencyHistogram` per op.
+
+  Attempts with a deadline or hedging run on a shared thread pool. Timed
+  out or losing attempts cannot be cancelled and run to completion in the
+  background, so `fn` should be idempotent, as reads are.
+
+  """
+
+  def __init__(self,
+               deadline_secs=None,
+               max_attempts=3,
+               initial_backoff_secs=0.05,
+               max_backoff_secs=2.0,
+               backoff_multiplier=2.0,
+               jitter=0.5,
+               hedge_percentile=None,
+               hedge_min_samples=20,
+               retryable_errors=RETRYABLE_ERRORS,
+               max_workers=8):
+
+    if max_attempts < 1:
+      raise ValueError(
+          "Expected max_attempts >= 1, saw {}.".format(max_attempts))
+    if deadline_secs is not None and deadline_secs <= 0:
+      raise ValueError(
+          "Expected deadline_secs > 0, saw {}.".format(deadline_secs))
+    if hedge_percentile is not None and not 0 < hedge_percentile < 100:
+      raise ValueError("Expected 0 < hedge_percentile < 100, saw {}.".format(
+          hedge_percentile))
+    if not 0 <= jitter <= 1:
+      raise ValueError("Expected 0 <= jitter <= 1, saw {}.".format(jitter))
+
+    self.deadline_secs = deadline_secs
+    self.max_attempts = max_attempts
+    self.initial_backoff_secs = initial_backoff_secs
+    self.max_backoff_secs = max_backoff_secs
+    self.backoff_multiplier = backoff_multiplier
+    self.jitter = jitter
+    self.hedge_percentile = hedge_percentile
+    self.hedge_min_samples = hedge_min_samples
+    self.retryable_errors = tuple(retryable_errors)
+    self.max_workers = max_workers
+
+    self.histograms = {}
+    self.num_calls = 0
+    self.num_retries = 0
+    self.num_deadline_exceeded = 0
+    self.num_hedges = 0
+    self.num_hedge_wins = 0
+
+    self._executor = None
+    self._lock = threading.Lock()
+
+  def _get_executor(self):
+    with self._lock:
+      if self._executor is None:
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=self.max_workers)
+      return self._executor
+
+  def histogram(self, op):
+    with self._lock:
+      if op not in self.histograms:
+        self.histograms[op] = LatencyHistogram()
+      return self.histograms[op]
+
+  def _increment(self, counter):
+    with self._lock:
+      setattr(self, counter, getattr(self, counter) + 1)
+
+  def backoff_secs(self, attempt):
+    """The jittered backoff before re-trying after failed `attempt`."""
+    backoff = min(self.max_backoff_secs,
+                  self.initial_backoff_secs * self.backoff_multiplier**attempt)
+    return backoff * (1 - self.jitter * random.random())
+
+  def _hedge_after_secs(self, op):
+    if self.hedge_percentile is None:
+      return None
+    histogram = self.histogram(op)
+    if histogram.count < self.hedge_min_samples:
+      return None
+    return histogram.percentile(self.hedge_percentile)
+
+  def _timed(self, fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+  def _attempt(self, op, fn):
+
+    hedge_after_secs = self._hedge_after_secs(op)
+
+    if self.deadline_secs is None and hedge_after_secs is None:
+      result, secs = self._timed(fn)
+      self.histogram(op).record(secs)
+      return result
+
+    start = time.time()
+    executor = self._get_executor()
+    primary = executor.submit(self._timed, fn)
+    pending = set([primary])
+    done = set()
+
+    if hedge_after_secs is not None:
+      first_wait = hedge_after_secs
+      if self.deadline_secs is not None:
+        first_wait = min(first_wait, self.deadline_secs)
+      done, pending = futures.wait(pending, timeout=first_wait)
+      if not done and (self.deadline_secs is None or
+                       time.time() - start < self.deadline_secs):
+        self._increment("num_hedges")
+        pending.add(executor.submit(self._timed, fn))
+
+    while True:
+
+      # Completed requests, including a primary that completed before the
+      # hedge threshold, return their result or raise their error.
+      for future in done:
+        if future.exception() is not None and pending:
+          # Wait on the other request before giving up on this attempt.
+          continue
+        result, secs = future.result()
+        if future is not primary:
+          self._increment("num_hedge_wins")
+        self.histogram(op).record(secs)
+        return result
+
+      timeout = None
+      if self.deadline_secs is not None:
+        timeout = max(0.0, self.deadline_secs - (time.time() - start))
+
+      done, pending = futures.wait(pending,
+                                   timeout=timeout,
+                                   return_when=futures.FIRST_COMPLETED)
+
+      if not done:
+        self._increment("num_deadline_exceeded")
+        raise ReadDeadlineExceeded("{} did not complete within {}s.".format(
+            op, self.deadline_secs))
+
+  def call(self, op, fn):
+    """Call `fn` under this policy, recording its latency under `op`."""
+
+    self._increment("num_calls")
+
+    for attempt in range(self.max_attempts):
+      try:
+        return self._attempt(op, fn)
+      except self.retryable_errors:
+        if attempt == self.max_attempts - 1:
+          raise
+        self._increment("num_retries")
+        time.sleep(self.backoff_secs(attempt))
+
+  def as_dict(self):
+    with self._lock:
+      histograms = dict(self.histograms)
+    return {
+        "num_calls": self.num_calls,
+        "num_retries": self.num_retries,
+        "num_deadline_exceeded": self.num_deadline_exceeded,
+        "num_hedges": self.num_hedges,
+        "num_hedge_wins": self.num_hedge_wins,
+        "latency": {
+            op: h.as_dict() for op, h in histograms.items()
+        }
+    }
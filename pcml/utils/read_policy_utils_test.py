@@ -0,0 +1,165 @@
+# coding=utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the Bigtable read policy."""
+
+import threading
+import time
+
+import tensorflow as tf
+
+from google.api_core import exceptions as api_exceptions
+
+from clarify.utils import read_policy_utils
+
+
+class _FlakyRead(object):
+  """Raises `errors` in turn then returns "ok", sleeping `delays` in turn."""
+
+  def __init__(self, errors=(), delays=()):
+    self.errors = list(errors)
+    self.delays = list(delays)
+    self.num_calls = 0
+    self._lock = threading.Lock()
+
+  def __call__(self):
+    with self._lock:
+      self.num_calls += 1
+      error = self.errors.pop(0) if self.errors else None
+      delay = self.delays.pop(0) if self.delays else 0
+    time.sleep(delay)
+    if error is not None:
+      raise error
+    return "ok"
+
+
+class TestReadPolicy(tf.test.TestCase):
+
+  def test_latency_histogram(self):
+
+    histogram = read_policy_utils.LatencyHistogram(min_secs=0.001, max_secs=1.0)
+    for _ in range(90):
+      histogram.record(0.0015)
+    for _ in range(10):
+      histogram.record(0.3)
+
+    self.assertEqual(histogram.count, 100)
+    self.assertEqual(histogram.percentile(50), 0.002)
+    self.assertTrue(0.3 <= histogram.percentile(99) <= 0.512)
+    self.assertEqual(histogram.as_dict()["max_secs"], 0.3)
+
+    histogram.record(5.0)
+    self.assertEqual(histogram.percentile(100), 5.0)
+
+  def test_retries_only_retryable_errors(self):
+
+    policy = read_policy_utils.ReadPolicy(max_attempts=3,
+                                          initial_backoff_secs=0.001)
+
+    read = _FlakyRead(errors=[
+        api_exceptions.ServiceUnavailable("down"),
+        api_exceptions.DeadlineExceeded("slow")
+    ])
+    self.assertEqual(policy.call("read", read), "ok")
+    self.assertEqual(read.num_calls, 3)
+    self.assertEqual(policy.num_retries, 2)
+
+    read = _FlakyRead(errors=[api_exceptions.ServiceUnavailable("down")] * 3)
+    with self.assertRaises(api_exceptions.ServiceUnavailable):
+      policy.call("read", read)
+    self.assertEqual(read.num_calls, 3)
+
+    # Real errors are raised without retrying.
+    read = _FlakyRead(errors=[api_exceptions.NotFound("missing table")])
+    with self.assertRaises(api_exceptions.NotFound):
+      policy.call("read", read)
+    self.assertEqual(read.num_calls, 1)
+
+  def test_backoff_is_bounded_and_jittered(self):
+
+    policy = read_policy_utils.ReadPolicy(initial_backoff_secs=0.1,
+                                          max_backoff_secs=1.0,
+                                          jitter=0.5)
+    for attempt in range(10):
+      backoff = policy.backoff_secs(attempt)
+      expected = min(1.0, 0.1 * 2**attempt)
+      self.assertTrue(0.5 * expected <= backoff <= expected)
+
+  def test_deadline(self):
+
+    policy = read_policy_utils.ReadPolicy(deadline_secs=0.05,
+                                          max_attempts=2,
+                                          initial_backoff_secs=0.001)
+
+    read = _FlakyRead(delays=[0.5, 0.0])
+    self.assertEqual(policy.call("read", read), "ok")
+    self.assertEqual(policy.num_deadline_exceeded, 1)
+
+    read = _FlakyRead(delays=[0.5, 0.5])
+    with self.assertRaises(read_policy_utils.ReadDeadlineExceeded):
+      policy.call("read", read)
+
+  def test_hedged_reads(self):
+
+    policy = read_policy_utils.ReadPolicy(hedge_percentile=90,
+                                          hedge_min_samples=10)
+
+    for _ in range(10):
+      policy.call("read", _FlakyRead(delays=[0.002]))
+    self.assertEqual(policy.num_hedges, 0)
+
+    # A straggler is hedged and the duplicate returns first.
+    read = _FlakyRead(delays=[1.0, 0.0])
+    start = time.time()
+    self.assertEqual(policy.call("read", read), "ok")
+    self.assertTrue(time.time() - start < 0.5)
+    self.assertEqual(read.num_calls, 2)
+    self.assertEqual(policy.num_hedges, 1)
+    self.assertEqual(policy.num_hedge_wins, 1)
+
+    stats = policy.as_dict()
+    self.assertEqual(stats["latency"]["read"]["count"], 11)
+
+  def test_hedged_reads_completing_before_threshold(self):
+
+    for deadline_secs in [None, 5.0]:
+
+      policy = read_policy_utils.ReadPolicy(deadline_secs=deadline_secs,
+                                            max_attempts=2,
+                                            initial_backoff_secs=0.001,
+                                            hedge_percentile=90,
+                                            hedge_min_samples=2)
+
+      for _ in range(2):
+        policy.call("read", _FlakyRead(delays=[0.05]))
+
+      # A primary faster than the threshold returns its result...
+      read = _FlakyRead()
+      self.assertEqual(policy.call("read", read), "ok")
+      self.assertEqual(read.num_calls, 1)
+      self.assertEqual(policy.num_hedges, 0)
+      self.assertEqual(policy.histogram("read").count, 3)
+
+      # ...and one failing faster is retried, or raised.
+      read = _FlakyRead(errors=[api_exceptions.ServiceUnavailable("down")])
+      self.assertEqual(policy.call("read", read), "ok")
+      self.assertEqual(read.num_calls, 2)
+      self.assertEqual(policy.num_retries, 1)
+
+      read = _FlakyRead(errors=[api_exceptions.NotFound("missing table")])
+      with self.assertRaises(api_exceptions.NotFound):
+        policy.call("read", read)
+      self.assertEqual(read.num_calls, 1)
+
+
+if __name__ == "__main__":
+  tf.test.main()
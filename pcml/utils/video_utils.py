@@ -13,11 +13,19 @@
 
 import tensorflow as tf
 import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
 from PIL import Image
 
 import numpy as np
 import cv2
 
+from antidote.utils import audio_utils
+
 
 def mp4_to_frame_array(input_path):
 
@@ -41,10 +49,6 @@ def mp4_to_frame_array(input_path):
 
       frames.append(frame)
 
-      # Press Q on keyboard to  exit
-      if cv2.waitKey(25) & 0xFF == ord('q'):
-        break
-
     # Break the loop
     else:
       break
@@ -55,14 +59,75 @@ def mp4_to_frame_array(input_path):
   return np.asarray(frames)
 
 
-def resize_video(input_frame_array, size):
+def resize_frames(frames,
+                  size,
+                  interpolation=cv2.INTER_AREA,
+                  dtype=None,
+                  out=None):
+  """Resize a batch of frames with OpenCV, optionally into `out`.
+
+  Args:
+    frames(np.ndarray): Frames of shape (N, H, W) or (N, H, W, C).
+    size(int or tuple): The (height, width) of resized frames, or their
+      side if an int.
+    interpolation(int): The `cv2.resize` interpolation.
+    dtype: The dtype of the resized frames, by default that of `frames`,
+      e.g. float32 to resize uint8 frames without rounding.
+    out(np.ndarray): Optionally, a C-contiguous array of the resized shape
+      and `dtype` into which to resize, in which case no arrays of that
+      size are allocated.
+
+  Returns:
+    np.ndarray: The resized frames, `out` if it was provided.
+
+  """
+
+  frames = np.asarray(frames)
+
+  if frames.ndim not in (3, 4):
+    raise ValueError("Expected frames of shape (N, H, W[, C]), saw {}.".format(
+        frames.shape))
+
+  if isinstance(size, int):
+    size = (size, size)
+
+  height, width = size
+  dtype = np.dtype(dtype or frames.dtype)
+  shape = (len(frames), height, width) + frames.shape[3:]
+
+  if out is None:
+    out = np.empty(shape, dtype=dtype)
+  elif (out.shape != shape or out.dtype != dtype or
+        not out.flags["C_CONTIGUOUS"]):
+    raise ValueError("Expected a C-contiguous out of shape {} and dtype {}, "
+                     "saw {} and {}.".format(shape, dtype, out.shape,
+                                             out.dtype))
+
+  # cv2 drops trailing single channels, so resize those as 2D frames.
+  squeeze = frames.ndim == 4 and frames.shape[3] == 1
+
+  scratch = None
+  if frames.dtype != dtype:
+    scratch = np.empty(frames.shape[1:], dtype=dtype)
+
+  for i, frame in enumerate(frames):
+
+    if scratch is not None:
+      np.copyto(scratch, frame, casting="unsafe")
+      frame = scratch
 
-  with tf.Session() as sess:
-    img = tf.constant(input_frame_array)
-    resize_op = tf.image.resize_images(img, [size, size],
-                                       tf.image.ResizeMethod.AREA)
-    resized = sess.run([resize_op])[0].tolist()
-  return resized
+    dst = out[i]
+    if squeeze:
+      frame, dst = frame[..., 0], dst[..., 0]
+
+    cv2.resize(frame, (width, height), dst=dst, interpolation=interpolation)
+
+  return out
+
+
+def resize_video(input_frame_array, size):
+  """Area resize frames to (`size`, `size`) as float32 nested lists."""
+  return resize_frames(input_frame_array, size, dtype=np.float32).tolist()
 
 
 def stream_mp4(input_path, downsample_size=(96, 96), greyscale=False):
@@ -109,6 +174,428 @@ def stream_mp4(input_path, downsample_size=(96, 96), greyscale=False):
   cap.release()
 
 
+def _seek(cap, input_path, start_frame):
+  """Position `cap` at `start_frame`, grabbing forward if seeking fails."""
+
+  if start_frame == 0:
+    return cap
+
+  cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+  if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start_frame:
+    return cap
+
+  # Not all containers and backends support seeking, in which case fall
+  # back to grabbing, without retrieving, the preceding frames.
+  cap.release()
+  cap = cv2.VideoCapture(input_path)
+  for _ in range(start_frame):
+    if not cap.grab():
+      break
+  return cap
+
+
+def decode_mp4_frames(input_path,
+                      downsample_size=(96, 96),
+                      greyscale=False,
+                      start_frame=0,
+                      num_frames=None,
+                      stride=1,
+                      interpolation=cv2.INTER_AREA,
+                      out=None):
+  """Decode `num_frames` frames, every `stride`th from `start_frame`.
+
+  A faster alternative to `stream_mp4` for when only a window of a video
+  is needed. The capture seeks directly to `start_frame`, frames between
+  those sampled are grabbed but not retrieved, and each frame is resized
+  with `cv2.resize` before color conversion, straight into its slice of
+  the output array.
+
+  Args:
+    input_path(str): Path to the video.
+    downsample_size(tuple): The (width, height) to which to resize frames,
+      or None to keep their size.
+    greyscale(bool): Whether to convert frames to greyscale.
+    start_frame(int): The index of the first frame to decode.
+    num_frames(int): The number of frames to decode, by default through
+      the end of the video.
+    stride(int): The step between decoded frames.
+    interpolation(int): The `cv2.resize` interpolation.
+    out(np.ndarray): Optionally, a uint8 array of shape (num_frames, height,
+      width[, 3]) into which to decode, e.g. to re-use across videos.
+
+  Returns:
+    np.ndarray: The decoded frames, fewer than `num_frames` if the video
+      ended first; a view of `out` when it is provided.
+
+  """
+
+  if start_frame < 0 or stride < 1:
+    raise ValueError("Expected start_frame >= 0 and stride >= 1, saw "
+                     "{}, {}.".format(start_frame, stride))
+
+  if downsample_size is not None and len(downsample_size) != 2:
+    raise ValueError("If downsampling expected size of len 2, saw {}".format(
+        downsample_size))
+
+  cap = cv2.VideoCapture(input_path)
+
+  if not cap.isOpened():
+    raise ValueError(
+        "Error opening video stream or file: {}".format(input_path))
+
+  if num_frames is None:
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    num_frames = max(0, int(math.ceil((num_frames - start_frame) / stride)))
+
+  if out is not None and out.shape[0] < num_frames:
+    raise ValueError("Expected out to hold {} frames, saw shape {}.".format(
+        num_frames, out.shape))
+
+  color_conversion = cv2.COLOR_BGR2RGB
+  if greyscale:
+    color_conversion = cv2.COLOR_BGR2GRAY
+
+  cap = _seek(cap, input_path, start_frame)
+
+  frame = None
+  resized = None
+  num_decoded = 0
+
+  try:
+    while num_decoded < num_frames:
+
+      ret, frame = cap.read(frame)
+      if not ret:
+        break
+
+      if downsample_size is not None:
+        resized = cv2.resize(frame,
+                             tuple(downsample_size),
+                             dst=resized,
+                             interpolation=interpolation)
+      else:
+        resized = frame
+
+      shape = resized.shape[:2] if greyscale else resized.shape
+      if out is None:
+        out = np.empty((num_frames,) + shape, dtype=np.uint8)
+      elif out.shape[1:] != shape or out.dtype != np.uint8:
+        raise ValueError("Expected out of uint8 frames of shape {}, saw {} "
+                         "of shape {}.".format(shape, out.dtype, out.shape[1:]))
+
+      cv2.cvtColor(resized, color_conversion, dst=out[num_decoded])
+      num_decoded += 1
+
+      if num_decoded < num_frames:
+        for _ in range(stride - 1):
+          if not cap.grab():
+            break
+
+  finally:
+    cap.release()
+
+  if out is None:
+    return np.empty((0,), dtype=np.uint8)
+
+  return out[:num_decoded]
+
+
+def keyframe_indices(input_path):
+  """The indices of the video packets of `input_path` that are keyframes.
+
+  Uses `ffprobe`, returning None if it is unavailable or fails. Indices are
+  in decode order, which matches frame order for streams without
+  B-frames and is close to it otherwise.
+
+  """
+
+  try:
+    output = subprocess.check_output([
+        "ffprobe", "-loglevel", "quiet", "-select_streams", "v:0",
+        "-show_entries", "packet=flags", "-of", "csv=p=0", input_path
+    ])
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+  flags = output.decode("utf-8").split()
+
+  return [i for i, flag in enumerate(flags) if "K" in flag]
+
+
+def segment_frames(num_frames, num_segments, keyframes=None):
+  """Split [0, num_frames) into at most `num_segments` contiguous segments.
+
+  Boundaries are evenly spaced then, when `keyframes` are given, moved
+  back to the nearest keyframe so that no segment decodes frames that
+  precede it.
+
+  Returns:
+    list: (start_frame, num_frames) of each non-empty segment.
+
+  """
+
+  if num_segments < 1:
+    raise ValueError("Expected num_segments >= 1, saw {}.".format(num_segments))
+
+  boundaries = set([0])
+  for i in range(1, num_segments):
+    boundary = i * num_frames // num_segments
+    if keyframes:
+      boundary = max([k for k in keyframes if k <= boundary] or [0])
+    boundaries.add(boundary)
+
+  boundaries = sorted(boundaries) + [num_frames]
+
+  return [(start, end - start)
+          for start, end in zip(boundaries[:-1], boundaries[1:])
+          if end > start]
+
+
+def _decode_segment(task):
+  """Pool entry point decoding one segment into a shared frame memmap."""
+
+  frames = np.memmap(task["memmap_path"],
+                     dtype=np.uint8,
+                     mode="r+",
+                     shape=task["shape"])
+
+  start_frame, num_frames = task["segment"]
+
+  decoded = decode_mp4_frames(task["input_path"],
+                              start_frame=start_frame,
+                              num_frames=num_frames,
+                              out=frames[start_frame:start_frame + num_frames],
+                              **task["decode_kwargs"])
+
+  num_decoded = len(decoded)
+  frames.flush()
+
+  return start_frame, num_decoded
+
+
+def decode_mp4_parallel(input_path,
+                        num_workers=None,
+                        num_segments=None,
+                        downsample_size=(96, 96),
+                        greyscale=False,
+                        interpolation=cv2.INTER_AREA,
+                        memmap_path=None):
+  """Decode all frames of a video with segments decoded in parallel.
+
+  The video is split into `num_segments` contiguous segments, aligned to
+  keyframes when `ffprobe` is available, each of which is decoded by a
+  worker process with `decode_mp4_frames` directly into its slice of a
+  frame memmap shared by the workers.
+
+  Args:
+    input_path(str): Path to the video.
+    num_workers(int): The number of worker processes, by default one per
+      CPU.
+    num_segments(int): The number of segments, by default `num_workers`.
+    downsample_size(tuple): See `decode_mp4_frames`.
+    greyscale(bool): See `decode_mp4_frames`.
+    interpolation(int): See `decode_mp4_frames`.
+    memmap_path(str): Optionally, the path of the frame memmap to return;
+      otherwise frames are decoded into a temporary file and returned in
+      memory.
+
+  Returns:
+    np.ndarray: The frames, in order; an `np.memmap` of `memmap_path` when
+      it is given.
+
+  """
+
+  num_workers = num_workers or multiprocessing.cpu_count()
+  num_segments = num_segments or num_workers
+
+  cap = cv2.VideoCapture(input_path)
+  if not cap.isOpened():
+    raise ValueError(
+        "Error opening video stream or file: {}".format(input_path))
+  num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+  width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+  height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+  cap.release()
+
+  if downsample_size is not None:
+    width, height = downsample_size
+  shape = (num_frames, height, width) + (() if greyscale else (3,))
+
+  if num_frames == 0:
+    return np.empty(shape, dtype=np.uint8)
+
+  tmpdir = None
+  if memmap_path is None:
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "frames.dat")
+  else:
+    path = memmap_path
+
+  try:
+
+    np.memmap(path, dtype=np.uint8, mode="w+", shape=shape).flush()
+
+    segments = segment_frames(num_frames,
+                              num_segments,
+                              keyframes=keyframe_indices(input_path))
+
+    tasks = [{
+        "input_path": input_path,
+        "memmap_path": path,
+        "shape": shape,
+        "segment": segment,
+        "decode_kwargs": {
+            "downsample_size": downsample_size,
+            "greyscale": greyscale,
+            "interpolation": interpolation
+        }
+    } for segment in segments]
+
+    with multiprocessing.Pool(min(num_workers, len(tasks))) as pool:
+      num_decoded = dict(pool.map(_decode_segment, tasks))
+
+    frames = np.memmap(path, dtype=np.uint8, mode="r+", shape=shape)
+
+    # The reported frame count can over-estimate, leaving segments short,
+    # in which case the decoded frames are stitched together in order.
+    if any(num_decoded[start] < n for start, n in segments):
+      end = 0
+      for start, n in segments:
+        frames[end:end + num_decoded[start]] = (frames[start:start +
+                                                       num_decoded[start]])
+        end += num_decoded[start]
+      frames.flush()
+      del frames
+      shape = (end,) + shape[1:]
+      if end == 0:
+        return np.empty(shape, dtype=np.uint8)
+      with open(path, "r+b") as f:
+        f.truncate(int(np.prod(shape)))
+      frames = np.memmap(path, dtype=np.uint8, mode="r+", shape=shape)
+
+    if memmap_path is None:
+      frames = np.array(frames)
+
+    return frames
+
+  finally:
+    if tmpdir is not None:
+      shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _read_frames(stream, video, frame_shape):
+  """Read raw uint8 frames of `frame_shape` from `stream` into `video`."""
+
+  frame = np.empty(frame_shape, dtype=np.uint8)
+  view = memoryview(frame).cast("B")
+
+  while True:
+    num_bytes = 0
+    while num_bytes < len(view):
+      num_read = stream.readinto(view[num_bytes:])
+      if not num_read:
+        break
+      num_bytes += num_read
+    if num_bytes < len(view):
+      return
+    video.insert(frame)
+
+
+def demux_mp4(input_path,
+              downsample_size=(96, 96),
+              greyscale=False,
+              audio_bitrate=44100,
+              num_channels=1,
+              memmap_path=None):
+  """Decode the frames and audio of an MP4 with a single ffmpeg process.
+
+  ffmpeg reads the file once, writing scaled raw frames to one pipe and
+  PCM audio to another, each of which is read on its own thread so that
+  neither blocks the other. Frames are resized by ffmpeg's area scaler.
+
+  Args:
+    input_path(str): Path to the video.
+    downsample_size(tuple): The (width, height) to which to resize frames,
+      or None to keep their size.
+    greyscale(bool): Whether to convert frames to greyscale.
+    audio_bitrate(int): The sample rate of the audio.
+    num_channels(int): The number of audio channels to mix to.
+    memmap_path(str): Optionally, a path at which to back the frames with
+      an `np.memmap`, see `ArrayVideo`.
+
+  Returns:
+    tuple: An `ArrayVideo` of frames and the audio as from
+      `audio_utils.read_mp4_audio`.
+
+  Raises:
+    subprocess.CalledProcessError: If ffmpeg fails, e.g. as the video has
+      no audio stream.
+
+  """
+
+  if downsample_size is None:
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+      raise ValueError(
+          "Error opening video stream or file: {}".format(input_path))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+  else:
+    if len(downsample_size) != 2:
+      raise ValueError("If downsampling expected size of len 2, saw {}".format(
+          downsample_size))
+    width, height = downsample_size
+
+  frame_shape = (height, width) + (() if greyscale else (3,))
+
+  audio_read_fd, audio_write_fd = os.pipe()
+
+  command = [
+      "ffmpeg", "-loglevel", "quiet", "-i", input_path, "-map", "0:v:0", "-vf",
+      "scale={}:{}:flags=area".format(width, height), "-pix_fmt",
+      "gray" if greyscale else "rgb24", "-f", "rawvideo", "pipe:1", "-map",
+      "0:a:0"
+  ]
+  command += audio_utils.pcm16_output_args(audio_bitrate, num_channels)
+  command += ["pipe:{}".format(audio_write_fd)]
+
+  try:
+    proc = subprocess.Popen(command,
+                            stdout=subprocess.PIPE,
+                            pass_fds=(audio_write_fd,))
+  except Exception:
+    os.close(audio_read_fd)
+    raise
+  finally:
+    # The child holds its own copy; closing ours lets the reader see EOF.
+    os.close(audio_write_fd)
+
+  video = ArrayVideo(memmap_path=memmap_path)
+  audio = {}
+
+  def _read_audio():
+    with os.fdopen(audio_read_fd, "rb") as stream:
+      audio["audio"] = audio_utils.read_pcm16(stream, num_channels=num_channels)
+
+  audio_thread = threading.Thread(target=_read_audio)
+  audio_thread.start()
+
+  try:
+    _read_frames(proc.stdout, video, frame_shape)
+  finally:
+    proc.stdout.close()
+    audio_thread.join()
+    returncode = proc.wait()
+
+  if returncode != 0:
+    raise subprocess.CalledProcessError(returncode, command)
+
+  video.trim()
+
+  return video, audio["audio"]
+
+
 class VideoFrame(object):
 
   def __init__(self, data, next_node=None, previous_node=None):
@@ -161,12 +648,182 @@ class Video(object):
       self.insert(frame)
 
 
+class ArrayVideo(object):
+  """A video whose frames are held in one contiguous (T, H, W, C) array.
+
+  A drop-in alternative to `Video` (supporting `insert`, `get_iterator`,
+  `length` and `load_from_file`) without a Python object per frame and
+  with random access: indexing and slicing return views of the frame
+  array and `gather` returns the frames at an array of indices, e.g. from
+  `AVSamplable.sample_av_pair`.
+
+  Frames are inserted into a preallocated buffer whose capacity doubles
+  when full; `trim` releases unused capacity once all frames are in. When
+  `memmap_path` is given the buffer is an `np.memmap` of that file so long
+  videos needn't fit in memory.
+
+  """
+
+  def __init__(self, initial_capacity=64, memmap_path=None, dtype=np.uint8):
+
+    if initial_capacity <= 0:
+      raise ValueError(
+          "Expected initial_capacity > 0, saw {}.".format(initial_capacity))
+
+    self.initial_capacity = initial_capacity
+    self.memmap_path = memmap_path
+    self.dtype = np.dtype(dtype)
+
+    self.length = 0
+    self._buffer = None
+
+  @classmethod
+  def from_array(cls, frames, memmap_path=None):
+    frames = np.asarray(frames)
+    video = cls(initial_capacity=max(1, len(frames)),
+                memmap_path=memmap_path,
+                dtype=frames.dtype)
+    if len(frames):
+      video._allocate(len(frames), frames.shape[1:])
+      video._buffer[:len(frames)] = frames
+      video.length = len(frames)
+    return video
+
+  @property
+  def capacity(self):
+    return 0 if self._buffer is None else len(self._buffer)
+
+  @property
+  def frame_shape(self):
+    return None if self._buffer is None else self._buffer.shape[1:]
+
+  @property
+  def frames(self):
+    """A (length, H, W, C) view of the inserted frames."""
+    if self._buffer is None:
+      return np.empty((0,), dtype=self.dtype)
+    return self._buffer[:self.length]
+
+  def _allocate(self, capacity, frame_shape):
+
+    shape = (capacity,) + tuple(frame_shape)
+
+    if self.memmap_path is None:
+      self._buffer = np.empty(shape, dtype=self.dtype)
+      return
+
+    self._buffer = np.memmap(self.memmap_path,
+                             dtype=self.dtype,
+                             mode="w+",
+                             shape=shape)
+
+  def _resize(self, capacity):
+
+    shape = (capacity,) + self.frame_shape
+
+    if self.memmap_path is None:
+      buffer = np.empty(shape, dtype=self.dtype)
+      num_frames = min(self.length, capacity)
+      buffer[:num_frames] = self._buffer[:num_frames]
+      self._buffer = buffer
+      return
+
+    # Resize the backing file in place and re-map it.
+    self._buffer.flush()
+    self._buffer = None
+    with open(self.memmap_path, "r+b") as f:
+      f.truncate(int(np.prod(shape)) * self.dtype.itemsize)
+    self._buffer = np.memmap(self.memmap_path,
+                             dtype=self.dtype,
+                             mode="r+",
+                             shape=shape)
+
+  def insert(self, data):
+
+    frame = np.asarray(data)
+
+    if self._buffer is None:
+      self._allocate(self.initial_capacity, frame.shape)
+    elif frame.shape != self.frame_shape:
+      msg = "Expected frames of shape {}, saw {}.".format(
+          self.frame_shape, frame.shape)
+      raise ValueError(msg)
+
+    if self.length == self.capacity:
+      self._resize(2 * self.capacity)
+
+    self._buffer[self.length] = frame
+    self.length += 1
+
+  def trim(self):
+    """Release capacity beyond the inserted frames."""
+    if self._buffer is not None and self.length < self.capacity:
+      self._resize(max(1, self.length))
+
+  def get_iterator(self):
+    for i in range(self.length):
+      yield self._buffer[i]
+
+  def __len__(self):
+    return self.length
+
+  def __getitem__(self, index):
+    return self.frames[index]
+
+  def gather(self, indices):
+    """The frames at `indices`, an array of frame indices, as a copy."""
+    return np.take(self.frames, np.asarray(indices), axis=0)
+
+  def load_from_file(self,
+                     input_path,
+                     downsample_size=(96, 96),
+                     greyscale=False):
+    for frame in stream_mp4(input_path,
+                            downsample_size=downsample_size,
+                            greyscale=greyscale):
+      self.insert(frame)
+    self.trim()
+
+  @classmethod
+  def from_file(cls, input_path, memmap_path=None, num_workers=1, **kwargs):
+    """An `ArrayVideo` of the frames of a video.
+
+    Frames are decoded by `decode_mp4_frames` or, when `num_workers` > 1,
+    directly into the video's buffer by `decode_mp4_parallel`.
+
+    """
+
+    if num_workers <= 1:
+      return cls.from_array(decode_mp4_frames(input_path, **kwargs),
+                            memmap_path=memmap_path)
+
+    frames = decode_mp4_parallel(input_path,
+                                 num_workers=num_workers,
+                                 memmap_path=memmap_path,
+                                 **kwargs)
+
+    video = cls(initial_capacity=max(1, len(frames)), memmap_path=memmap_path)
+    video._buffer = frames
+    video.length = len(frames)
+    return video
+
+
 class AVSamplable(object):
 
-  def __init__(self, video_length, audio_length):
+  def __init__(self, video_length, audio_length, rng=None):
+    """Samples aligned frame and audio index arrays.
+
+    Args:
+      video_length(int): The number of frames in the video.
+      audio_length(int): The number of audio samples in the video.
+      rng(np.random.RandomState): Optional source of randomness, defaults
+        to the global `np.random` state.
+
+    """
     self.length = video_length
     self.audio_length = audio_length
     self.audio_steps_per_frame = audio_length / float(video_length)
+    self.rng = rng if rng is not None else np.random
 
   def _sample_frame_indices(self, sample_length):
     max_start_index = self.length - sample_length
@@ -185,7 +842,7 @@ class AVSamplable(object):
       tf.logging.info(msg)
       return _get_frame_indices(start_index=0)
 
-    start_index = np.random.randint(0, max_start_index, 1)[0]
+    start_index = self.rng.randint(0, max_start_index, 1)[0]
     return _get_frame_indices(start_index)
 
   def _audio_given_frame_sample(self, frame_sample):
@@ -221,9 +878,9 @@ class AVSamplable(object):
       msg = "Must sample num_frames >= 0, saw {}".format(num_frames)
       raise ValueError(msg)
 
-    frame_shift = np.random.randint(0, 2 * max_frame_shift + 1)
+    frame_shift = self.rng.randint(0, 2 * max_frame_shift + 1)
 
-    frame_skip_size = np.random.randint(0, max_frame_skip + 1)
+    frame_skip_size = self.rng.randint(0, max_frame_skip + 1)
 
     meta = {
         "frame_skip_size": frame_skip_size,
@@ -248,9 +905,9 @@ class AVSamplable(object):
     frame_sample = frame_sample[:num_frames + frame_skip_size]
 
     # Sample frame indices to skip
-    skip = np.random.choice(range(len(frame_sample)),
-                            frame_skip_size,
-                            replace=False)
+    skip = self.rng.choice(range(len(frame_sample)),
+                           frame_skip_size,
+                           replace=False)
     frame_sample = np.delete(frame_sample, skip)
     assert len(frame_sample) == num_frames
 
@@ -258,3 +915,126 @@ class AVSamplable(object):
     meta["audio_sample_bounds"] = [audio_sample[0], audio_sample[-1]]
 
     return (np.asarray(frame_sample), np.asarray(audio_sample), meta)
+
+
+# The per-example metadata of `sample_av_batch`, as the meta dict of
+# `AVSamplable.sample_av_pair` plus the start of the sampled window and
+# the number of valid audio indices.
+AV_SAMPLE_META_DTYPE = np.dtype([("start_index", np.int64),
+                                 ("frame_skip_size", np.int32),
+                                 ("frame_shift", np.int32),
+                                 ("frame_sample_bounds", np.int64, (2,)),
+                                 ("audio_sample_bounds", np.int64, (2,)),
+                                 ("audio_sample_length", np.int64)])
+
+
+def sample_av_batch(video_lengths,
+                    audio_lengths,
+                    num_frames,
+                    max_frame_shift=0,
+                    max_frame_skip=0,
+                    rng=None,
+                    return_audio_indices=True):
+  """Sample aligned frame and audio indices for a batch of videos.
+
+  A vectorized `AVSamplable.sample_av_pair` over many videos at once with
+  the same sampling semantics: for each video a window of
+  `num_frames + 2 * max_frame_shift + max_frame_skip` frames is sampled,
+  frames are shifted by up to `max_frame_shift` and up to
+  `max_frame_skip` randomly chosen frames are skipped, while audio is
+  taken from the unshifted window.
+
+  Args:
+    video_lengths(np.ndarray): The number of frames of each video.
+    audio_lengths(np.ndarray): The number of audio samples of each video.
+    num_frames(int): The number of frames to sample per video.
+    max_frame_shift(int): See `AVSamplable.sample_av_pair`.
+    max_frame_skip(int): See `AVSamplable.sample_av_pair`.
+    rng(np.random.Generator or int): The source of randomness, or a seed
+      from which to create one; unseeded if None.
+    return_audio_indices(bool): Whether to return the audio index matrix.
+      Each audio sample is the contiguous range given by its
+      "audio_sample_bounds", so planners can skip building the matrix.
+
+  Returns:
+    tuple: (B, num_frames) frame indices, (B, A) audio indices padded with
+      -1 where A is the longest audio sample, or None if not
+      `return_audio_indices`, and a (B,) array of `AV_SAMPLE_META_DTYPE`
+      metadata.
+
+  """
+
+  if not isinstance(num_frames, int) or num_frames <= 0:
+    raise ValueError("Must sample num_frames >= 0, saw {}".format(num_frames))
+
+  video_lengths = np.asarray(video_lengths, dtype=np.int64)
+  audio_lengths = np.asarray(audio_lengths, dtype=np.int64)
+
+  if video_lengths.ndim != 1 or video_lengths.shape != audio_lengths.shape:
+    raise ValueError("Expected 1D video and audio lengths of equal shape, "
+                     "saw {} and {}.".format(video_lengths.shape,
+                                             audio_lengths.shape))
+
+  rng = np.random.default_rng(rng)
+  batch_size = len(video_lengths)
+
+  sample_length = num_frames + max_frame_shift * 2 + max_frame_skip
+
+  max_start_index = video_lengths - sample_length
+  if np.any(max_start_index < 0):
+    raise ValueError("Sample length greater than video len, {}, {}".format(
+        sample_length, video_lengths[max_start_index < 0]))
+
+  frame_shift = rng.integers(0, 2 * max_frame_shift + 1, batch_size)
+  frame_skip_size = rng.integers(0, max_frame_skip + 1, batch_size)
+
+  # As `AVSamplable`, start in [0, max_start_index) or at 0 when the
+  # window spans the video.
+  start_index = rng.integers(0, np.maximum(max_start_index, 1))
+
+  # Keep num_frames of the first num_frames + frame_skip_size frames after
+  # the shift: positions beyond those get the lowest keys, so dropping the
+  # max_frame_skip lowest keys drops them and frame_skip_size random others.
+  window = num_frames + max_frame_skip
+  keys = rng.random((batch_size, window))
+  keys[np.arange(window)[None, :] >= (num_frames + frame_skip_size)[:,
+                                                                    None]] = -1
+  kept = np.sort(np.argsort(keys, axis=1)[:, max_frame_skip:], axis=1)
+  frame_indices = (start_index + frame_shift)[:, None] + kept
+
+  # Audio indices, with the float arithmetic of `AVSamplable`.
+  audio_steps_per_frame = audio_lengths / video_lengths.astype(np.float64)
+  audio_start = (audio_steps_per_frame * start_index).astype(np.int64)
+  sampled_audio_length = (audio_steps_per_frame * sample_length).astype(
+      np.int64)
+  audio_offset = ((max_frame_shift * audio_steps_per_frame).astype(np.int64) +
+                  int(math.ceil(max_frame_shift / 2.0)))
+  audio_sample_length = np.clip(
+      np.minimum(sampled_audio_length - audio_offset,
+                 (audio_steps_per_frame * num_frames).astype(np.int64)), 0,
+      None)
+
+  audio_indices = None
+  if return_audio_indices:
+    width = int(audio_sample_length.max()) if batch_size else 0
+    audio_indices = np.add.outer(audio_start + audio_offset,
+                                 np.arange(width, dtype=np.int64))
+    # Only videos whose window runs out of audio are short, so pad those
+    # rows rather than masking the whole matrix.
+    for i in np.flatnonzero(audio_sample_length < width):
+      audio_indices[i, audio_sample_length[i]:] = -1
+
+  meta = np.zeros((batch_size,), dtype=AV_SAMPLE_META_DTYPE)
+  meta["start_index"] = start_index
+  meta["frame_skip_size"] = frame_skip_size
+  meta["frame_shift"] = frame_shift - max_frame_shift
+  meta["frame_sample_bounds"][:, 0] = frame_indices[:, 0]
+  meta["frame_sample_bounds"][:, 1] = frame_indices[:, -1]
+  has_audio = audio_sample_length > 0
+  meta["audio_sample_bounds"][:, 0] = np.where(has_audio,
+                                               audio_start + audio_offset, -1)
+  meta["audio_sample_bounds"][:, 1] = np.where(
+      has_audio, audio_start + audio_offset + audio_sample_length - 1, -1)
+  meta["audio_sample_length"] = audio_sample_length
+
+  return frame_indices, audio_indices, meta
@@ -11,11 +11,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
 import tensorflow as tf
 
+from clarify.utils import audio_utils
+from clarify.utils import audio_utils_test
 from clarify.utils import video_utils
 
 
+def _write_synthetic_mp4(path, num_frames=40, size=(64, 48), step=6):
+  """Write an MP4 whose `i`th frame has every pixel equal to `i * step` mod 256."""
+  writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25, size)
+  for i in range(num_frames):
+    writer.write(
+        np.full((size[1], size[0], 3), (i * step) % 256, dtype=np.uint8))
+  writer.release()
+  return path
+
+
+def _frame_ids(frames, step=6):
+  return [int(round(np.mean(frame) / step)) for frame in frames]
+
+
 class TestVideoUtils(tf.test.TestCase):
 
   def test_av_samplable_combined(self):
@@ -66,6 +89,355 @@ class TestVideoUtils(tf.test.TestCase):
             self.assertEqual(len(f_), (len(f)))
             #self.assertEqual(len(a_), len(a))
 
+  def test_array_video(self):
+
+    frames = np.random.randint(0, 255, (11, 4, 5, 3)).astype(np.uint8)
+
+    video = video_utils.ArrayVideo(initial_capacity=2)
+    for frame in frames:
+      video.insert(frame)
+
+    # Capacity doubled as frames were inserted and is trimmed after.
+    self.assertEqual(video.length, 11)
+    self.assertEqual(video.capacity, 16)
+    video.trim()
+    self.assertEqual(video.capacity, 11)
+
+    self.assertAllEqual(np.stack(list(video.get_iterator())), frames)
+    self.assertAllEqual(video[2:5], frames[2:5])
+    self.assertTrue(np.shares_memory(video[2:5], video.frames))
+
+    indices = np.array([3, 3, 0, 10])
+    self.assertAllEqual(video.gather(indices), frames[indices])
+
+    with self.assertRaises(ValueError):
+      video.insert(np.zeros((4, 4, 3), dtype=np.uint8))
+
+    self.assertAllEqual(
+        video_utils.ArrayVideo.from_array(frames).frames, frames)
+
+  def test_memmap_array_video(self):
+
+    frames = np.random.randint(0, 255, (9, 4, 4, 1)).astype(np.uint8)
+    path = os.path.join(tempfile.mkdtemp(), "frames.dat")
+
+    video = video_utils.ArrayVideo(initial_capacity=4, memmap_path=path)
+    for frame in frames:
+      video.insert(frame)
+    video.trim()
+
+    self.assertTrue(isinstance(video.frames, np.memmap))
+    self.assertEqual(os.path.getsize(path), frames.nbytes)
+    self.assertAllEqual(video.frames, frames)
+
+  def test_decode_mp4_frames(self):
+
+    path = _write_synthetic_mp4(os.path.join(tempfile.mkdtemp(), "v.mp4"))
+
+    frames = video_utils.decode_mp4_frames(path, downsample_size=(16, 12))
+    self.assertEqual(frames.shape, (40, 12, 16, 3))
+    self.assertEqual(frames.dtype, np.uint8)
+    self.assertAllEqual(
+        frames.shape,
+        np.asarray(list(video_utils.stream_mp4(path,
+                                               downsample_size=(16,
+                                                                12)))).shape)
+
+    # A strided window from a seeked start frame.
+    frames = video_utils.decode_mp4_frames(path,
+                                           downsample_size=(16, 12),
+                                           start_frame=10,
+                                           num_frames=8,
+                                           stride=3)
+    self.assertEqual(len(frames), 8)
+    for actual, expected in zip(_frame_ids(frames), range(10, 34, 3)):
+      self.assertTrue(abs(actual - expected) <= 1)
+
+    # Decoding stops at the end of the video.
+    frames = video_utils.decode_mp4_frames(path, start_frame=30, stride=4)
+    self.assertEqual(frames.shape, (3, 96, 96, 3))
+
+    out = np.zeros((4, 12, 16), dtype=np.uint8)
+    frames = video_utils.decode_mp4_frames(path,
+                                           downsample_size=(16, 12),
+                                           greyscale=True,
+                                           num_frames=4,
+                                           out=out)
+    self.assertTrue(np.shares_memory(frames, out))
+
+    with self.assertRaises(ValueError):
+      video_utils.decode_mp4_frames(path, num_frames=4, out=out)
+
+    video = video_utils.ArrayVideo.from_file(path, num_frames=5)
+    self.assertEqual(len(video), 5)
+
+  def test_segment_frames(self):
+
+    self.assertEqual(video_utils.segment_frames(10, 3), [(0, 3), (3, 3),
+                                                         (6, 4)])
+
+    # Boundaries move back to keyframes, merging segments if need be.
+    self.assertEqual(
+        video_utils.segment_frames(100, 4, keyframes=[0, 20, 40, 45, 90]),
+        [(0, 20), (20, 25), (45, 55)])
+
+    self.assertEqual(video_utils.segment_frames(2, 4), [(0, 1), (1, 1)])
+
+  def test_decode_mp4_parallel(self):
+
+    tmpdir = tempfile.mkdtemp()
+    path = _write_synthetic_mp4(os.path.join(tmpdir, "v.mp4"))
+
+    expected = video_utils.decode_mp4_frames(path, downsample_size=(16, 12))
+
+    frames = video_utils.decode_mp4_parallel(path,
+                                             num_workers=3,
+                                             num_segments=5,
+                                             downsample_size=(16, 12))
+    self.assertAllEqual(frames, expected)
+
+    video = video_utils.ArrayVideo.from_file(path,
+                                             num_workers=2,
+                                             memmap_path=os.path.join(
+                                                 tmpdir, "frames.dat"),
+                                             downsample_size=(16, 12))
+    self.assertTrue(isinstance(video.frames, np.memmap))
+    self.assertAllEqual(video.frames, expected)
+
+  def test_resize_frames(self):
+
+    frames = np.random.randint(0, 255, (5, 8, 12, 3)).astype(np.uint8)
+
+    # An integer factor area resize is the mean of each block.
+    expected = frames.reshape(5, 4, 2, 6, 2,
+                              3).astype(np.float32).mean(axis=(2, 4))
+
+    resized = video_utils.resize_frames(frames, (4, 6), dtype=np.float32)
+    self.assertEqual(resized.dtype, np.float32)
+    self.assertAllClose(resized, expected, atol=1e-4)
+
+    resized = video_utils.resize_frames(frames, (4, 6))
+    self.assertEqual(resized.dtype, np.uint8)
+    self.assertTrue(np.max(np.abs(resized - expected)) <= 0.5 + 1e-4)
+
+    out = np.zeros((5, 4, 4, 1), dtype=np.uint8)
+    resized = video_utils.resize_frames(frames[..., :1], 4, out=out)
+    self.assertTrue(resized is out)
+    expected = frames[..., :1].reshape(5, 4, 2, 4, 3,
+                                       1).astype(np.float32).mean(axis=(2, 4))
+    self.assertTrue(np.max(np.abs(out - expected)) <= 0.5 + 1e-4)
+
+    with self.assertRaises(ValueError):
+      video_utils.resize_frames(frames, 4, out=out)
+
+    self.assertEqual(
+        np.asarray(video_utils.resize_video(frames, 4)).shape, (5, 4, 4, 3))
+
+  def test_demux_mp4(self):
+
+    if shutil.which("ffmpeg") is None:
+      self.skipTest("Requires ffmpeg.")
+
+    path = audio_utils_test.write_synthetic_av_mp4(
+        os.path.join(tempfile.mkdtemp(), "v.mp4"))
+
+    video, audio = video_utils.demux_mp4(path, downsample_size=(16, 12))
+
+    self.assertEqual(video.frames.shape, (25, 12, 16, 3))
+    self.assertAllClose(audio, audio_utils.read_mp4_audio(path))
+
+  def test_sample_av_batch(self):
+
+    rng = np.random.RandomState(0)
+    video_lengths = rng.randint(30, 200, 500)
+    audio_lengths = video_lengths * rng.randint(100, 2000, 500)
+    num_frames, max_frame_shift, max_frame_skip = 8, 3, 4
+
+    frames, audio, meta = video_utils.sample_av_batch(
+        video_lengths,
+        audio_lengths,
+        num_frames=num_frames,
+        max_frame_shift=max_frame_shift,
+        max_frame_skip=max_frame_skip,
+        rng=1)
+
+    self.assertEqual(frames.shape, (500, num_frames))
+    self.assertEqual(audio.shape[0], 500)
+
+    sample_length = num_frames + 2 * max_frame_shift + max_frame_skip
+
+    for i in range(500):
+
+      start = meta["start_index"][i]
+      shift = meta["frame_shift"][i] + max_frame_shift
+      skip = meta["frame_skip_size"][i]
+
+      self.assertTrue(0 <= start < video_lengths[i] - sample_length)
+      self.assertTrue(0 <= shift <= 2 * max_frame_shift)
+      self.assertTrue(0 <= skip <= max_frame_skip)
+
+      # Frames are num_frames of the skip + num_frames after the shift.
+      self.assertTrue(np.all(np.diff(frames[i]) > 0))
+      self.assertTrue(frames[i][0] >= start + shift)
+      self.assertTrue(frames[i][-1] < start + shift + num_frames + skip)
+      self.assertAllEqual(meta["frame_sample_bounds"][i],
+                          [frames[i][0], frames[i][-1]])
+
+      # Audio matches that of `AVSamplable` for the same window.
+      avs = video_utils.AVSamplable(video_length=video_lengths[i],
+                                    audio_length=audio_lengths[i])
+      expected = avs._audio_given_frame_sample(
+          list(range(start, start + sample_length)))
+      expected = expected[int(max_frame_shift * avs.audio_steps_per_frame) + 2:]
+      expected = expected[:int(avs.audio_steps_per_frame * num_frames)]
+      length = meta["audio_sample_length"][i]
+      self.assertAllEqual(audio[i][:length], expected)
+      self.assertTrue(np.all(audio[i][length:] == -1))
+      self.assertAllEqual(meta["audio_sample_bounds"][i],
+                          [expected[0], expected[-1]])
+
+    # Samples are reproducible given a seed.
+    frames_, audio_, meta_ = video_utils.sample_av_batch(
+        video_lengths,
+        audio_lengths,
+        num_frames=num_frames,
+        max_frame_shift=max_frame_shift,
+        max_frame_skip=max_frame_skip,
+        rng=np.random.default_rng(1))
+    self.assertAllEqual(frames, frames_)
+    self.assertAllEqual(audio, audio_)
+    self.assertTrue(np.array_equal(meta, meta_))
+
+    _, audio_, _ = video_utils.sample_av_batch(video_lengths,
+                                               audio_lengths,
+                                               num_frames=num_frames,
+                                               rng=1,
+                                               return_audio_indices=False)
+    self.assertTrue(audio_ is None)
+
+    with self.assertRaises(ValueError):
+      video_utils.sample_av_batch([10], [1000], num_frames=11)
+
+    # A window spanning the video starts at its first frame.
+    frames, _, _ = video_utils.sample_av_batch([8], [800], num_frames=8)
+    self.assertAllEqual(frames[0], np.arange(8))
+
+
+class VideoUtilsBenchmark(tf.test.Benchmark):
+
+  def benchmark_decode_window(self, num_frames=32, stride=2):
+    """Compare decoding a strided window with streaming the whole video."""
+
+    path = _write_synthetic_mp4(os.path.join(tempfile.mkdtemp(), "v.mp4"),
+                                num_frames=300,
+                                size=(320, 240))
+
+    start = time.time()
+    frames = list(video_utils.stream_mp4(path))
+    frames = frames[100:100 + num_frames * stride:stride]
+    stream_secs = time.time() - start
+
+    start = time.time()
+    video_utils.decode_mp4_frames(path,
+                                  start_frame=100,
+                                  num_frames=num_frames,
+                                  stride=stride)
+    window_secs = time.time() - start
+
+    self.report_benchmark(name="decode_window",
+                          iters=1,
+                          wall_time=window_secs,
+                          extras={
+                              "stream_secs": stream_secs,
+                              "window_secs": window_secs
+                          })
+
+  def benchmark_decode_parallel(self, num_workers=4):
+    """Report frames/sec decoding serially and in parallel."""
+
+    path = _write_synthetic_mp4(os.path.join(tempfile.mkdtemp(), "v.mp4"),
+                                num_frames=600,
+                                size=(640, 480))
+
+    start = time.time()
+    num_frames = len(list(video_utils.stream_mp4(path)))
+    stream_fps = num_frames / (time.time() - start)
+
+    start = time.time()
+    num_frames = len(video_utils.decode_mp4_frames(path))
+    serial_fps = num_frames / (time.time() - start)
+
+    start = time.time()
+    num_frames = len(
+        video_utils.decode_mp4_parallel(path, num_workers=num_workers))
+    parallel_secs = time.time() - start
+
+    self.report_benchmark(name="decode_parallel",
+                          iters=num_frames,
+                          wall_time=parallel_secs,
+                          extras={
+                              "stream_fps": stream_fps,
+                              "serial_fps": serial_fps,
+                              "parallel_fps": num_frames / parallel_secs,
+                              "num_workers": num_workers
+                          })
+
+  def benchmark_resize_frames(self, num_frames=300):
+    """Report frames/sec resizing a batch of 480x640 frames to 96x96."""
+
+    frames = np.random.randint(0, 255,
+                               (num_frames, 480, 640, 3)).astype(np.uint8)
+    out = np.empty((num_frames, 96, 96, 3), dtype=np.float32)
+
+    start = time.time()
+    video_utils.resize_frames(frames, 96, dtype=np.float32, out=out)
+    secs = time.time() - start
+
+    self.report_benchmark(name="resize_frames",
+                          iters=num_frames,
+                          wall_time=secs,
+                          extras={"frames_per_sec": num_frames / secs})
+
+  def benchmark_sample_av_batch(self, batch_size=1000):
+    """Compare batched sampling with sampling one pair at a time."""
+
+    rng = np.random.RandomState(0)
+    video_lengths = rng.randint(100, 1000, batch_size)
+    audio_lengths = video_lengths * 1600
+
+    start = time.time()
+    for video_length, audio_length in zip(video_lengths, audio_lengths):
+      video_utils.AVSamplable(video_length=video_length,
+                              audio_length=audio_length,
+                              rng=rng).sample_av_pair(num_frames=16,
+                                                      max_frame_shift=2,
+                                                      max_frame_skip=2)
+    pair_secs = time.time() - start
+
+    batch_secs = {}
+    for return_audio_indices in [True, False]:
+      start = time.time()
+      video_utils.sample_av_batch(video_lengths,
+                                  audio_lengths,
+                                  num_frames=16,
+                                  max_frame_shift=2,
+                                  max_frame_skip=2,
+                                  rng=0,
+                                  return_audio_indices=return_audio_indices)
+      batch_secs[return_audio_indices] = time.time() - start
+
+    self.report_benchmark(
+        name="sample_av_batch",
+        iters=batch_size,
+        wall_time=batch_secs[True],
+        extras={
+            "pair_secs": pair_secs,
+            "batch_secs": batch_secs[True],
+            "batch_bounds_only_secs": batch_secs[False],
+            "speedup": pair_secs / batch_secs[True],
+            "bounds_only_speedup": pair_secs / batch_secs[False]
+        })
+
 
 if __name__ == "__main__":
   tf.test.main()